@@ -17,18 +17,23 @@
 import functools
 import re
 
+from oslo.config import cfg
+
 from nova import availability_zones
 from nova import context
 from nova import db
 from nova import exception
+from nova import memorycache
 from nova.network import model as network_model
 from nova.objects import instance as instance_obj
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
-from nova.openstack.common import memorycache
 from nova.openstack.common import timeutils
 from nova.openstack.common import uuidutils
 
+CONF = cfg.CONF
+CONF.import_opt('memorycache_max_entries', 'nova.memorycache')
+
 LOG = logging.getLogger(__name__)
 # NOTE(vish): cache mapping for one week
 _CACHE_TIME = 7 * 24 * 60 * 60
@@ -40,7 +45,8 @@ def memoize(func):
     def memoizer(context, reqid):
         global _CACHE
         if not _CACHE:
-            _CACHE = memorycache.get_client()
+            _CACHE = memorycache.get_client(
+                max_entries=CONF.memorycache_max_entries)
         key = "%s:%s" % (func.__name__, reqid)
         key = str(key)
         value = _CACHE.get(key)
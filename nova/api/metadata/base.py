@@ -17,6 +17,7 @@
 """Instance Metadata information."""
 
 import base64
+import copy
 import json
 import os
 import posixpath
@@ -36,6 +37,7 @@ from nova.objects import instance as instance_obj
 from nova.objects import security_group as secgroup_obj
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
+from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
 from nova import utils
@@ -193,6 +195,23 @@ class InstanceMetadata():
 
         self.route_configuration = None
 
+        # rendered metadata trees and documents, see prerender()
+        self._ec2_metadata = {}
+        self._openstack_metadata = None
+        self._vendor_data_json = None
+
+    def prerender(self):
+        """Render every metadata version ahead of time.
+
+        The rendered trees are kept on this object, so that an
+        InstanceMetadata fetched from the cache answers requests without
+        walking the instance again.
+        """
+        for version in VERSIONS:
+            self._get_ec2_metadata(version)
+        self._get_openstack_metadata()
+        self._get_vendor_data_json()
+
     def _route_configuration(self):
         if self.route_configuration:
             return self.route_configuration
@@ -208,12 +227,20 @@ class InstanceMetadata():
         return self.route_configuration
 
     def get_ec2_metadata(self, version):
+        return copy.deepcopy(self._get_ec2_metadata(version))
+
+    def _get_ec2_metadata(self, version):
         if version == "latest":
             version = VERSIONS[-1]
 
         if version not in VERSIONS:
             raise InvalidMetadataVersion(version)
 
+        if version not in self._ec2_metadata:
+            self._ec2_metadata[version] = self._render_ec2_metadata(version)
+        return self._ec2_metadata[version]
+
+    def _render_ec2_metadata(self, version):
         hostname = self._get_hostname()
 
         floating_ips = self.ip_info['floating_ips']
@@ -287,7 +314,7 @@ class InstanceMetadata():
 
     def get_ec2_item(self, path_tokens):
         # get_ec2_metadata returns dict without top level version
-        data = self.get_ec2_metadata(path_tokens[0])
+        data = self._get_ec2_metadata(path_tokens[0])
         return find_path_in_tree(data, path_tokens[1:])
 
     def get_openstack_item(self, path_tokens):
@@ -296,6 +323,20 @@ class InstanceMetadata():
         return self._route_configuration().handle_path(path_tokens)
 
     def _metadata_as_json(self, version, path):
+        metadata = self._get_openstack_metadata()
+        if self._check_os_version(GRIZZLY, version):
+            # NOTE: the random seed has to differ between requests, so it
+            # is added to a copy of the metadata instead of being cached.
+            metadata = dict(metadata)
+            metadata['random_seed'] = base64.b64encode(os.urandom(512))
+        return jsonutils.dumps(metadata)
+
+    def _get_openstack_metadata(self):
+        if self._openstack_metadata is None:
+            self._openstack_metadata = self._render_openstack_metadata()
+        return self._openstack_metadata
+
+    def _render_openstack_metadata(self):
         metadata = {'uuid': self.uuid}
         if self.launch_metadata:
             metadata['meta'] = self.launch_metadata
@@ -314,10 +355,7 @@ class InstanceMetadata():
         metadata['launch_index'] = self.instance['launch_index']
         metadata['availability_zone'] = self.availability_zone
 
-        if self._check_os_version(GRIZZLY, version):
-            metadata['random_seed'] = base64.b64encode(os.urandom(512))
-
-        return json.dumps(metadata)
+        return metadata
 
     def _handle_content(self, path_tokens):
         if len(path_tokens) == 1:
@@ -350,9 +388,14 @@ class InstanceMetadata():
 
     def _vendor_data(self, version, path):
         if self._check_os_version(HAVANA, version):
-            return json.dumps(self.vddriver.get())
+            return self._get_vendor_data_json()
         raise KeyError(path)
 
+    def _get_vendor_data_json(self):
+        if self._vendor_data_json is None:
+            self._vendor_data_json = json.dumps(self.vddriver.get())
+        return self._vendor_data_json
+
     def _check_version(self, required, requested, versions=VERSIONS):
         return versions.index(requested) >= versions.index(required)
 
@@ -490,12 +533,18 @@ class VendorDataDriver(object):
         return self._data
 
 
+def get_instance_uuid_by_address(address, ctxt=None):
+    ctxt = ctxt or context.get_admin_context()
+    fixed_ip = network.API().get_fixed_ip_by_address(ctxt, address)
+    return fixed_ip['instance_uuid']
+
+
 def get_metadata_by_address(conductor_api, address):
     ctxt = context.get_admin_context()
-    fixed_ip = network.API().get_fixed_ip_by_address(ctxt, address)
+    instance_uuid = get_instance_uuid_by_address(address, ctxt)
 
     return get_metadata_by_instance_id(conductor_api,
-                                       fixed_ip['instance_uuid'],
+                                       instance_uuid,
                                        address,
                                        ctxt)
 
@@ -507,6 +556,28 @@ def get_metadata_by_instance_id(conductor_api, instance_id, address,
     return InstanceMetadata(instance, address)
 
 
+def get_metadata_by_host(conductor_api, host):
+    """Yields (address, InstanceMetadata) for the instances on a host.
+
+    The instances are loaded with a single query and their network info is
+    taken from the info cache, which makes this suitable for filling a
+    metadata cache in bulk.
+    """
+    ctxt = context.get_admin_context()
+    instances = instance_obj.InstanceList.get_by_host(
+        ctxt, host, expected_attrs=['metadata', 'system_metadata',
+                                    'info_cache'])
+    for instance in instances:
+        if not instance.info_cache or not instance.info_cache.network_info:
+            continue
+        network_info = instance.info_cache.network_info
+        for fixed_ip in network_info.fixed_ips():
+            address = fixed_ip['address']
+            yield (address, InstanceMetadata(instance, address,
+                                             conductor_api=conductor_api,
+                                             network_info=network_info))
+
+
 def _format_instance_mapping(ctxt, instance):
     bdms = block_device_obj.BlockDeviceMappingList.get_by_instance_uuid(
             ctxt, instance.uuid)
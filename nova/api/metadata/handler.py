@@ -18,8 +18,10 @@
 import hashlib
 import hmac
 import os
+import uuid
 
 from oslo.config import cfg
+from oslo import messaging
 import six
 import webob.dec
 import webob.exc
@@ -27,13 +29,12 @@ import webob.exc
 from nova.api.metadata import base
 from nova import conductor
 from nova import exception
+from nova import memorycache
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
-from nova.openstack.common import memorycache
+from nova import rpc
 from nova import wsgi
 
-CACHE_EXPIRATION = 15  # in seconds
-
 CONF = cfg.CONF
 CONF.import_opt('use_forwarded_for', 'nova.api.auth')
 
@@ -49,41 +50,184 @@ metadata_proxy_opts = [
          help='Shared secret to validate proxies Neutron metadata requests')
 ]
 
+metadata_cache_opts = [
+    cfg.IntOpt('metadata_cache_expiration',
+               default=15,
+               help='Time in seconds to cache metadata. When notifications '
+                    'invalidate the cached metadata, this only applies to '
+                    'the mapping of fixed ips to instances.'),
+    cfg.StrOpt('metadata_cache_notification_topic',
+               help='Notification topic to listen on for instance and '
+                    'network changes that invalidate cached metadata, and '
+                    'for compute hosts being enabled, whose instances are '
+                    'then rendered ahead of time. The topic has to be added '
+                    'to notification_topics. This requires '
+                    'memcached_servers, so that all the metadata workers '
+                    'share the cache the notifications invalidate.'),
+    cfg.IntOpt('metadata_cache_notification_expiration',
+               default=600,
+               help='Time in seconds to cache metadata when notifications '
+                    'invalidate it, in case some notifications are lost.'),
+    cfg.IntOpt('metadata_cache_max_entries',
+               default=10000,
+               help='Maximum number of keys kept by the in process metadata '
+                    'cache, used when memcached_servers is not set.'),
+]
+
 CONF.register_opts(metadata_proxy_opts)
+CONF.register_opts(metadata_cache_opts)
+CONF.import_opt('memcached_servers', 'nova.openstack.common.memorycache')
 
 LOG = logging.getLogger(__name__)
 
 
+class MetadataCacheEndpoint(object):
+    """Keeps the metadata cache up to date from notifications."""
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def info(self, ctxt, publisher_id, event_type, payload, metadata=None):
+        if not isinstance(payload, dict):
+            return
+        if event_type.startswith(('compute.instance.', 'network.')):
+            instance_id = payload.get('instance_id')
+            if instance_id:
+                self.handler.invalidate(instance_id)
+        elif event_type == 'HostAPI.set_enabled.end':
+            if payload.get('enabled'):
+                self.handler.warm_up(payload['host_name'])
+
+
 class MetadataRequestHandler(wsgi.Application):
     """Serve metadata."""
 
     def __init__(self):
-        self._cache = memorycache.get_client()
+        self._cache = memorycache.get_client(
+            max_entries=CONF.metadata_cache_max_entries)
         self.conductor_api = conductor.API()
+        self._listener = None
+        self._listener_pid = None
+        if (CONF.metadata_cache_notification_topic and
+                not CONF.memcached_servers):
+            LOG.warn(_('metadata_cache_notification_topic is ignored, it '
+                       'requires memcached_servers to be set.'))
+
+    def _notifications_enabled(self):
+        # NOTE: Each worker has its own in process cache, while a
+        # notification only reaches one of the workers listening on the
+        # topic, so notifications need a cache shared by all the workers.
+        return bool(CONF.metadata_cache_notification_topic and
+                    CONF.memcached_servers)
+
+    def _start_listener(self):
+        """Start listening for notifications in this process, if needed.
+
+        The application is loaded before the metadata workers are forked,
+        so each worker starts its listener when it serves its first
+        request.
+        """
+        if not self._notifications_enabled():
+            return
+        if self._listener_pid == os.getpid():
+            return
+        target = messaging.Target(
+            topic=CONF.metadata_cache_notification_topic)
+        self._listener = rpc.get_notification_listener(
+            [target], [MetadataCacheEndpoint(self)])
+        self._listener.start()
+        self._listener_pid = os.getpid()
+
+    def _metadata_expiration(self):
+        if self._notifications_enabled():
+            return CONF.metadata_cache_notification_expiration
+        return CONF.metadata_cache_expiration
+
+    def _get_generation(self, instance_id):
+        """Return the generation of the cached metadata of an instance.
+
+        The metadata is cached with one key per address, and these keys
+        and the address mappings include the generation, so that
+        invalidate() drops all of them by dropping a single key.
+        """
+        generation_key = 'metadata-generation-%s' % instance_id
+        generation = self._cache.get(generation_key)
+        if generation is None:
+            self._cache.add(generation_key, uuid.uuid4().hex,
+                            self._metadata_expiration())
+            generation = self._cache.get(generation_key)
+        return generation
+
+    def _cache_metadata(self, instance_id, generation, address, data):
+        """Pre-render and cache metadata for the given address."""
+        if generation is None:
+            return
+        data.prerender()
+        self._cache.set('metadata-%s-%s-%s' % (instance_id, generation,
+                                               address),
+                        data, self._metadata_expiration())
+        if address:
+            self._cache.set('metadata-address-%s' % address,
+                            (instance_id, generation),
+                            CONF.metadata_cache_expiration)
+
+    def invalidate(self, instance_id):
+        """Drop the cached metadata of an instance."""
+        self._cache.delete('metadata-generation-%s' % instance_id)
+
+    def warm_up(self, host):
+        """Render and cache the metadata of all instances on a host."""
+        entries = {}
+        try:
+            for address, data in base.get_metadata_by_host(
+                    self.conductor_api, host):
+                entries.setdefault(data.uuid, []).append((address, data))
+        except Exception:
+            LOG.exception(_('Failed to warm up metadata for host: %s'), host)
+            return
+
+        for instance_id, instance_entries in entries.iteritems():
+            self.invalidate(instance_id)
+            generation = self._get_generation(instance_id)
+            for address, data in instance_entries:
+                self._cache_metadata(instance_id, generation, address, data)
+        LOG.debug(_('Cached metadata of %(count)d instances on %(host)s'),
+                  {'count': len(entries), 'host': host})
 
     def get_metadata_by_remote_address(self, address):
         if not address:
             raise exception.FixedIpNotFoundForAddress(address=address)
 
-        cache_key = 'metadata-%s' % address
-        data = self._cache.get(cache_key)
-        if data:
-            return data
-
-        try:
-            data = base.get_metadata_by_address(self.conductor_api, address)
-        except exception.NotFound:
-            return None
-
-        self._cache.set(cache_key, data, CACHE_EXPIRATION)
-
-        return data
+        address_key = 'metadata-address-%s' % address
+        cached = self._cache.get(address_key)
+        if cached is not None:
+            instance_id, generation = cached
+            if generation != self._cache.get(
+                    'metadata-generation-%s' % instance_id):
+                cached = None
+        if cached is None:
+            try:
+                instance_id = base.get_instance_uuid_by_address(address)
+            except exception.NotFound:
+                return None
+            generation = self._get_generation(instance_id)
+            if generation is not None:
+                self._cache.set(address_key, (instance_id, generation),
+                                CONF.metadata_cache_expiration)
+
+        return self._get_metadata(instance_id, generation, address)
 
     def get_metadata_by_instance_id(self, instance_id, address):
-        cache_key = 'metadata-%s' % instance_id
-        data = self._cache.get(cache_key)
-        if data:
-            return data
+        return self._get_metadata(instance_id,
+                                  self._get_generation(instance_id), address)
+
+    def _get_metadata(self, instance_id, generation, address):
+        if generation is not None:
+            data = self._cache.get('metadata-%s-%s-%s' % (instance_id,
+                                                          generation,
+                                                          address))
+            if data is not None:
+                return data
 
         try:
             data = base.get_metadata_by_instance_id(self.conductor_api,
@@ -91,12 +235,13 @@ class MetadataRequestHandler(wsgi.Application):
         except exception.NotFound:
             return None
 
-        self._cache.set(cache_key, data, CACHE_EXPIRATION)
+        self._cache_metadata(instance_id, generation, address, data)
 
         return data
 
     @webob.dec.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
+        self._start_listener()
         if os.path.normpath(req.path_info) == "/":
             return(base.ec2_md_print(base.VERSIONS + ["latest"]))
 
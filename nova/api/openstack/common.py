@@ -14,7 +14,6 @@
 #    under the License.
 
 import functools
-import itertools
 import os
 import re
 
@@ -340,20 +339,7 @@ def dict_to_query_str(params):
 
 
 def get_networks_for_instance_from_nw_info(nw_info):
-    networks = {}
-    for vif in nw_info:
-        ips = vif.fixed_ips()
-        floaters = vif.floating_ips()
-        label = vif['network']['label']
-        if label not in networks:
-            networks[label] = {'ips': [], 'floating_ips': []}
-
-        networks[label]['ips'].extend(ips)
-        networks[label]['floating_ips'].extend(floaters)
-        for ip in itertools.chain(networks[label]['ips'],
-                                  networks[label]['floating_ips']):
-            ip['mac_address'] = vif['address']
-    return networks
+    return nw_info.addresses()
 
 
 def get_networks_for_instance(context, instance):
@@ -374,7 +360,13 @@ def get_networks_for_instance(context, instance):
                                       'version': 4,
                                       'mac_address': 'aa:aa:aa:aa:aa:aa'}]},
          ...}
+
+    The addresses computed when the info cache was last written are used
+    when present, the network info is only walked for older caches.
     """
+    networks = compute_utils.get_addresses_for_instance(instance)
+    if networks is not None:
+        return networks
     nw_info = compute_utils.get_nw_info_for_instance(instance)
     return get_networks_for_instance_from_nw_info(nw_info)
 
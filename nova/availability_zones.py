@@ -18,7 +18,7 @@
 from oslo.config import cfg
 
 from nova import db
-from nova.openstack.common import memorycache
+from nova import memorycache
 
 # NOTE(vish): azs don't change that often, so cache them for an hour to
 #             avoid hitting the db multiple times on every request.
@@ -36,13 +36,15 @@ availability_zone_opts = [
 
 CONF = cfg.CONF
 CONF.register_opts(availability_zone_opts)
+CONF.import_opt('memorycache_max_entries', 'nova.memorycache')
 
 
 def _get_cache():
     global MC
 
     if MC is None:
-        MC = memorycache.get_client()
+        MC = memorycache.get_client(
+            max_entries=CONF.memorycache_max_entries)
 
     return MC
 
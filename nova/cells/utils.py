@@ -42,11 +42,17 @@ def get_instances_to_sync(context, updated_since=None, project_id=None,
         filters['project_id'] = project_id
     if not deleted:
         filters['deleted'] = False
+    kwargs = {}
+    if uuids_only:
+        kwargs = {'columns': ['uuid'], 'columns_to_join': []}
     # Active instances first.
-    instances = db.instance_get_all_by_filters(
-            context, filters, 'deleted', 'asc')
     if shuffle:
+        instances = db.instance_get_all_by_filters(
+                context, filters, 'deleted', 'asc', **kwargs)
         random.shuffle(instances)
+    else:
+        instances = db.instance_get_all_by_filters_chunked(
+                context, filters, 'deleted', 'asc', **kwargs)
     for instance in instances:
         if uuids_only:
             yield instance['uuid']
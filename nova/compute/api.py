@@ -70,6 +70,7 @@ from nova.openstack.common import uuidutils
 import nova.policy
 from nova import quota
 from nova import rpc
+from nova.scheduler import rpcapi as scheduler_rpcapi
 from nova import servicegroup
 from nova import utils
 from nova import volume
@@ -560,6 +561,14 @@ class API(base.Base):
         }
 
     def _apply_instance_name_template(self, context, instance, index):
+        self._populate_instance_name_from_template(instance, index)
+        instance.save()
+        return instance
+
+    def _populate_instance_name_from_template(self, instance, index):
+        """Populate instance display_name and hostname using the
+        multi_instance_display_name_template.
+        """
         params = {
             'uuid': instance['uuid'],
             'name': instance['display_name'],
@@ -575,8 +584,6 @@ class API(base.Base):
         instance.display_name = new_name
         if not instance.get('hostname', None):
             instance.hostname = utils.sanitize_hostname(new_name)
-        instance.save()
-        return instance
 
     def _check_config_drive(self, config_drive):
         if config_drive:
@@ -811,15 +818,20 @@ class API(base.Base):
         LOG.debug(_("Going to run %s instances...") % num_instances)
         instances = []
         try:
-            for i in xrange(num_instances):
+            if num_instances > 1:
+                instances = self._create_db_entries_for_new_instances(
+                        context, instance_type, boot_meta, base_options,
+                        security_groups, block_device_mapping, num_instances)
+            else:
                 instance = instance_obj.Instance()
                 instance.update(base_options)
                 instance = self.create_db_entry_for_new_instance(
                         context, instance_type, boot_meta, instance,
                         security_groups, block_device_mapping,
-                        num_instances, i)
-
+                        num_instances, 0)
                 instances.append(instance)
+
+            for instance in instances:
                 # send a state update notification for the initial create to
                 # show it going from non-existent to BUILDING
                 notifications.send_update_with_states(context, instance, None,
@@ -1036,16 +1048,26 @@ class API(base.Base):
         """
         LOG.debug(_("block_device_mapping %s"), block_device_mapping,
                   instance_uuid=instance_uuid)
+        for bdm in self._get_block_device_mapping_values(
+                instance_type, instance_uuid, block_device_mapping):
+            self.db.block_device_mapping_update_or_create(elevated_context,
+                                                          bdm,
+                                                          legacy=False)
+
+    def _get_block_device_mapping_values(self, instance_type, instance_uuid,
+                                         block_device_mapping):
+        """Return the values of the block device mappings to create for an
+        instance, leaving out the ones without a size.
+        """
+        values = []
         for bdm in block_device_mapping:
             bdm['volume_size'] = self._volume_size(instance_type, bdm)
             if bdm.get('volume_size') == 0:
                 continue
 
             bdm['instance_uuid'] = instance_uuid
-
-            self.db.block_device_mapping_update_or_create(elevated_context,
-                                                          bdm,
-                                                          legacy=False)
+            values.append(dict(bdm))
+        return values
 
     def _validate_bdm(self, context, instance, instance_type, all_mappings):
         def _subsequent_list(l):
@@ -1244,6 +1266,53 @@ class API(base.Base):
 
         return instance
 
+    def _create_db_entries_for_new_instances(self, context, instance_type,
+            image, base_options, security_groups, block_device_mapping,
+            num_instances):
+        """Create the DB entries for the instances of a multi-instance
+        request, with their block device mappings, in one transaction.
+
+        The instances are built from the same base options, so the block
+        device mappings are validated once for all of them.
+        """
+        instances = []
+        for index in xrange(num_instances):
+            instance = instance_obj.Instance()
+            instance.update(base_options)
+            self._populate_instance_for_create(instance, image, index,
+                                               security_groups, instance_type)
+            self._populate_instance_names(instance, num_instances)
+            self._populate_instance_shutdown_terminate(instance, image,
+                                                       block_device_mapping)
+            # NOTE: The uuid is generated before the instance is created,
+            # so the template can be applied before it is saved.
+            self._populate_instance_name_from_template(instance, index)
+            instances.append(instance)
+
+        image_properties = image.get('properties', {})
+        image_mapping = image_properties.get('mappings', [])
+        block_device_mappings = {}
+        for index, instance in enumerate(instances):
+            instance_uuid = instance.uuid
+            instance_image_mapping = []
+            if image_mapping:
+                instance_image_mapping = self._prepare_image_mapping(
+                        instance_type, instance_uuid, image_mapping)
+            if index == 0:
+                self._validate_bdm(context, instance, instance_type,
+                                   block_device_mapping +
+                                   instance_image_mapping)
+
+            mappings = []
+            for mapping in (instance_image_mapping, block_device_mapping):
+                mappings.extend(self._get_block_device_mapping_values(
+                        instance_type, instance_uuid, mapping))
+            block_device_mappings[instance_uuid] = mappings
+
+        self.security_group_api.ensure_default(context)
+        return instance_obj.InstanceList.create_all(
+                context, instances, block_device_mappings).objects
+
     def _check_create_policies(self, context, availability_zone,
             requested_networks, block_device_mapping):
         """Check policies for create()."""
@@ -3230,6 +3299,7 @@ class AggregateAPI(base.Base):
     """Sub-set of the Compute Manager API for managing host aggregates."""
     def __init__(self, **kwargs):
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
+        self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
         super(AggregateAPI, self).__init__(**kwargs)
 
     @wrap_exception()
@@ -3287,6 +3357,8 @@ class AggregateAPI(base.Base):
         if values:
             aggregate.metadata = values
         aggregate.save()
+        if values:
+            self.scheduler_rpcapi.invalidate_aggregates(context)
         # If updated values include availability_zones, then the cache
         # which stored availability_zones and host need to be reset
         if values.get('availability_zone'):
@@ -3300,6 +3372,7 @@ class AggregateAPI(base.Base):
         self.is_safe_to_update_az(context, aggregate,
                          metadata, "update aggregate metadata")
         aggregate.update_metadata(metadata)
+        self.scheduler_rpcapi.invalidate_aggregates(context)
         # If updated metadata include availability_zones, then the cache
         # which stored availability_zones and host need to be reset
         if metadata and metadata.get('availability_zone'):
@@ -3369,6 +3442,7 @@ class AggregateAPI(base.Base):
         aggregate = aggregate_obj.Aggregate.get_by_id(context, aggregate_id)
         aggregate.add_host(context, host_name)
         self._update_az_cache_for_host(context, host_name, aggregate.metadata)
+        self.scheduler_rpcapi.invalidate_aggregates(context)
         #NOTE(jogo): Send message to host to support resource pools
         self.compute_rpcapi.add_aggregate_host(context,
                 aggregate=aggregate, host_param=host_name, host=host_name)
@@ -3391,6 +3465,7 @@ class AggregateAPI(base.Base):
         aggregate = aggregate_obj.Aggregate.get_by_id(context, aggregate_id)
         aggregate.delete_host(host_name)
         self._update_az_cache_for_host(context, host_name, aggregate.metadata)
+        self.scheduler_rpcapi.invalidate_aggregates(context)
         self.compute_rpcapi.remove_aggregate_host(context,
                 aggregate=aggregate, host_param=host_name, host=host_name)
         compute_utils.notify_about_aggregate_update(context,
@@ -277,17 +277,57 @@ def remove_flavor_access(flavorid, projectid, ctxt=None):
     return db.flavor_access_remove(ctxt, flavorid, projectid)
 
 
+# NOTE: Many instances share a few flavors, so the flavors extracted from
+# their system_metadata are cached by the stored values.  The cache is
+# flushed once it holds too many flavors, e.g. after many resizes.
+_FLAVOR_CACHE_MAX_SIZE = 1024
+_flavor_cache = {}
+_flavor_keys_cache = {}
+
+
+def _get_flavor_keys(prefix):
+    """Return the system_metadata keys of a flavor with a prefix."""
+    flavor_keys = _flavor_keys_cache.get(prefix)
+    if flavor_keys is None:
+        flavor_keys = tuple(
+            (key, type_fn, '%sinstance_type_%s' % (prefix, key))
+            for key, type_fn in system_metadata_flavor_props.items())
+        _flavor_keys_cache[prefix] = flavor_keys
+    return flavor_keys
+
+
+def _get_flavor_values(instance, flavor_keys):
+    """Return the stored values of a flavor from instance's
+    system_metadata, without building a dict of all of it.
+    """
+    sys_meta = instance.get('system_metadata') or {}
+    if not isinstance(sys_meta, dict):
+        type_keys = set(type_key for key, type_fn, type_key in flavor_keys)
+        items = sys_meta
+        sys_meta = {}
+        for item in items:
+            if item['key'] in type_keys and not item.get('deleted'):
+                sys_meta[item['key']] = item['value']
+    return tuple(sys_meta[type_key] for key, type_fn, type_key in flavor_keys)
+
+
 def extract_flavor(instance, prefix=''):
     """Create an InstanceType-like object from instance's system_metadata
     information.
     """
 
-    instance_type = {}
-    sys_meta = utils.instance_sys_meta(instance)
-    for key, type_fn in system_metadata_flavor_props.items():
-        type_key = '%sinstance_type_%s' % (prefix, key)
-        instance_type[key] = type_fn(sys_meta[type_key])
-    return instance_type
+    flavor_keys = _get_flavor_keys(prefix)
+    values = _get_flavor_values(instance, flavor_keys)
+    instance_type = _flavor_cache.get(values)
+    if instance_type is None:
+        instance_type = {}
+        for (key, type_fn, type_key), value in zip(flavor_keys, values):
+            instance_type[key] = type_fn(value)
+        if len(_flavor_cache) >= _FLAVOR_CACHE_MAX_SIZE:
+            _flavor_cache.clear()
+        _flavor_cache[values] = instance_type
+    # NOTE: Callers are free to update the flavor they get
+    return dict(instance_type)
 
 
 def save_flavor_info(metadata, instance_type, prefix=''):
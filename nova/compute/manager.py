@@ -35,8 +35,10 @@ import traceback
 import uuid
 
 import eventlet.event
+import eventlet.greenpool
 from eventlet import greenthread
 import eventlet.timeout
+from keystoneclient.v2_0 import client as keystone_client
 from oslo.config import cfg
 from oslo import messaging
 
@@ -120,6 +122,10 @@ compute_opts = [
     cfg.IntOpt('network_allocate_retries',
                default=0,
                help="Number of times to retry network allocation on failures"),
+    cfg.IntOpt('sync_power_state_pool_size',
+               default=1000,
+               help='Number of greenthreads available for use to sync '
+                    'power states'),
     ]
 
 interval_opts = [
@@ -215,6 +221,14 @@ CONF.import_opt('enabled', 'nova.spice', group='spice')
 CONF.import_opt('enable', 'nova.cells.opts', group='cells')
 CONF.import_opt('image_cache_subdirectory_name', 'nova.virt.imagecache')
 CONF.import_opt('image_cache_manager_interval', 'nova.virt.imagecache')
+CONF.import_opt('image_prefetch_ids', 'nova.virt.imagecache')
+CONF.import_opt('image_prefetch_interval', 'nova.virt.imagecache')
+CONF.import_opt('image_prefetch_concurrency', 'nova.virt.imagecache')
+CONF.import_opt('image_prefetch_admin_username', 'nova.virt.imagecache')
+CONF.import_opt('image_prefetch_admin_password', 'nova.virt.imagecache')
+CONF.import_opt('image_prefetch_admin_tenant_name', 'nova.virt.imagecache')
+CONF.import_opt('image_prefetch_admin_auth_url', 'nova.virt.imagecache')
+CONF.import_opt('auth_strategy', 'nova.api.auth')
 CONF.import_opt('enabled', 'nova.rdp', group='rdp')
 CONF.import_opt('html5_proxy_base_url', 'nova.rdp', group='rdp')
 
@@ -588,6 +602,10 @@ class ComputeManager(manager.Manager):
         self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
         self._resource_tracker_dict = {}
         self.instance_events = InstanceEvents()
+        self._prefetch_pool = eventlet.greenpool.GreenPool(
+                max(CONF.image_prefetch_concurrency, 1))
+        # IDs of the images being prefetched
+        self._prefetching = set()
 
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
@@ -4884,13 +4902,15 @@ class ComputeManager(manager.Manager):
                        "older than %(confirm_window)d seconds"),
                      migrations_info)
 
+        to_error = []
+
         def _set_migration_to_error(migration, reason, **kwargs):
             LOG.warn(_("Setting migration %(migration_id)s to error: "
                        "%(reason)s"),
                      {'migration_id': migration['id'], 'reason': reason},
                      **kwargs)
             migration.status = 'error'
-            migration.save(context.elevated())
+            to_error.append(migration)
 
         for migration in migrations:
             instance_uuid = migration.instance_uuid
@@ -4930,6 +4950,16 @@ class ComputeManager(manager.Manager):
                 LOG.error(_("Error auto-confirming resize: %s. "
                             "Will retry later.") % e, instance=instance)
 
+        # NOTE: Save the status of all the migrations set to error with a
+        # single conductor call rather than one call per migration.
+        errors = obj_base.obj_action_multi(context.elevated(), to_error,
+                                           'save')
+        for migration, error in zip(to_error, errors):
+            if error is not None:
+                LOG.error(_("Failed to set migration %(migration_id)s to "
+                            "error: %(error)s"),
+                          {'migration_id': migration.id, 'error': error})
+
     @periodic_task.periodic_task(spacing=CONF.shelved_poll_interval)
     def _poll_shelved_instances(self, context):
         if CONF.shelved_offload_time <= 0:
@@ -4941,17 +4971,23 @@ class ComputeManager(manager.Manager):
             context, filters=filters, expected_attrs=['system_metadata'],
             use_slave=True)
 
-        to_gc = []
+        to_gc = instance_obj.InstanceList(context, objects=[])
         for instance in shelved_instances:
             sys_meta = instance.system_metadata
             shelved_at = timeutils.parse_strtime(sys_meta['shelved_at'])
             if timeutils.is_older_than(shelved_at, CONF.shelved_offload_time):
-                to_gc.append(instance)
+                instance.task_state = task_states.SHELVING_OFFLOADING
+                to_gc.objects.append(instance)
 
+        # NOTE: Save the task state of all the instances with a single
+        # conductor call rather than one call per instance.
+        errors = to_gc.save_all()
         for instance in to_gc:
+            if instance.uuid in errors:
+                LOG.error(_('Periodic task failed to offload instance: %s'),
+                          errors[instance.uuid], instance=instance)
+                continue
             try:
-                instance.task_state = task_states.SHELVING_OFFLOADING
-                instance.save()
                 self.shelve_offload_instance(context, instance)
             except Exception:
                 LOG.exception(_('Periodic task failed to offload instance.'),
@@ -5159,25 +5195,88 @@ class ComputeManager(manager.Manager):
     def _sync_power_states(self, context):
         """Align power states between the database and the hypervisor.
 
-        To sync power state data we make a DB call to get the number of
-        virtual machines known by the hypervisor and if the number matches the
-        number of virtual machines known by the database, we proceed in a lazy
-        loop, one database record at a time, checking if the hypervisor has the
-        same power state as is in the database.
+        The power states of all instances are fetched from the hypervisor
+        in one call, the database is brought in line with a bulk update of
+        the instances whose power state changed, and the instances that
+        need further action are handled in a pool of greenthreads.
+
+        Drivers that can't report all power states at once fall back to a
+        lazy loop, one database record at a time, checking if the
+        hypervisor has the same power state as is in the database.
         """
         db_instances = instance_obj.InstanceList.get_by_host(context,
                                                              self.host,
                                                              use_slave=True)
 
-        num_vm_instances = self.driver.get_num_instances()
-        num_db_instances = len(db_instances)
+        try:
+            vm_power_states = self.driver.get_power_states()
+        except NotImplementedError:
+            self._sync_power_states_per_instance(context, db_instances)
+            return
 
+        self._warn_on_instance_count_mismatch(len(db_instances),
+                                              len(vm_power_states))
+
+        sync_instances = []
+        changed_power_states = {}
+        for db_instance in db_instances:
+            if db_instance.task_state is not None:
+                LOG.info(_("During sync_power_state the instance has a "
+                           "pending task. Skip."), instance=db_instance)
+                continue
+            vm_power_state = vm_power_states.get(db_instance.uuid,
+                                                 power_state.NOSTATE)
+            if vm_power_state != db_instance.power_state:
+                changed_power_states[db_instance.uuid] = vm_power_state
+            sync_instances.append((db_instance, vm_power_state))
+
+        if changed_power_states:
+            updated = set(db_instances.update_power_states(
+                self.host, changed_power_states))
+            # NOTE: instances the update skipped got a task or moved to
+            # another host since they were listed, leave them alone.
+            sync_instances = [(db_instance, vm_power_state)
+                              for db_instance, vm_power_state in sync_instances
+                              if (db_instance.uuid not in changed_power_states
+                                  or db_instance.uuid in updated)]
+
+        pool = eventlet.greenpool.GreenPool(CONF.sync_power_state_pool_size)
+        for db_instance, vm_power_state in sync_instances:
+            pool.spawn_n(self._sync_instance_vm_state_safe, context,
+                         db_instance, vm_power_state)
+        pool.waitall()
+
+    def _sync_instance_vm_state_safe(self, context, db_instance,
+                                     vm_power_state):
+        try:
+            if self._sync_stops_instance(db_instance.vm_state,
+                                         vm_power_state):
+                # NOTE: the instance was listed from a slave, re-check its
+                # host and task on the master before stopping it.
+                self._sync_instance_power_state(context, db_instance,
+                                                vm_power_state)
+            else:
+                self._sync_instance_vm_state(context, db_instance,
+                                             vm_power_state)
+        except exception.InstanceNotFound:
+            pass
+        except Exception:
+            LOG.exception(_("Periodic sync_power_state task had an error "
+                            "while processing an instance."),
+                          instance=db_instance)
+
+    def _warn_on_instance_count_mismatch(self, num_db_instances,
+                                         num_vm_instances):
         if num_vm_instances != num_db_instances:
             LOG.warn(_("Found %(num_db_instances)s in the database and "
                        "%(num_vm_instances)s on the hypervisor."),
                      {'num_db_instances': num_db_instances,
                       'num_vm_instances': num_vm_instances})
 
+    def _sync_power_states_per_instance(self, context, db_instances):
+        self._warn_on_instance_count_mismatch(len(db_instances),
+                                              self.driver.get_num_instances())
+
         for db_instance in db_instances:
             if db_instance['task_state'] is not None:
                 LOG.info(_("During sync_power_state the instance has a "
@@ -5218,7 +5317,6 @@ class ComputeManager(manager.Manager):
         # (not eliminate) race condition.
         db_instance.refresh(use_slave=use_slave)
         db_power_state = db_instance.power_state
-        vm_state = db_instance.vm_state
 
         if self.host != db_instance.host:
             # on the sending end of nova-compute _sync_power_state
@@ -5249,7 +5347,32 @@ class ComputeManager(manager.Manager):
             # power_state is always updated from hypervisor to db
             db_instance.power_state = vm_power_state
             db_instance.save()
-            db_power_state = vm_power_state
+
+        self._sync_instance_vm_state(context, db_instance, vm_power_state)
+
+    @staticmethod
+    def _sync_stops_instance(vm_state, vm_power_state):
+        """Whether _sync_instance_vm_state() calls the stop API."""
+        if vm_state == vm_states.ACTIVE:
+            return vm_power_state in (power_state.SHUTDOWN,
+                                      power_state.CRASHED,
+                                      power_state.SUSPENDED)
+        elif vm_state == vm_states.STOPPED:
+            return vm_power_state not in (power_state.NOSTATE,
+                                          power_state.SHUTDOWN,
+                                          power_state.CRASHED)
+        elif vm_state == vm_states.PAUSED:
+            return vm_power_state in (power_state.SHUTDOWN,
+                                      power_state.CRASHED)
+        return False
+
+    def _sync_instance_vm_state(self, context, db_instance, vm_power_state):
+        """Resolve the discrepancy between vm_state and vm_power_state.
+
+        The power state of the instance is expected to be up to date in the
+        database already.
+        """
+        vm_state = db_instance.vm_state
 
         # Note(maoy): Now resolve the discrepancy between vm_state and
         # vm_power_state. We go through all possible vm_states.
@@ -5616,6 +5739,73 @@ class ComputeManager(manager.Manager):
 
         self.driver.manage_image_cache(context, filtered_instances)
 
+    @periodic_task.periodic_task(spacing=CONF.image_prefetch_interval)
+    def _run_image_prefetch_pass(self, context):
+        """Fetch the images to prefetch into the driver's image cache."""
+
+        if not self.driver.capabilities["has_imagecache"]:
+            return
+        if CONF.image_prefetch_interval == 0 or not CONF.image_prefetch_ids:
+            return
+
+        cached_images = set(self.driver.get_cached_images())
+        image_ids = [image_id for image_id in CONF.image_prefetch_ids
+                     if (image_id not in cached_images and
+                         image_id not in self._prefetching)]
+        if not image_ids:
+            return
+
+        context = self._get_prefetch_context(context)
+        if context is None:
+            return
+
+        # NOTE: The downloads run in the background, so that this task does
+        # not hold up the other periodic tasks until they are over. The
+        # images still being downloaded are skipped by the next runs.
+        LOG.debug(_('Prefetching %d images'), len(image_ids))
+        for image_id in image_ids:
+            self._prefetching.add(image_id)
+            self._prefetch_pool.spawn_n(self._prefetch_image_safe, context,
+                                        image_id)
+
+    def _get_prefetch_context(self, context):
+        """Return a context the image service accepts, or None.
+
+        The periodic task context carries no token, which keystone rejects,
+        so a token is requested for the configured prefetch user instead.
+        """
+        if CONF.auth_strategy != 'keystone':
+            return context
+        if not CONF.image_prefetch_admin_username:
+            LOG.warning(_('Not prefetching images: image_prefetch_admin_'
+                          'username must be set to fetch images from '
+                          'glance when auth_strategy is keystone'))
+            return None
+        try:
+            keystone = keystone_client.Client(
+                    username=CONF.image_prefetch_admin_username,
+                    password=CONF.image_prefetch_admin_password,
+                    tenant_name=CONF.image_prefetch_admin_tenant_name,
+                    auth_url=CONF.image_prefetch_admin_auth_url)
+        except Exception:
+            LOG.exception(_('Not prefetching images: failed to get a token '
+                            'from keystone'))
+            return None
+        return nova.context.RequestContext(keystone.auth_user_id,
+                                           keystone.auth_tenant_id,
+                                           is_admin=True,
+                                           auth_token=keystone.auth_token)
+
+    def _prefetch_image_safe(self, context, image_id):
+        try:
+            self.driver.prefetch_image(context, image_id)
+        except NotImplementedError:
+            pass
+        except Exception:
+            LOG.exception(_('Failed to prefetch image %s'), image_id)
+        finally:
+            self._prefetching.discard(image_id)
+
     @periodic_task.periodic_task(spacing=CONF.instance_delete_interval)
     def _run_pending_deletes(self, context):
         """Retry any pending instance file deletes."""
@@ -37,8 +37,10 @@ from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
 from nova.pci import pci_manager
 from nova import rpc
+from nova.scheduler import rpcapi as scheduler_rpcapi
 from nova import utils
 
 resource_tracker_opts = [
@@ -48,7 +50,21 @@ resource_tracker_opts = [
                help='Amount of memory in MB to reserve for the host'),
     cfg.StrOpt('compute_stats_class',
                default='nova.compute.stats.Stats',
-               help='Class that will manage stats for the local compute host')
+               help='Class that will manage stats for the local compute host'),
+    cfg.BoolOpt('compute_push_host_state',
+                default=False,
+                help='Push compute node updates to the schedulers so that '
+                     'their cached host states are refreshed without waiting '
+                     'for the next database sync. Only useful when the '
+                     'schedulers run with scheduler_host_state_cache'),
+    cfg.IntOpt('resource_audit_interval',
+               default=0,
+               help='Interval in seconds between full audits of the '
+                    'resources of a compute node against the hypervisor, '
+                    'its instances and migrations. In between, the '
+                    'compute node record is kept up to date from the '
+                    'resource claims and only the monitor metrics are '
+                    'refreshed. 0 audits on every resource update.'),
 ]
 
 CONF = cfg.CONF
@@ -71,10 +87,14 @@ class ResourceTracker(object):
         self.pci_tracker = None
         self.nodename = nodename
         self.compute_node = None
+        # the compute node fields as last written to the database
+        self._synced_compute_node = {}
+        self._last_audit = None
         self.stats = importutils.import_object(CONF.compute_stats_class)
         self.tracked_instances = {}
         self.tracked_migrations = {}
         self.conductor_api = conductor.API()
+        self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
         monitor_handler = monitors.ResourceMonitorHandler()
         self.monitors = monitor_handler.choose_monitors(self)
         self.notifier = rpc.get_notifier()
@@ -288,7 +308,14 @@ class ResourceTracker(object):
         Add in resource claims in progress to account for operations that have
         declared a need for resources, but not necessarily retrieved them from
         the hypervisor layer yet.
+
+        Between full audits, see resource_audit_interval, only the monitor
+        metrics are refreshed.
         """
+        if not self._audit_due():
+            self._update_metrics(context)
+            return
+
         LOG.audit(_("Auditing locally available compute resources"))
         resources = self.driver.get_available_resource(self.nodename)
 
@@ -344,6 +371,19 @@ class ResourceTracker(object):
         metrics = self._get_host_metrics(context, self.nodename)
         resources['metrics'] = jsonutils.dumps(metrics)
         self._sync_compute_node(context, resources)
+        self._last_audit = timeutils.utcnow()
+
+    def _audit_due(self):
+        if self.disabled or self._last_audit is None:
+            return True
+        interval = CONF.resource_audit_interval
+        return (interval <= 0 or
+                timeutils.is_older_than(self._last_audit, interval))
+
+    def _update_metrics(self, context):
+        metrics = self._get_host_metrics(context, self.nodename)
+        self.compute_node['metrics'] = jsonutils.dumps(metrics)
+        self._update(context, self.compute_node)
 
     def _sync_compute_node(self, context, resources):
         """Create or update the compute node DB record."""
@@ -359,6 +399,7 @@ class ResourceTracker(object):
                 for cn in compute_node_refs:
                     if cn.get('hypervisor_hostname') == self.nodename:
                         self.compute_node = cn
+                        self._synced_compute_node = dict(cn)
                         if self.pci_tracker:
                             self.pci_tracker.set_compute_node_id(cn['id'])
                         break
@@ -383,6 +424,7 @@ class ResourceTracker(object):
         # initialize load stats from existing instances:
         self.compute_node = self.conductor_api.compute_node_create(context,
                                                                    values)
+        self._synced_compute_node = dict(self.compute_node)
 
     def _get_service(self, context):
         try:
@@ -442,13 +484,29 @@ class ResourceTracker(object):
             LOG.audit(_("Free PCI devices: %s") % resources['pci_devices'])
 
     def _update(self, context, values):
-        """Persist the compute node updates to the DB."""
+        """Persist the compute node updates to the DB.
+
+        Only the fields that changed since the last update are sent, but
+        the compute node record is always written so that its updated_at
+        is bumped, which the scheduler relies on to refresh its view of
+        the host.
+        """
         if "service" in self.compute_node:
             del self.compute_node['service']
+        changes = dict((key, value) for key, value in values.iteritems()
+                       if key != 'service' and
+                       (key not in self._synced_compute_node or
+                        self._synced_compute_node[key] != value))
+        # NOTE: the conductor only needs the id of the compute node, no
+        # need to send the whole record along with the changes.
         self.compute_node = self.conductor_api.compute_node_update(
-            context, self.compute_node, values)
+            context, {'id': self.compute_node['id']}, changes)
+        self._synced_compute_node = dict(self.compute_node)
         if self.pci_tracker:
             self.pci_tracker.save(context)
+        if CONF.compute_push_host_state:
+            self.scheduler_rpcapi.update_host_state(context, self.host,
+                    self.nodename, self.compute_node)
 
     def _update_usage(self, resources, usage, sign=1):
         mem_usage = usage['memory_mb']
@@ -621,6 +679,12 @@ class ResourceTracker(object):
             else:
                 self._update_usage_from_instance(resources, instance)
 
+        # report the images cached on this host, so that the scheduler can
+        # prefer the hosts which don't need to download an image
+        for image_id in self.driver.get_cached_images():
+            self.stats['image_cached_%s' % image_id] = 1
+        resources['stats'] = jsonutils.dumps(self.stats)
+
     def _find_orphaned_instances(self):
         """Given the set of instances and migrations already account for
         by resource tracker, sanity check the hypervisor to determine
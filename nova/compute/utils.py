@@ -20,6 +20,7 @@ import string
 import traceback
 
 from oslo.config import cfg
+import six
 
 from nova import block_device
 from nova.compute import flavors
@@ -30,6 +31,7 @@ from nova.network import model as network_model
 from nova import notifications
 from nova.objects import instance as instance_obj
 from nova.openstack.common.gettextutils import _
+from nova.openstack.common import jsonutils
 from nova.openstack.common import log
 from nova.openstack.common import timeutils
 from nova import rpc
@@ -396,6 +398,26 @@ def get_nw_info_for_instance(instance):
     return nw_info
 
 
+def get_addresses_for_instance(instance):
+    """Return the addresses stored with the info cache of an instance.
+
+    These are the addresses of network_model.NetworkInfo.addresses(),
+    None is returned if they were not computed for the info cache yet.
+    """
+    if isinstance(instance, instance_obj.Instance):
+        info_cache = instance.info_cache
+        if (info_cache is None or
+                not info_cache.obj_attr_is_set('addresses') or
+                'network_info' in info_cache.obj_what_changed()):
+            return None
+        return info_cache.addresses
+    info_cache = instance['info_cache'] or {}
+    addresses = info_cache.get('addresses')
+    if isinstance(addresses, six.string_types):
+        addresses = jsonutils.loads(addresses)
+    return addresses
+
+
 def has_audit_been_run(context, conductor, host, timestamp=None):
     begin, end = utils.last_completed_audit_period(before=timestamp)
     task_log = conductor.task_log_get(context, "instance_usage_audit",
@@ -36,7 +36,12 @@ conductor_opts = [
                help='Full class name for the Manager for conductor'),
     cfg.IntOpt('workers',
                help='Number of workers for OpenStack Conductor service. '
-                    'The default will be the number of CPUs available.')
+                    'The default will be the number of CPUs available.'),
+    cfg.BoolOpt('delta_object_actions',
+                default=False,
+                help='Only send the identity and the changed fields of '
+                     'objects to the conductor for remote object methods '
+                     'that support it, like Instance.save()'),
 ]
 conductor_group = cfg.OptGroup(name='conductor',
                                title='Conductor Options')
@@ -629,6 +629,65 @@ class ConductorManager(manager.Manager):
         updates['obj_what_changed'] = objinst.obj_what_changed()
         return updates, result
 
+    def object_action_delta(self, context, objinst, objmethod, args, kwargs,
+                            digests):
+        """Perform an action on an object sent as a delta.
+
+        objinst only has the identity and the changed fields of the
+        caller's object set, see NovaObject.obj_make_delta().  Fields are
+        only sent back if their value differs from the one the caller has,
+        as described by digests.
+        """
+        oldobj = objinst.obj_clone()
+        result = self._object_dispatch(objinst, objmethod, context,
+                                       args, kwargs)
+        updates = dict()
+        bytes_saved = 0
+        for name, field in objinst.fields.items():
+            if not objinst.obj_attr_is_set(name):
+                # Avoid demand-loading anything
+                continue
+            value = field.to_primitive(objinst, name, objinst[name])
+            if name in digests:
+                digest, size = nova_object.obj_field_digest(value)
+                if digest == digests[name]:
+                    bytes_saved += size
+                    continue
+            elif (oldobj.obj_attr_is_set(name) and
+                    oldobj[name] == objinst[name]):
+                continue
+            updates[name] = value
+        nova_object.delta_bytes_saved[objinst.obj_name()] += bytes_saved
+        # This is safe since a field named this would conflict with the
+        # method anyway
+        updates['obj_what_changed'] = objinst.obj_what_changed()
+        return updates, result
+
+    def object_action_multi(self, context, actions):
+        """Perform several actions on objects in one call.
+
+        actions is a list of (objinst, objmethod, args, kwargs) tuples,
+        which are run in order.  A failing action does not stop the
+        following ones: the result list has, for each action, either
+        (updates, result, None) as object_action() would return, or
+        (None, None, error) where error is a dict describing the exception
+        raised by the action.
+        """
+        results = []
+        for objinst, objmethod, args, kwargs in actions:
+            try:
+                updates, result = self.object_action(
+                    context, objinst=objinst, objmethod=objmethod, args=args,
+                    kwargs=kwargs)
+            except messaging.ExpectedException as e:
+                exc = e.exc_info[1]
+                error = {'class': exc.__class__.__name__,
+                         'message': unicode(exc)}
+                results.append((None, None, error))
+            else:
+                results.append((updates, result, None))
+        return results
+
     # NOTE(danms): This method is now deprecated and can be removed in
     # v2.0 of the RPC API
     def compute_reboot(self, context, instance, reboot_type):
@@ -872,7 +931,7 @@ class ComputeTaskManager(base.Base):
 
 class _ConductorManagerV2Proxy(object):
 
-    target = messaging.Target(version='2.0')
+    target = messaging.Target(version='2.2')
 
     def __init__(self, manager):
         self.manager = manager
@@ -1044,3 +1103,11 @@ class _ConductorManagerV2Proxy(object):
 
     def object_backport(self, context, objinst, target_version):
         return self.manager.object_backport(context, objinst, target_version)
+
+    def object_action_delta(self, context, objinst, objmethod, args, kwargs,
+                            digests):
+        return self.manager.object_action_delta(context, objinst, objmethod,
+                                                args, kwargs, digests)
+
+    def object_action_multi(self, context, actions):
+        return self.manager.object_action_multi(context, actions)
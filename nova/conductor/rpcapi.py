@@ -133,6 +133,8 @@ class ConductorAPI(object):
     ...  - Remove block_device_mapping_destroy()
 
     2.0  - Drop backwards compatibility
+    2.1  - Added object_action_delta()
+    2.2  - Added object_action_multi()
     """
 
     VERSION_ALIASES = {
@@ -434,6 +436,35 @@ class ConductorAPI(object):
         return cctxt.call(context, 'object_backport', objinst=objinst,
                           target_version=target_version)
 
+    def object_action_delta(self, context, objinst, objmethod, args, kwargs):
+        if (not CONF.conductor.delta_object_actions or
+                not self.client.can_send_version('2.1')):
+            return self.object_action(context, objinst, objmethod, args,
+                                      kwargs)
+        delta, digests, bytes_saved = objinst.obj_make_delta()
+        objects_base.delta_bytes_saved[objinst.obj_name()] += bytes_saved
+        cctxt = self.client.prepare(version='2.1')
+        return cctxt.call(context, 'object_action_delta', objinst=delta,
+                          objmethod=objmethod, args=args, kwargs=kwargs,
+                          digests=digests)
+
+    def object_action_multi(self, context, actions):
+        if not self.client.can_send_version('2.2'):
+            results = []
+            for objinst, objmethod, args, kwargs in actions:
+                try:
+                    updates, result = self.object_action(
+                        context, objinst, objmethod, args, kwargs)
+                except Exception as e:
+                    error = {'class': e.__class__.__name__,
+                             'message': unicode(e)}
+                    results.append((None, None, error))
+                else:
+                    results.append((updates, result, None))
+            return results
+        cctxt = self.client.prepare(version='2.2')
+        return cctxt.call(context, 'object_action_multi', actions=actions)
+
 
 class ComputeTaskAPI(object):
     """Client side of the conductor 'compute' namespaced RPC API
@@ -194,6 +194,25 @@ def compute_node_get_all(context, no_date_fields=False):
     return IMPL.compute_node_get_all(context, no_date_fields)
 
 
+def compute_node_get_all_changed_since(context, changed_since):
+    """Get computeNodes created, updated or deleted since a point in time.
+
+    :param context: The security context
+    :param changed_since: datetime; only compute nodes with a created_at,
+                          updated_at or deleted_at at or after this time
+                          are returned
+
+    :returns: A tuple of the list of changed compute nodes and of the list
+              of all the nova-compute services.  Each compute node is a
+              dictionary of its properties, including its service.  Deleted
+              compute nodes are included so that callers caching compute
+              nodes can drop them.  The services are returned in full since
+              they are updated without their compute nodes, e.g. when they
+              are disabled or report their state.
+    """
+    return IMPL.compute_node_get_all_changed_since(context, changed_since)
+
+
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     """Get compute nodes by hypervisor hostname.
 
@@ -620,6 +639,18 @@ def instance_create(context, values):
     return IMPL.instance_create(context, values)
 
 
+def instance_create_bulk(context, values_list, block_device_mappings=None):
+    """Create instances from a list of values dictionaries at once.
+
+    :param block_device_mappings: = dict mapping instance uuids to the block
+                                   device mappings to create for them
+
+    :returns: the instances, in the order of values_list
+    """
+    return IMPL.instance_create_bulk(context, values_list,
+                                     block_device_mappings)
+
+
 def instance_destroy(context, instance_uuid, constraint=None,
         update_cells=True):
     """Destroy the instance or raise if it does not exist."""
@@ -651,13 +682,30 @@ def instance_get_all(context, columns_to_join=None):
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                 sort_dir='desc', limit=None, marker=None,
-                                columns_to_join=None, use_slave=False):
+                                columns_to_join=None, use_slave=False,
+                                columns=None):
     """Get all instances that match all filters."""
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
                                             sort_dir, limit=limit,
                                             marker=marker,
                                             columns_to_join=columns_to_join,
-                                            use_slave=use_slave)
+                                            use_slave=use_slave,
+                                            columns=columns)
+
+
+def instance_get_all_by_filters_chunked(context, filters,
+                                        sort_key='created_at',
+                                        sort_dir='desc', chunk_size=1000,
+                                        columns_to_join=None, use_slave=False,
+                                        columns=None):
+    """Return a generator over all instances that match all filters.
+
+    Instances are fetched from the database chunk_size at a time.
+    """
+    return IMPL.instance_get_all_by_filters_chunked(context, filters,
+            sort_key, sort_dir, chunk_size=chunk_size,
+            columns_to_join=columns_to_join, use_slave=use_slave,
+            columns=columns)
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
@@ -748,6 +796,20 @@ def instance_update_and_get_original(context, instance_uuid, values,
     return rv
 
 
+def instance_update_power_states(context, host, power_states):
+    """Set the power state of many instances on a host at once.
+
+    :param power_states: = dict mapping instance uuids to power states
+
+    Instances with a pending task, or which are not on the host any more,
+    are left alone, as are instances already in the given power state.
+
+    :returns: a list of (old_instance_ref, new_instance_ref) tuples for the
+              updated instances
+    """
+    return IMPL.instance_update_power_states(context, host, power_states)
+
+
 def instance_add_security_group(context, instance_id, security_group_id):
     """Associate the given security group with the given instance."""
     return IMPL.instance_add_security_group(context, instance_id,
@@ -1731,6 +1793,17 @@ def aggregate_host_get_by_metadata_key(context, key):
     return IMPL.aggregate_host_get_by_metadata_key(context, key)
 
 
+def aggregate_host_metadata_get_all(context):
+    """Get the aggregate metadata of every host in an aggregate.
+
+    Returns a dictionary where each key is a hostname and each value is
+    the same dictionary of sets aggregate_metadata_get_by_host() returns
+    for that host.
+    return value:  {machine: {key: set( value1, value2 )}}
+    """
+    return IMPL.aggregate_host_metadata_get_all(context)
+
+
 def aggregate_update(context, aggregate_id, values):
     """Update the attributes of an aggregates.
 
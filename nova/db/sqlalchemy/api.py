@@ -21,6 +21,8 @@ import collections
 import copy
 import datetime
 import functools
+import operator
+import random
 import sys
 import time
 import uuid
@@ -52,11 +54,13 @@ from nova.compute import vm_states
 import nova.context
 from nova.db.sqlalchemy import models
 from nova import exception
+from nova.network import model as network_model
 from nova.openstack.common.db import exception as db_exc
 from nova.openstack.common.db.sqlalchemy import session as db_session
 from nova.openstack.common.db.sqlalchemy import utils as sqlalchemyutils
 from nova.openstack.common import excutils
 from nova.openstack.common.gettextutils import _
+from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
 from nova.openstack.common import uuidutils
@@ -68,6 +72,15 @@ db_opts = [
                help='When set, compute API will consider duplicate hostnames '
                     'invalid within the specified scope, regardless of case. '
                     'Should be empty, "project" or "global".'),
+    cfg.IntOpt('fixed_ip_allocation_spread',
+               default=0,
+               help='Number of free fixed IPs of a network among which one '
+                    'is picked at random when allocating from the pool. The '
+                    'picked fixed IP is claimed without locking the rest of '
+                    'the pool, so that concurrent allocations on the same '
+                    'network don\'t wait for each other. 0 allocates the '
+                    'first free fixed IP, locking it until the allocation '
+                    'commits.'),
 ]
 
 connection_opts = [
@@ -567,6 +580,16 @@ def compute_node_get_by_service_id(context, service_id):
 
 @require_admin_context
 def compute_node_get_all(context, no_date_fields):
+    compute_nodes, services = _compute_node_get_all(context, no_date_fields)
+    return compute_nodes
+
+
+@require_admin_context
+def compute_node_get_all_changed_since(context, changed_since):
+    return _compute_node_get_all(context, False, changed_since=changed_since)
+
+
+def _compute_node_get_all(context, no_date_fields, changed_since=None):
 
     # NOTE(msdubov): Using lower-level 'select' queries and joining the tables
     #                manually here allows to gain 3x speed-up and to have 5x
@@ -585,8 +608,16 @@ def compute_node_get_all(context, no_date_fields):
         def filter_columns(table):
             return [c for c in table.c if c.name not in redundant_columns]
 
+        if changed_since is None:
+            node_filter = compute_node.c.deleted == 0
+        else:
+            # Deleted rows are returned as well so that callers keeping a
+            # cache of compute nodes can drop them.
+            node_filter = or_(compute_node.c.updated_at >= changed_since,
+                              compute_node.c.created_at >= changed_since,
+                              compute_node.c.deleted_at >= changed_since)
         compute_node_query = select(filter_columns(compute_node)).\
-                                where(compute_node.c.deleted == 0).\
+                                where(node_filter).\
                                 order_by(compute_node.c.service_id)
         compute_node_rows = conn.execute(compute_node_query).fetchall()
 
@@ -608,7 +639,7 @@ def compute_node_get_all(context, no_date_fields):
 
         compute_nodes.append(node)
 
-    return compute_nodes
+    return compute_nodes, services.values()
 
 
 @require_admin_context
@@ -1132,22 +1163,73 @@ def fixed_ip_associate(context, address, instance_uuid, network_id=None,
     return fixed_ip_ref
 
 
+def _fixed_ip_pool_query(context, network_id, session,
+                         model=models.FixedIp):
+    """Query the free fixed IPs which can be allocated in a network."""
+    network_or_none = or_(models.FixedIp.network_id == network_id,
+                          models.FixedIp.network_id == None)
+    return model_query(context, model, session=session, read_deleted="no",
+                       base_model=models.FixedIp).\
+                   filter(network_or_none).\
+                   filter(models.FixedIp.reserved == False).\
+                   filter(models.FixedIp.instance_uuid == None).\
+                   filter(models.FixedIp.host == None)
+
+
+def _fixed_ip_claim_from_pool(context, session, network_id, values):
+    """Claim a free fixed IP of the pool.
+
+    The fixed IP is picked at random among the first
+    fixed_ip_allocation_spread free ones, and claimed with an UPDATE which
+    only succeeds if the fixed IP is still free, so that concurrent
+    allocations don't lock the same rows. Returns the id of the claimed
+    fixed IP.
+    """
+    values = dict(values, network_id=network_id)
+    tried = set()
+    while True:
+        query = _fixed_ip_pool_query(context, network_id, session,
+                                     model=models.FixedIp.id)
+        if tried:
+            query = query.filter(~models.FixedIp.id.in_(tried))
+        candidates = [row.id for row in
+                      query.limit(CONF.fixed_ip_allocation_spread).all()]
+        if not candidates:
+            raise exception.NoMoreFixedIps()
+        random.shuffle(candidates)
+        for fixed_ip_id in candidates:
+            tried.add(fixed_ip_id)
+            rows = _fixed_ip_pool_query(context, network_id, session).\
+                           filter(models.FixedIp.id == fixed_ip_id).\
+                           update(values, synchronize_session=False)
+            if rows:
+                return fixed_ip_id
+
+
 @require_admin_context
+@_retry_on_deadlock
 def fixed_ip_associate_pool(context, network_id, instance_uuid=None,
                             host=None):
     if instance_uuid and not uuidutils.is_uuid_like(instance_uuid):
         raise exception.InvalidUUID(uuid=instance_uuid)
 
+    values = {}
+    if instance_uuid:
+        values['instance_uuid'] = instance_uuid
+    if host:
+        values['host'] = host
+
     session = get_session()
     with session.begin():
-        network_or_none = or_(models.FixedIp.network_id == network_id,
-                              models.FixedIp.network_id == None)
-        fixed_ip_ref = model_query(context, models.FixedIp, session=session,
-                                   read_deleted="no").\
-                               filter(network_or_none).\
-                               filter_by(reserved=False).\
-                               filter_by(instance_uuid=None).\
-                               filter_by(host=None).\
+        if CONF.fixed_ip_allocation_spread > 0:
+            fixed_ip_id = _fixed_ip_claim_from_pool(context, session,
+                                                    network_id, values)
+            return model_query(context, models.FixedIp, session=session,
+                               read_deleted="no").\
+                           filter_by(id=fixed_ip_id).\
+                           first()
+
+        fixed_ip_ref = _fixed_ip_pool_query(context, network_id, session).\
                                with_lockmode('update').\
                                first()
         # NOTE(vish): if with_lockmode isn't supported, as in sqlite,
@@ -1156,13 +1238,8 @@ def fixed_ip_associate_pool(context, network_id, instance_uuid=None,
             raise exception.NoMoreFixedIps()
 
         if fixed_ip_ref['network_id'] is None:
-            fixed_ip_ref['network'] = network_id
-
-        if instance_uuid:
-            fixed_ip_ref['instance_uuid'] = instance_uuid
-
-        if host:
-            fixed_ip_ref['host'] = host
+            fixed_ip_ref['network_id'] = network_id
+        fixed_ip_ref.update(values)
         session.add(fixed_ip_ref)
     return fixed_ip_ref
 
@@ -1602,7 +1679,7 @@ def instance_create(context, values):
     instance_ref['info_cache'] = models.InstanceInfoCache()
     info_cache = values.pop('info_cache', None)
     if info_cache is not None:
-        instance_ref['info_cache'].update(info_cache)
+        instance_ref['info_cache'].update(_info_cache_values(info_cache))
     security_groups = values.pop('security_groups', [])
     instance_ref.update(values)
 
@@ -1632,6 +1709,152 @@ def instance_create(context, values):
     return instance_ref
 
 
+def _bulk_insert(session, model, rows):
+    """Insert rows into the table of a model with multi-row INSERTs.
+
+    Rows are grouped by the columns they set, since a multi-row INSERT sets
+    the same columns in every row.
+    """
+    columns = set(model.__table__.columns.keys())
+    groups = collections.defaultdict(list)
+    for row in rows:
+        row = dict((k, v) for k, v in row.iteritems() if k in columns)
+        groups[tuple(sorted(row))].append(row)
+    for group in groups.itervalues():
+        session.execute(model.__table__.insert(), group)
+
+
+def _block_device_mappings_for_create(mappings):
+    """Resolve the block device mappings of a new instance into the rows
+    block_device_mapping_update_or_create() would leave for them, applied
+    in order.
+    """
+    rows = []
+    by_device_name = {}
+    for values in mappings:
+        values = dict(values)
+        _scrub_empty_str_values(values, ['volume_size'])
+        row = None
+        if values.get('device_name'):
+            row = by_device_name.get(values['device_name'])
+        if row is not None:
+            row.update(values)
+        else:
+            row = values
+            rows.append(row)
+            if values.get('device_name'):
+                by_device_name[values['device_name']] = row
+        if block_device.new_format_is_swap(values):
+            rows = [x for x in rows
+                    if x is row or not block_device.new_format_is_swap(x)]
+    return rows
+
+
+@require_context
+def instance_create_bulk(context, values_list, block_device_mappings=None):
+    """Create new Instance records in the database in one transaction.
+
+    context - request context object
+    values_list - list of dicts containing column values, as taken by
+                  instance_create().
+    block_device_mappings - dict mapping instance uuids to the block device
+                            mappings to create for them, in the new format.
+
+    The instances and their info caches, metadata, system metadata,
+    security group associations, block device mappings and ec2 ids are
+    each inserted with multi-row INSERTs.
+    """
+    if block_device_mappings is None:
+        block_device_mappings = {}
+
+    instance_rows = []
+    info_cache_rows = []
+    metadata_rows = []
+    system_metadata_rows = []
+    security_group_names = {}
+    for values in values_list:
+        values = values.copy()
+        if not values.get('uuid'):
+            values['uuid'] = str(uuid.uuid4())
+        instance_uuid = values['uuid']
+        _handle_objects_related_type_conversions(values)
+
+        info_cache = {'instance_uuid': instance_uuid}
+        info_cache.update(values.pop('info_cache', None) or {})
+        info_cache_rows.append(_info_cache_values(info_cache))
+        for key, value in (values.pop('metadata', None) or {}).iteritems():
+            metadata_rows.append({'instance_uuid': instance_uuid,
+                                  'key': key, 'value': value})
+        for key, value in (values.pop('system_metadata', None) or
+                           {}).iteritems():
+            system_metadata_rows.append({'instance_uuid': instance_uuid,
+                                         'key': key, 'value': value})
+        security_group_names[instance_uuid] = values.pop('security_groups',
+                                                         [])
+        instance_rows.append(values)
+
+    session = get_session()
+    with session.begin():
+        # The security groups of every instance are looked up at once, the
+        # instances of a request usually share the same ones.
+        default_group = security_group_ensure_default(context)
+        group_ids = {'default': default_group['id']}
+        names = set()
+        for group_names in security_group_names.itervalues():
+            names.update(name for name in group_names if name != 'default')
+        if names:
+            for group in _security_group_get_by_names(context, session,
+                    context.project_id, list(names)):
+                group_ids[group['name']] = group['id']
+        security_group_rows = []
+        for instance_uuid, group_names in security_group_names.iteritems():
+            for name in group_names:
+                security_group_rows.append(
+                    {'instance_uuid': instance_uuid,
+                     'security_group_id': group_ids[name]})
+
+        # NOTE: The instances of the batch are not in the database yet, so
+        # their names are checked against each other as well. They share
+        # the project of the context either way.
+        check_batch = CONF.osapi_compute_unique_server_name_scope in (
+                'project', 'global')
+        names_in_batch = set()
+        for values in instance_rows:
+            if 'hostname' in values:
+                _validate_unique_server_name(context, session,
+                                             values['hostname'])
+                lowername = values['hostname'].lower()
+                if check_batch:
+                    if lowername in names_in_batch:
+                        raise exception.InstanceExists(name=lowername)
+                    names_in_batch.add(lowername)
+
+        bdm_rows = []
+        for values in instance_rows:
+            bdm_rows.extend(_block_device_mappings_for_create(
+                    block_device_mappings.get(values['uuid'], [])))
+
+        _bulk_insert(session, models.Instance, instance_rows)
+        _bulk_insert(session, models.InstanceInfoCache, info_cache_rows)
+        _bulk_insert(session, models.InstanceMetadata, metadata_rows)
+        _bulk_insert(session, models.InstanceSystemMetadata,
+                     system_metadata_rows)
+        _bulk_insert(session, models.SecurityGroupInstanceAssociation,
+                     security_group_rows)
+        _bulk_insert(session, models.BlockDeviceMapping, bdm_rows)
+        # create the instance uuid to ec2_id mapping entries
+        _bulk_insert(session, models.InstanceIdMapping,
+                     [{'uuid': values['uuid']} for values in instance_rows])
+
+    uuids = [values['uuid'] for values in instance_rows]
+    instances = dict((instance['uuid'], instance) for instance in
+                     _instance_get_all_query(context).
+                     filter(models.Instance.uuid.in_(uuids)).all())
+    return _instances_fill_metadata(context,
+                                    [instances[instance_uuid]
+                                     for instance_uuid in uuids])
+
+
 def _instance_data_get_for_user(context, project_id, user_id, session=None):
     result = model_query(context,
                          func.count(models.Instance.id),
@@ -1816,7 +2039,7 @@ def instance_get_all(context, columns_to_join=None):
 @require_context
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                                 limit=None, marker=None, columns_to_join=None,
-                                use_slave=False):
+                                use_slave=False, columns=None):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
     otherwise.
@@ -1849,28 +2072,152 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
         'soft_deleted' - modify behavior of 'deleted' to either
                          include or exclude instances whose
                          vm_state is SOFT_DELETED.
-    """
 
-    sort_fn = {'desc': desc, 'asc': asc}
+    Results are ordered on (sort_key, id) and paged with a keyset on
+    those columns: only the sort_key and id of the marker instance are
+    looked up, and the page starts right after them.
+
+    If columns is given, only those instance columns (plus 'id', 'uuid'
+    and the sort_key) are loaded and the instances are returned as plain
+    dicts.  Only the manually joined 'metadata', 'system_metadata' and
+    'pci_devices' can be requested in columns_to_join in that case.
+    """
 
     if CONF.database.slave_connection == '':
         use_slave = False
 
     session = get_session(use_slave=use_slave)
 
+    keyset = None
+    if marker is not None:
+        keyset = _instance_get_keyset(context, marker, sort_key, session)
+
+    return _instance_get_all_by_filters(context, session, filters,
+                                        sort_key, sort_dir, limit, keyset,
+                                        columns_to_join, columns)
+
+
+@require_context
+def instance_get_all_by_filters_chunked(context, filters, sort_key, sort_dir,
+                                        chunk_size=1000,
+                                        columns_to_join=None,
+                                        use_slave=False, columns=None):
+    """Yield the instances matching filters, chunk_size rows at a time.
+
+    Takes the same filters and options as instance_get_all_by_filters(),
+    but never holds more than one chunk of instances in memory.  Each
+    chunk is fetched with its own query, keyed on the (sort_key, id) of
+    the last instance of the previous chunk.
+    """
+    if CONF.database.slave_connection == '':
+        use_slave = False
+
+    keyset = None
+    while True:
+        session = get_session(use_slave=use_slave)
+        instances = _instance_get_all_by_filters(context, session, filters,
+                                                 sort_key, sort_dir,
+                                                 chunk_size, keyset,
+                                                 columns_to_join, columns)
+        for instance in instances:
+            yield instance
+        if len(instances) < chunk_size:
+            break
+        keyset = (instances[-1][sort_key], instances[-1]['id'])
+
+
+def _instance_get_keyset(context, uuid, sort_key, session):
+    """Return the (sort_key, id) values of the marker instance."""
+    result = model_query(context, getattr(models.Instance, sort_key),
+                         models.Instance.id, base_model=models.Instance,
+                         session=session, project_only=True).\
+                    filter(models.Instance.uuid == uuid).\
+                    first()
+    if not result:
+        raise exception.MarkerNotFound(uuid)
+    return tuple(result)
+
+
+def _instance_keyset_filter(query, sort_key, sort_dir, keyset, dialect):
+    """Restrict query to the instances sorted after keyset.
+
+    :param keyset: (sort_key, id) values of the last instance of the
+                   previous page
+    :param dialect: name of the database dialect, which decides where the
+                    NULL sort_key values are sorted
+    """
+    sort_value, id_value = keyset
+    id_column = models.Instance.id
+    after = operator.gt if sort_dir == 'asc' else operator.lt
+
+    if sort_key == 'id':
+        return query.filter(after(id_column, id_value))
+
+    # NOTE: NULLs are sorted as the smallest values by MySQL and SQLite,
+    # and as the largest values by PostgreSQL.
+    nulls_first = (sort_dir == 'asc') != (dialect == 'postgresql')
+
+    sort_column = getattr(models.Instance, sort_key)
+    if sort_value is None:
+        criteria = and_(sort_column == None, after(id_column, id_value))
+        if nulls_first:
+            # Every non NULL value is still to come
+            criteria = or_(sort_column != None, criteria)
+    else:
+        criteria = or_(after(sort_column, sort_value),
+                       and_(sort_column == sort_value,
+                            after(id_column, id_value)))
+        if not nulls_first:
+            # The NULL values are still to come
+            criteria = or_(criteria, sort_column == None)
+    return query.filter(criteria)
+
+
+def _instance_get_all_by_filters(context, session, filters, sort_key,
+                                 sort_dir, limit, keyset, columns_to_join,
+                                 columns):
+    sort_fn = {'desc': desc, 'asc': asc}[sort_dir]
+
     if columns_to_join is None:
         columns_to_join = ['info_cache', 'security_groups']
         manual_joins = ['metadata', 'system_metadata']
     else:
-        manual_joins, columns_to_join = _manual_join_columns(columns_to_join)
+        manual_joins, columns_to_join = _manual_join_columns(
+                list(columns_to_join))
 
-    query_prefix = session.query(models.Instance)
-    for column in columns_to_join:
-        query_prefix = query_prefix.options(joinedload(column))
+    if columns is None:
+        query_prefix = session.query(models.Instance)
+        for column in columns_to_join:
+            query_prefix = query_prefix.options(joinedload(column))
+    else:
+        columns = list(columns)
+        for column in ('id', 'uuid', sort_key):
+            if column not in columns:
+                columns.append(column)
+        query_prefix = session.query(
+                *[getattr(models.Instance, column) for column in columns])
+
+    query_prefix = _instance_filter_query(context, query_prefix, filters)
+
+    if keyset is not None:
+        query_prefix = _instance_keyset_filter(query_prefix, sort_key,
+                                               sort_dir, keyset,
+                                               session.bind.dialect.name)
+    query_prefix = query_prefix.order_by(
+            sort_fn(getattr(models.Instance, sort_key)))
+    if sort_key != 'id':
+        query_prefix = query_prefix.order_by(sort_fn(models.Instance.id))
+    if limit is not None:
+        query_prefix = query_prefix.limit(limit)
+
+    instances = query_prefix.all()
+    if columns is not None:
+        instances = [dict(zip(columns, row)) for row in instances]
+    return _instances_fill_metadata(context, instances, manual_joins)
 
-    query_prefix = query_prefix.order_by(sort_fn[sort_dir](
-            getattr(models.Instance, sort_key)))
 
+def _instance_filter_query(context, query_prefix, filters):
+    """Apply the instance_get_all_by_filters() filters to a query."""
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
     filters = filters.copy()
@@ -1896,7 +2243,7 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                     filter(models.Instance.deleted == models.Instance.id)
         else:
             query_prefix = query_prefix.\
-                    filter_by(deleted=0)
+                    filter(models.Instance.deleted == 0)
             if not filters.pop('soft_deleted', False):
                 query_prefix = query_prefix.\
                     filter(models.Instance.vm_state != vm_states.SOFT_DELETED)
@@ -1930,20 +2277,7 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                               models.InstanceMetadata,
                               models.InstanceMetadata.instance_uuid,
                               filters)
-
-    # paginate query
-    if marker is not None:
-        try:
-            marker = _instance_get_by_uuid(context, marker, session=session)
-        except exception.InstanceNotFound:
-            raise exception.MarkerNotFound(marker)
-    query_prefix = sqlalchemyutils.paginate_query(query_prefix,
-                           models.Instance, limit,
-                           [sort_key, 'created_at', 'id'],
-                           marker=marker,
-                           sort_dir=sort_dir)
-
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+    return query_prefix
 
 
 def tag_filter(context, query, model, model_metadata,
@@ -2295,6 +2629,39 @@ def _instance_update(context, instance_uuid, values, copy_old_instance=False,
     return (old_instance_ref, instance_ref)
 
 
+@require_admin_context
+def instance_update_power_states(context, host, power_states):
+    if not power_states:
+        return []
+
+    session = get_session()
+    updated = []
+    with session.begin():
+        instances = model_query(context, models.Instance, session=session).\
+                        filter_by(host=host).\
+                        filter_by(task_state=None).\
+                        filter(models.Instance.uuid.in_(power_states.keys())).\
+                        with_lockmode('update').\
+                        all()
+        for instance_ref in instances:
+            power_state = power_states[instance_ref['uuid']]
+            if instance_ref['power_state'] == power_state:
+                continue
+            old_instance_ref = copy.copy(instance_ref)
+            instance_ref['power_state'] = power_state
+            updated.append((old_instance_ref, instance_ref))
+
+    if not updated:
+        return []
+
+    new_instances = _instances_fill_metadata(
+            context, [instance_ref for _old, instance_ref in updated],
+            manual_joins=['system_metadata'])
+    return [(old_instance_ref, new_instance)
+            for (old_instance_ref, _ref), new_instance
+            in zip(updated, new_instances)]
+
+
 def instance_add_security_group(context, instance_uuid, security_group_id):
     """Associate the given security group with the given instance."""
     sec_group_ref = models.SecurityGroupInstanceAssociation()
@@ -2327,6 +2694,22 @@ def instance_info_cache_get(context, instance_uuid):
                          first()
 
 
+def _info_cache_values(values):
+    """Return the values of an info cache row, with its addresses.
+
+    The addresses rendered by the API are computed from network_info
+    once, when it is written, rather than each time it is read.
+    """
+    values = dict(values)
+    if 'network_info' in values:
+        addresses = None
+        if values['network_info'] is not None:
+            nw_info = network_model.NetworkInfo.hydrate(values['network_info'])
+            addresses = jsonutils.dumps(nw_info.addresses())
+        values['addresses'] = addresses
+    return values
+
+
 @require_context
 def instance_info_cache_update(context, instance_uuid, values):
     """Update an instance info cache record in the table.
@@ -2351,7 +2734,7 @@ def instance_info_cache_update(context, instance_uuid, values):
             values['instance_uuid'] = instance_uuid
 
         try:
-            info_cache.update(values)
+            info_cache.update(_info_cache_values(values))
         except db_exc.DBDuplicateEntry:
             # NOTE(sirp): Possible race if two greenthreads attempt to
             # recreate the instance cache entry at the same time. First one
@@ -5097,6 +5480,23 @@ def aggregate_host_get_by_metadata_key(context, key):
     return dict(metadata)
 
 
+def aggregate_host_metadata_get_all(context):
+    query = model_query(context, models.Aggregate)
+    query = query.join("_metadata")
+    query = query.options(contains_eager("_metadata"))
+    query = query.options(joinedload("_hosts"))
+    rows = query.all()
+
+    metadata = collections.defaultdict(lambda: collections.defaultdict(set))
+    for agg in rows:
+        for agghost in agg._hosts:
+            host_metadata = metadata[agghost.host]
+            for kv in agg._metadata:
+                host_metadata[kv['key']].add(kv['value'])
+    return dict((host, dict(host_metadata))
+                for host, host_metadata in metadata.iteritems())
+
+
 def aggregate_update(context, aggregate_id, values):
     session = get_session()
     aggregate = (_aggregate_get_query(context,
@@ -0,0 +1,45 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index
+from sqlalchemy import MetaData
+from sqlalchemy import Table
+
+
+INDEX_NAME = 'instances_deleted_created_at_idx'
+
+
+def upgrade(engine):
+    meta = MetaData()
+    meta.bind = engine
+
+    # Instance listings are sorted on (created_at, id) by default and
+    # paged with a keyset on those columns, so index them together with
+    # the deleted flag every listing filters on.
+    instances = Table('instances', meta, autoload=True)
+    index = Index(INDEX_NAME, instances.c.deleted, instances.c.created_at,
+                  instances.c.id)
+    index.create(engine)
+
+
+def downgrade(engine):
+    meta = MetaData()
+    meta.bind = engine
+
+    instances = Table('instances', meta, autoload=True)
+    for index in instances.indexes:
+        if index.name == INDEX_NAME:
+            index.drop(engine)
+            break
@@ -0,0 +1,49 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column
+from sqlalchemy import dialects
+from sqlalchemy import MetaData
+from sqlalchemy import Table
+from sqlalchemy import Text
+
+
+def MediumText():
+    return Text().with_variant(dialects.mysql.MEDIUMTEXT(), 'mysql')
+
+
+def upgrade(engine):
+    meta = MetaData()
+    meta.bind = engine
+
+    # Add an addresses column next to network_info.  It holds the addresses
+    # rendered by the API, computed from network_info when the cache is
+    # written.  Existing rows are left empty, the API falls back to
+    # network_info for them until the cache is next refreshed.
+    table_names = ('instance_info_caches', 'shadow_instance_info_caches')
+    for table_name in table_names:
+        table = Table(table_name, meta, autoload=True)
+        addresses = Column('addresses', MediumText())
+        table.create_column(addresses)
+
+
+def downgrade(engine):
+    meta = MetaData()
+    meta.bind = engine
+
+    table_names = ('instance_info_caches', 'shadow_instance_info_caches')
+    for table_name in table_names:
+        table = Table(table_name, meta, autoload=True)
+        table.drop_column('addresses')
@@ -166,6 +166,8 @@ class Instance(BASE, NovaBase):
               'host', 'node', 'deleted'),
         Index('instances_host_deleted_cleaned_idx',
               'host', 'deleted', 'cleaned'),
+        Index('instances_deleted_created_at_idx',
+              'deleted', 'created_at', 'id'),
     )
     injected_files = []
 
@@ -302,6 +304,10 @@ class InstanceInfoCache(BASE, NovaBase):
     # text column used for storing a json object of network data for api
     network_info = Column(MediumText())
 
+    # text column used for storing a json object of the addresses rendered
+    # by the api, computed from network_info
+    addresses = Column(MediumText())
+
     instance_uuid = Column(String(36), ForeignKey('instances.uuid'),
                            nullable=False)
     instance = relationship(Instance,
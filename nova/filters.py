@@ -47,6 +47,12 @@ class BaseFilter(object):
     # for each request rather than for each instance
     run_filter_once_per_request = False
 
+    # Set to true in a subclass if, within a request, the result of the
+    # filter for an object can only change when that object is the one
+    # chosen for the previous instance (e.g. because resources have been
+    # consumed from it), so results for the other objects can be reused
+    invariant_unless_chosen = False
+
     def run_filter_for_index(self, index):
         """Return True if the filter needs to be run for the "index-th"
         instance in a request.  Only need to override this if a filter
@@ -57,6 +63,14 @@ class BaseFilter(object):
         else:
             return True
 
+    @classmethod
+    def invariant_across_instances(cls):
+        """Return True if the result of the filter for an object only needs
+        to be recomputed for the object chosen for the previous instance
+        in a request.
+        """
+        return cls.run_filter_once_per_request or cls.invariant_unless_chosen
+
 
 class BaseFilterHandler(loadables.BaseLoader):
     """Base class to handle loading filter classes.
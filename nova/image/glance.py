@@ -18,12 +18,15 @@
 from __future__ import absolute_import
 
 import copy
+import hashlib
 import itertools
 import json
+import os
 import random
 import sys
 import time
 
+import eventlet
 import glanceclient
 import glanceclient.exc
 from oslo.config import cfg
@@ -33,9 +36,11 @@ import six.moves.urllib.parse as urlparse
 from nova import exception
 import nova.image.download as image_xfers
 from nova.openstack.common.gettextutils import _
+from nova.openstack.common import fileutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
+from nova.openstack.common import units
 from nova import utils
 
 
@@ -67,6 +72,16 @@ glance_opts = [
                 help='A list of url scheme that can be downloaded directly '
                      'via the direct_url.  Currently supported schemes: '
                      '[file].'),
+    cfg.IntOpt('glance_download_workers',
+               default=1,
+               help='Number of byte ranges of an image downloaded '
+                    'concurrently from the glance api servers. Ranged '
+                    'downloads are resumed after a failure. Set to 1 to '
+                    'download images sequentially'),
+    cfg.IntOpt('glance_download_range_size',
+               default=64,
+               help='Size in MB of the byte ranges of ranged image '
+                    'downloads'),
     ]
 
 LOG = logging.getLogger(__name__)
@@ -141,6 +156,24 @@ def _create_glance_client(context, host, port, use_ssl, version=1):
     return glanceclient.Client(str(version), endpoint, **params)
 
 
+class _RangeNotSupported(Exception):
+    pass
+
+
+def _get_image_range(context, host, port, use_ssl, image_id, start, end):
+    """Return an iterator over the bytes start to end of an image.
+
+    :raises _RangeNotSupported: if glance sent the whole image instead
+    """
+    client = _create_glance_client(context, host, port, use_ssl)
+    resp, body = client.http_client.raw_request(
+        'GET', '/v1/images/%s' % urlparse.quote(str(image_id)),
+        headers={'Range': 'bytes=%d-%d' % (start, end)})
+    if resp.status != 206:
+        raise _RangeNotSupported()
+    return body
+
+
 def get_api_servers():
     """Shuffle a list of CONF.glance_api_servers and return an iterator
     that will cycle through the list, looping around to the beginning
@@ -321,6 +354,159 @@ class GlanceImageService(object):
                 "for %(scheme)s") % {'scheme': scheme})
         return
 
+    def _read_range_state(self, state_path, image):
+        """Return the ranges already written by a previous download."""
+        try:
+            with open(state_path) as f:
+                state = jsonutils.loads(f.read())
+        except (IOError, ValueError):
+            return set()
+        if (state.get('id') != image.id or state.get('size') != image.size
+                or state.get('checksum') != image.checksum):
+            return set()
+        return set(state.get('done', []))
+
+    def _write_range_state(self, state_path, image, done):
+        with open(state_path, 'w') as f:
+            f.write(jsonutils.dumps({'id': image.id,
+                                     'size': image.size,
+                                     'checksum': image.checksum,
+                                     'done': sorted(done)}))
+
+    def _download_range(self, context, image_id, dst_path, start, end,
+                        api_servers):
+        """Write the bytes start to end of an image to dst_path.
+
+        Failed transfers are retried from the last byte written, on the
+        next glance api server, according to CONF.glance_num_retries.
+        """
+        retry_excs = (glanceclient.exc.ServiceUnavailable,
+                      glanceclient.exc.InvalidEndpoint,
+                      glanceclient.exc.CommunicationError,
+                      IOError)
+        num_attempts = 1 + CONF.glance_num_retries
+        offset = start
+        for attempt in xrange(1, num_attempts + 1):
+            host, port, use_ssl = api_servers.next()
+            try:
+                body = _get_image_range(context, host, port, use_ssl,
+                                        image_id, offset, end)
+                with open(dst_path, 'r+b') as f:
+                    f.seek(offset)
+                    for chunk in body:
+                        f.write(chunk)
+                        offset += len(chunk)
+                if offset <= end:
+                    raise IOError(_('Range ended after %(got)d of '
+                                    '%(expected)d bytes') %
+                                  {'got': offset - start,
+                                   'expected': end + 1 - start})
+                return start
+            except retry_excs as e:
+                if attempt == num_attempts:
+                    raise exception.GlanceConnectionFailed(
+                            host=host, port=port, reason=str(e))
+                LOG.warn(_("Error downloading bytes %(start)d-%(end)d of "
+                           "image %(image)s from glance server "
+                           "'%(host)s:%(port)s', retrying: %(error)s"),
+                         {'start': offset, 'end': end, 'image': image_id,
+                          'host': host, 'port': port, 'error': e})
+
+    def _download_ranges(self, context, image_id, dst_path):
+        """Download an image to dst_path with concurrent range requests.
+
+        The ranges are spread over CONF.glance_api_servers and written into
+        a file preallocated to the size of the image.  The ranges which have
+        been fully written are recorded next to dst_path, so that a download
+        which failed is resumed by the next call instead of restarting.
+
+        :returns: False if the image could not be downloaded by ranges, in
+                  which case nothing is left at dst_path.
+        """
+        try:
+            image = self._client.call(context, 1, 'get', image_id)
+        except Exception:
+            _reraise_translated_image_exception(image_id)
+        if not getattr(image, 'size', None):
+            return False
+
+        range_size = CONF.glance_download_range_size * units.Mi
+        ranges = [(start, min(start + range_size, image.size) - 1)
+                  for start in xrange(0, image.size, range_size)]
+        state_path = dst_path + '.ranges'
+        done = set()
+        if os.path.exists(dst_path):
+            done = self._read_range_state(state_path, image)
+        if done:
+            LOG.info(_('Resuming the download of image %(image)s, '
+                       '%(done)d of %(total)d ranges already downloaded'),
+                     {'image': image_id, 'done': len(done),
+                      'total': len(ranges)})
+        todo = [(start, end) for start, end in ranges if start not in done]
+
+        api_servers = get_api_servers()
+        if todo and not done:
+            # NOTE: Check that glance honours range requests with the first
+            # range before starting the other ones.
+            start, end = todo.pop(0)
+            with open(dst_path, 'wb') as f:
+                f.truncate(image.size)
+            try:
+                self._download_range(context, image_id, dst_path, start, end,
+                                     api_servers)
+            except _RangeNotSupported:
+                fileutils.delete_if_exists(dst_path)
+                return False
+            except Exception:
+                _reraise_translated_image_exception(image_id)
+            done.add(start)
+            self._write_range_state(state_path, image, done)
+
+        # NOTE: The ranges are spread over all the glance api servers, some
+        # of which may not honour range requests.  The first failure stops
+        # the ranges not started yet, and is only raised once the running
+        # ones are over so that nothing writes to dst_path afterwards.
+        failures = []
+
+        def download_range(r):
+            if failures:
+                return None
+            try:
+                return self._download_range(context, image_id, dst_path,
+                                            r[0], r[1], api_servers)
+            except Exception:
+                failures.append(sys.exc_info())
+                return None
+
+        pool = eventlet.GreenPool(CONF.glance_download_workers)
+        for start in pool.imap(download_range, todo):
+            if start is not None:
+                done.add(start)
+                self._write_range_state(state_path, image, done)
+
+        if failures:
+            exc_type, exc_value, exc_trace = failures[0]
+            if isinstance(exc_value, _RangeNotSupported):
+                fileutils.delete_if_exists(dst_path)
+                fileutils.delete_if_exists(state_path)
+                return False
+            new_exc = _translate_image_exception(image_id, exc_value)
+            raise new_exc, None, exc_trace
+
+        if image.checksum:
+            checksum = hashlib.md5()
+            with open(dst_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(units.Mi), b''):
+                    checksum.update(chunk)
+            if checksum.hexdigest() != image.checksum:
+                fileutils.delete_if_exists(dst_path)
+                fileutils.delete_if_exists(state_path)
+                raise exception.ImageUnacceptable(image_id=image_id,
+                    reason=_('checksum of the downloaded image does not '
+                             'match'))
+        fileutils.delete_if_exists(state_path)
+        return True
+
     def download(self, context, image_id, data=None, dst_path=None):
         """Calls out to Glance for data and writes data."""
         if CONF.allowed_direct_url_schemes and dst_path is not None:
@@ -340,6 +526,13 @@ class GlanceImageService(object):
                     except Exception as ex:
                         LOG.exception(ex)
 
+        if (CONF.glance_download_workers > 1 and data is None and
+                dst_path is not None):
+            if self._download_ranges(context, image_id, dst_path):
+                return
+            LOG.debug(_('Glance does not support range requests, '
+                        'downloading image %s sequentially'), image_id)
+
         try:
             image_chunks = self._client.call(context, 1, 'data', image_id)
         except Exception:
@@ -0,0 +1,182 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Bounded in process replacement for a memcache client.
+
+This is used instead of nova.openstack.common.memorycache.Client when no
+memcached_servers are configured.  Expired keys are found through a heap
+of expiry times rather than by going through all the keys on each lookup,
+and the least recently used keys are evicted once the cache is full.
+"""
+
+import collections
+import heapq
+import threading
+
+from oslo.config import cfg
+
+from nova.openstack.common import timeutils
+
+memorycache_opts = [
+    cfg.IntOpt('memorycache_max_entries',
+               default=0,
+               help='Maximum number of keys kept by the in process caches '
+                    'of EC2 ids and availability zones, the least recently '
+                    'used keys are evicted first. 0 means no limit.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(memorycache_opts)
+CONF.import_opt('memcached_servers', 'nova.openstack.common.memorycache')
+
+
+def get_client(memcached_servers=None, max_entries=0):
+    """Returns a memcache client, or an in process Client.
+
+    :param memcached_servers: the memcached servers to use, defaults to the
+                              memcached_servers option
+    :param max_entries: the maximum number of keys of an in process Client,
+                        0 means no limit. Only callers whose keys can be
+                        recomputed should set it.
+    """
+    if not memcached_servers:
+        memcached_servers = CONF.memcached_servers
+    if memcached_servers:
+        try:
+            import memcache
+            return memcache.Client(memcached_servers, debug=0)
+        except ImportError:
+            pass
+
+    return Client(max_entries=max_entries)
+
+
+class Client(object):
+    """Replicates a tiny subset of memcached client interface."""
+
+    def __init__(self, *args, **kwargs):
+        """Ignores the passed in args, but max_entries."""
+        self.max_entries = kwargs.get('max_entries', 0)
+        # key -> [timeout, value, last use]
+        self.cache = {}
+        self._uses = 0
+        # (last use, key) of the keys in least recently used order, and
+        # (timeout, key) of the keys with a timeout.  Both may hold outdated
+        # entries for keys used, set or deleted since, which are skipped.
+        self._lru = collections.deque()
+        self._timeouts = []
+        self._lock = threading.Lock()
+        self._stats = {'get_hits': 0,
+                       'get_misses': 0,
+                       'evictions': 0,
+                       'expirations': 0}
+
+    def _use(self, key, entry):
+        self._uses += 1
+        entry[2] = self._uses
+        self._lru.append((self._uses, key))
+
+    def _expire(self):
+        now = timeutils.utcnow_ts()
+        while self._timeouts and self._timeouts[0][0] <= now:
+            timeout, key = heapq.heappop(self._timeouts)
+            entry = self.cache.get(key)
+            if entry is not None and entry[0] == timeout:
+                del self.cache[key]
+                self._stats['expirations'] += 1
+
+    def _evict(self):
+        while len(self.cache) > self.max_entries:
+            use, key = self._lru.popleft()
+            entry = self.cache.get(key)
+            if entry is not None and entry[2] == use:
+                del self.cache[key]
+                self._stats['evictions'] += 1
+
+    def _compact(self):
+        """Drop the outdated entries of the lru queue and timeout heap."""
+        if len(self._lru) > 2 * len(self.cache) + 64:
+            self._lru = collections.deque(sorted(
+                (entry[2], key) for key, entry in self.cache.iteritems()))
+        if len(self._timeouts) > 2 * len(self.cache) + 64:
+            self._timeouts = [(entry[0], key)
+                              for key, entry in self.cache.iteritems()
+                              if entry[0]]
+            heapq.heapify(self._timeouts)
+
+    def _get(self, key):
+        self._expire()
+        entry = self.cache.get(key)
+        if entry is None:
+            self._stats['get_misses'] += 1
+            return None
+        self._use(key, entry)
+        self._stats['get_hits'] += 1
+        self._compact()
+        return entry[1]
+
+    def _set(self, key, value, time):
+        timeout = 0
+        if time != 0:
+            timeout = timeutils.utcnow_ts() + time
+            heapq.heappush(self._timeouts, (timeout, key))
+        entry = [timeout, value, 0]
+        self.cache[key] = entry
+        self._use(key, entry)
+
+        self._expire()
+        if self.max_entries > 0:
+            self._evict()
+        self._compact()
+        return True
+
+    def get(self, key):
+        """Retrieves the value for a key or None."""
+        with self._lock:
+            return self._get(key)
+
+    def set(self, key, value, time=0, min_compress_len=0):
+        """Sets the value for a key."""
+        with self._lock:
+            return self._set(key, value, time)
+
+    def add(self, key, value, time=0, min_compress_len=0):
+        """Sets the value for a key if it doesn't exist."""
+        with self._lock:
+            if self._get(key) is not None:
+                return False
+            return self._set(key, value, time)
+
+    def incr(self, key, delta=1):
+        """Increments the value for a key."""
+        with self._lock:
+            value = self._get(key)
+            if value is None:
+                return None
+            new_value = int(value) + delta
+            self.cache[key][1] = str(new_value)
+            return new_value
+
+    def delete(self, key, time=0):
+        """Deletes the value associated with a key."""
+        with self._lock:
+            self.cache.pop(key, None)
+
+    def get_stats(self):
+        """Returns the cache statistics like memcache.Client does."""
+        with self._lock:
+            self._expire()
+            stats = dict(self._stats, curr_items=len(self.cache))
+        return [('memorycache', stats)]
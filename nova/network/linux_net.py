@@ -19,9 +19,12 @@
 
 import calendar
 import inspect
+import itertools
 import os
 import re
+import tempfile
 
+from eventlet import greenthread
 import netaddr
 from oslo.config import cfg
 import six
@@ -64,6 +67,13 @@ linux_net_opts = [
     cfg.IntOpt('dhcp_lease_time',
                default=120,
                help='Lifetime of a DHCP lease in seconds'),
+    cfg.FloatOpt('dhcp_hosts_update_delay',
+                 default=0.0,
+                 help='Number of seconds to wait for further fixed IPs to '
+                      'be added to a network before writing its dnsmasq '
+                      'hosts file and reloading dnsmasq, so that bursts of '
+                      'allocations are applied together. 0 applies them '
+                      'immediately'),
     cfg.MultiStrOpt('dns_server',
                     default=[],
                     help='If set, uses specific DNS server for dnsmasq. Can'
@@ -122,6 +132,28 @@ linux_net_opts = [
                default='DROP',
                help=('The table that iptables to jump to when a packet is '
                      'to be dropped.')),
+    cfg.BoolOpt('iptables_incremental_apply',
+                default=False,
+                help='Only send the wrapped chains that changed since the '
+                     'last apply through iptables-restore --noflush, '
+                     'instead of rewriting every nova table'),
+    cfg.IntOpt('iptables_full_apply_interval',
+               default=600,
+               help='With iptables_incremental_apply, number of seconds '
+                    'after which the next apply rewrites every nova table '
+                    'again, restoring the rules removed from outside of '
+                    'nova, such as the jumps to the nova chains. The first '
+                    'apply after start always rewrites them. 0 disables '
+                    'the periodic rewrite'),
+    cfg.FloatOpt('iptables_apply_delay',
+                 default=0.0,
+                 help='Number of seconds to wait for further rule changes '
+                      'before applying them, so that bursts of changes are '
+                      'applied together. The rules are then applied in the '
+                      'background, so they may not be in place yet when a '
+                      'change returns, except for the filters of new '
+                      'instances, which are in place before the instances '
+                      'start. 0 applies them immediately'),
     cfg.IntOpt('ovs_vsctl_timeout',
                default=120,
                help='Amount of time, in seconds, that ovs_vsctl should wait '
@@ -353,6 +385,13 @@ class IptablesManager(object):
         self.ipv6 = {'filter': IptablesTable()}
 
         self.iptables_apply_deferred = False
+        self._apply_timer = None
+
+        # The rules last applied by _apply(), per command and table, used
+        # to work out which chains changed in incremental mode, and the
+        # time of the last full apply per command.
+        self._applied_state = {'iptables': {}, 'ip6tables': {}}
+        self._last_full_apply = {}
 
         # Add a nova-filter-top chain. It's intended to be shared
         # among the various nova components. It sits at the very top
@@ -422,12 +461,41 @@ class IptablesManager(object):
         return False
 
     def apply(self):
+        if self.iptables_apply_deferred:
+            return
+        if not self.dirty():
+            LOG.debug(_("Skipping apply due to lack of new rules"))
+        elif CONF.iptables_apply_delay > 0:
+            # Coalesce the changes made until the timer fires into a
+            # single apply.
+            if self._apply_timer is None:
+                self._apply_timer = greenthread.spawn_after(
+                        CONF.iptables_apply_delay, self._apply_delayed)
+        else:
+            self._apply()
+
+    def apply_now(self):
+        """Apply the pending rule changes before returning.
+
+        Unlike apply(), this does not wait for iptables_apply_delay, for
+        the callers that need the rules in place when it returns.
+        """
+        if self._apply_timer is not None:
+            self._apply_timer.cancel()
+            self._apply_timer = None
         if self.iptables_apply_deferred:
             return
         if self.dirty():
             self._apply()
-        else:
-            LOG.debug(_("Skipping apply due to lack of new rules"))
+
+    def _apply_delayed(self):
+        self._apply_timer = None
+        if self.iptables_apply_deferred or not self.dirty():
+            return
+        try:
+            self._apply()
+        except Exception:
+            LOG.exception(_("Failed to apply iptables rules"))
 
     @utils.synchronized('iptables', external=True)
     def _apply(self):
@@ -437,12 +505,34 @@ class IptablesManager(object):
         same component of Nova, and replace them with our current set of
         rules. This happens atomically, thanks to iptables-restore.
 
+        With iptables_incremental_apply, only the wrapped chains that
+        changed since the last apply are rewritten, as long as the chains
+        themselves and the unwrapped rules are unchanged.
+
         """
         s = [('iptables', self.ipv4)]
         if CONF.use_ipv6:
             s += [('ip6tables', self.ipv6)]
 
         for cmd, tables in s:
+            applied_state = self._applied_state[cmd]
+            states = dict((table_name, self._table_state(table))
+                          for table_name, table in tables.iteritems())
+            if (CONF.iptables_incremental_apply and
+                    not self._full_apply_due(cmd)):
+                lines = self._changed_chains_lines(tables, applied_state,
+                                                   states)
+                if lines is not None:
+                    if lines:
+                        self.execute('%s-restore' % (cmd,), '-c',
+                                     '--noflush', run_as_root=True,
+                                     process_input='\n'.join(lines),
+                                     attempts=5)
+                    for table in tables.itervalues():
+                        table.dirty = False
+                    applied_state.update(states)
+                    continue
+
             all_tables, _err = self.execute('%s-save' % (cmd,), '-c',
                                                 run_as_root=True,
                                                 attempts=5)
@@ -455,8 +545,72 @@ class IptablesManager(object):
             self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
                          process_input='\n'.join(all_lines),
                          attempts=5)
+            applied_state.update(states)
+            self._last_full_apply[cmd] = timeutils.utcnow()
         LOG.debug(_("IPTablesManager.apply completed with success"))
 
+    def _full_apply_due(self, cmd):
+        """Whether the next apply has to rewrite every nova table.
+
+        Incremental applies only rewrite the wrapped chains, so the rules
+        outside of them are only restored by full applies.
+        """
+        last_full_apply = self._last_full_apply.get(cmd)
+        if last_full_apply is None:
+            return True
+        interval = CONF.iptables_full_apply_interval
+        return interval > 0 and timeutils.is_older_than(last_full_apply,
+                                                        interval)
+
+    def _table_state(self, table):
+        """Return a comparable snapshot of the rules of a table.
+
+        Returns a tuple of the unwrapped chains, the unwrapped rules and a
+        dict of the rule lines of every wrapped chain, in the order
+        _modify_rules() writes them.
+        """
+        wrapped = dict((chain, []) for chain in table.chains)
+        unwrapped = []
+        # top rules go first, the sort is stable otherwise
+        for rule in sorted(table.rules, key=lambda rule: not rule.top):
+            if rule.wrap:
+                wrapped.setdefault(rule.chain, []).append(str(rule))
+            else:
+                unwrapped.append((rule.chain, rule.rule, rule.top))
+        return (frozenset(table.unwrapped_chains), unwrapped, wrapped)
+
+    def _changed_chains_lines(self, tables, applied_state, states):
+        """Return iptables-restore --noflush input for the changed chains.
+
+        Declaring a chain in iptables-restore input flushes it, so each
+        changed wrapped chain is declared and refilled.  Returns None if
+        the change can't be applied that way and a full apply is needed.
+        """
+        lines = []
+        for table_name, table in tables.iteritems():
+            if table.remove_chains or table.remove_rules:
+                return None
+            old_state = applied_state.get(table_name)
+            if old_state is None:
+                return None
+            old_chains, old_unwrapped, old_wrapped = old_state
+            new_chains, new_unwrapped, new_wrapped = states[table_name]
+            if (old_chains != new_chains or old_unwrapped != new_unwrapped or
+                    set(old_wrapped) != set(new_wrapped)):
+                return None
+
+            changed = [chain for chain in sorted(new_wrapped)
+                       if new_wrapped[chain] != old_wrapped[chain]]
+            if not changed:
+                continue
+            lines.append('*%s' % table_name)
+            for chain in changed:
+                lines.append(':%s-%s - [0:0]' % (binary_name, chain))
+            for chain in changed:
+                lines.extend(new_wrapped[chain])
+            lines.append('COMMIT')
+        return lines
+
     def _find_table(self, lines, table_name):
         if len(lines) < 3:
             # length only <2 when fake iptables
@@ -627,8 +781,28 @@ class IptablesManager(object):
 # NOTE(jkoelker) This is just a nice little stub point since mocking
 #                builtins with mox is a nightmare
 def write_to_file(file, data, mode='w'):
-    with open(file, mode) as f:
-        f.write(data)
+    if mode != 'w':
+        with open(file, mode) as f:
+            f.write(data)
+        return
+
+    # NOTE: Write a temporary file next to the file and rename it over the
+    #       file, so that dnsmasq and radvd never read a partial file when
+    #       they reload it.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file),
+                                    prefix='.%s.' % os.path.basename(file))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        # mkstemp() creates the file readable by its owner only
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, file)
+    except Exception:
+        with excutils.save_and_reraise_exception():
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
 
 
 def metadata_forward():
@@ -891,22 +1065,44 @@ def get_dhcp_leases(context, network_ref):
     return '\n'.join(hosts)
 
 
-def get_dhcp_hosts(context, network_ref):
-    """Get network's hosts config in dhcp-host format."""
-    hosts = []
+def _get_dhcp_host_entries(context, network_ref):
+    """Get network's dhcp-host entries, keyed by fixed ip address."""
+    entries = {}
     host = None
     if network_ref['multi_host']:
         host = CONF.host
-    macs = set()
     for fixedip in fixed_ip_obj.FixedIPList.get_by_network(context,
                                                            network_ref,
                                                            host=host):
-        if fixedip.virtual_interface.address not in macs:
-            hosts.append(_host_dhcp(fixedip))
-            macs.add(fixedip.virtual_interface.address)
+        entries[str(fixedip.address)] = _dhcp_host_entry(fixedip)
+    return entries
+
+
+# NOTE: Orders the dhcp-host entries by the time they were added, the
+#       first entry of a mac address is the one written to the hosts file.
+_dhcp_host_seq = itertools.count()
+
+
+def _dhcp_host_entry(fixedip):
+    return (next(_dhcp_host_seq), fixedip.virtual_interface.address,
+            _host_dhcp(fixedip))
+
+
+def _render_dhcp_hosts(entries):
+    hosts = []
+    macs = set()
+    for _seq, mac, host in sorted(entries.itervalues()):
+        if mac not in macs:
+            hosts.append(host)
+            macs.add(mac)
     return '\n'.join(hosts)
 
 
+def get_dhcp_hosts(context, network_ref):
+    """Get network's hosts config in dhcp-host format."""
+    return _render_dhcp_hosts(_get_dhcp_host_entries(context, network_ref))
+
+
 def get_dns_hosts(context, network_ref):
     """Get network's DNS hosts in hosts format."""
     hosts = []
@@ -992,12 +1188,90 @@ def release_dhcp(dev, address, mac_address):
     utils.execute('dhcp_release', dev, address, mac_address, run_as_root=True)
 
 
+# NOTE: The dhcp-host entries of the networks served by this host, per
+#       device, so that a fixed ip can be added or removed without building
+#       the hosts file of the whole network from the database again.
+_dhcp_hosts = {}
+_dhcp_hosts_timers = {}
+
+
 def update_dhcp(context, dev, network_ref):
+    entries = _get_dhcp_host_entries(context, network_ref)
+    _cancel_dhcp_hosts_timer(dev)
+    _dhcp_hosts[dev] = entries
     conffile = _dhcp_file(dev, 'conf')
-    write_to_file(conffile, get_dhcp_hosts(context, network_ref))
+    write_to_file(conffile, _render_dhcp_hosts(entries))
     restart_dhcp(context, dev, network_ref)
 
 
+def add_dhcp_host(context, dev, network_ref, fixedip):
+    """Add a fixed ip to the dnsmasq hosts file of a network.
+
+    The fixed ip needs its virtual_interface and instance. Additions made
+    within dhcp_hosts_update_delay are written and reloaded together.
+
+    """
+    entries = _dhcp_hosts.get(dev)
+    if entries is None:
+        update_dhcp(context, dev, network_ref)
+        return
+    address = str(fixedip.address)
+    entry = _dhcp_host_entry(fixedip)
+    if address in entries:
+        # Keep the position of the entry
+        entry = (entries[address][0],) + entry[1:]
+    entries[address] = entry
+    if CONF.dhcp_hosts_update_delay > 0:
+        if dev not in _dhcp_hosts_timers:
+            _dhcp_hosts_timers[dev] = greenthread.spawn_after(
+                    CONF.dhcp_hosts_update_delay, _flush_dhcp_hosts_delayed,
+                    context, dev, network_ref)
+    else:
+        _flush_dhcp_hosts(context, dev, network_ref)
+
+
+def remove_dhcp_host(context, dev, network_ref, fixedip):
+    """Remove a fixed ip from the dnsmasq hosts file of a network.
+
+    This is never delayed, the address must not be leased again once it is
+    released.
+
+    """
+    entries = _dhcp_hosts.get(dev)
+    if entries is None:
+        update_dhcp(context, dev, network_ref)
+        return
+    entries.pop(str(fixedip.address), None)
+    _flush_dhcp_hosts(context, dev, network_ref)
+
+
+def _cancel_dhcp_hosts_timer(dev):
+    timer = _dhcp_hosts_timers.pop(dev, None)
+    if timer is not None:
+        timer.cancel()
+
+
+def _flush_dhcp_hosts(context, dev, network_ref):
+    """Write the hosts file of a device from its entries and reload it."""
+    _cancel_dhcp_hosts_timer(dev)
+    conffile = _dhcp_file(dev, 'conf')
+    write_to_file(conffile, _render_dhcp_hosts(_dhcp_hosts[dev]))
+    restart_dhcp(context, dev, network_ref)
+
+
+# NOTE: This runs outside of the network setup of the manager, which
+#       holds this lock while updating the dnsmasq files.
+@utils.synchronized('setup_network', external=True)
+def _flush_dhcp_hosts_delayed(context, dev, network_ref):
+    _dhcp_hosts_timers.pop(dev, None)
+    if dev not in _dhcp_hosts:
+        return
+    try:
+        _flush_dhcp_hosts(context, dev, network_ref)
+    except Exception:
+        LOG.exception(_("Failed to update dnsmasq hosts for %s"), dev)
+
+
 def update_dns(context, dev, network_ref):
     hostsfile = _dhcp_file(dev, 'hosts')
     write_to_file(hostsfile, get_dns_hosts(context, network_ref))
@@ -1005,11 +1279,15 @@ def update_dns(context, dev, network_ref):
 
 
 def update_dhcp_hostfile_with_text(dev, hosts_text):
+    _cancel_dhcp_hosts_timer(dev)
+    _dhcp_hosts.pop(dev, None)
     conffile = _dhcp_file(dev, 'conf')
     write_to_file(conffile, hosts_text)
 
 
 def kill_dhcp(dev):
+    _cancel_dhcp_hosts_timer(dev)
+    _dhcp_hosts.pop(dev, None)
     pid = _dnsmasq_pid_for(dev)
     if pid:
         # Check that the process exists and looks like a dnsmasq process
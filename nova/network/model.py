@@ -350,6 +350,39 @@ class NetworkInfo(list):
         """Returns all floating_ips."""
         return [ip for vif in self for ip in vif.floating_ips()]
 
+    def addresses(self):
+        """Returns the addresses of the VIFs grouped by network label.
+
+        This is the compact form rendered by the API::
+
+            {'public': {
+                 'ips': [{'address': '10.0.0.1',
+                          'version': 4,
+                          'type': 'fixed',
+                          'mac_address': 'aa:aa:aa:aa:aa:aa'}],
+                 'floating_ips': [{'address': '172.16.0.1',
+                                   'version': 4,
+                                   'type': 'floating',
+                                   'mac_address': 'aa:aa:aa:aa:aa:aa'}]},
+             ...}
+
+        Only plain types are used, so the result can be stored as JSON
+        next to the network info and used without hydrating it.
+        """
+        networks = {}
+        for vif in self:
+            label = vif['network']['label']
+            network = networks.setdefault(label,
+                                          {'ips': [], 'floating_ips': []})
+            for key, ips in (('ips', vif.fixed_ips()),
+                             ('floating_ips', vif.floating_ips())):
+                network[key].extend({'address': ip['address'],
+                                     'version': ip['version'],
+                                     'type': ip['type'],
+                                     'mac_address': vif['address']}
+                                    for ip in ips)
+        return networks
+
     @classmethod
     def hydrate(cls, network_info):
         if isinstance(network_info, six.string_types):
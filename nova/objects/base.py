@@ -17,6 +17,7 @@
 import collections
 import copy
 import functools
+import hashlib
 
 import netaddr
 from oslo import messaging
@@ -26,6 +27,7 @@ from nova import context
 from nova import exception
 from nova.objects import fields
 from nova.openstack.common.gettextutils import _
+from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import versionutils
 
@@ -116,6 +118,88 @@ def remotable_classmethod(fn):
     return classmethod(wrapper)
 
 
+# Bytes left out of delta object actions, per object type.  Counted on
+# both sides: the caller for the request, the conductor for the reply.
+delta_bytes_saved = collections.defaultdict(int)
+
+
+def obj_field_digest(primitive):
+    """Return the digest and serialized size of a field primitive.
+
+    See NovaObject.obj_make_delta().
+    """
+    data = jsonutils.dumps(primitive, sort_keys=True)
+    return hashlib.md5(data).hexdigest(), len(data)
+
+
+def _obj_apply_updates(obj, updates):
+    """Apply the updates returned by a remote object action to obj."""
+    for key, value in updates.iteritems():
+        if key in obj.fields:
+            field = obj.fields[key]
+            obj[key] = field.from_primitive(obj, key, value)
+    obj.obj_reset_changes()
+    obj._changed_fields = set(updates.get('obj_what_changed', []))
+
+
+def _obj_action_error(method, error):
+    """Rebuild the exception described by an object_action_multi error."""
+    name = error['class']
+    # NOTE: Exceptions raised through RPC are re-created on the client
+    # side in a subclass with this suffix.
+    if name.endswith('_Remote'):
+        name = name[:-len('_Remote')]
+    exc_class = getattr(exception, name, None)
+    if (isinstance(exc_class, type) and
+            issubclass(exc_class, exception.NovaException)):
+        return exc_class(message=error['message'])
+    return exception.ObjectActionError(action=method,
+                                       reason=error['message'])
+
+
+def obj_action_multi(context, objs, method, args=(), kwargs=None):
+    """Call the remotable method named method on each of objs.
+
+    When objects are remoted, all the calls are sent to the conductor in a
+    single request instead of one request per object.  A failing call
+    does not prevent the calls on the following objects.
+
+    :param context: The request context to make the calls with
+    :param objs: A list of NovaObjects
+    :param method: The name of a remotable method of the objects
+    :param args: Positional arguments passed to each call
+    :param kwargs: Keyword arguments passed to each call
+    :returns: A list with, for each object, the exception raised by its
+              call, or None if the call succeeded
+    """
+    kwargs = kwargs or {}
+    errors = []
+    if not objs:
+        return errors
+    indirection_api = NovaObject.indirection_api
+    if not (indirection_api and
+            hasattr(indirection_api, 'object_action_multi')):
+        for obj in objs:
+            try:
+                getattr(obj, method)(context, *args, **kwargs)
+            except Exception as e:
+                errors.append(e)
+            else:
+                errors.append(None)
+        return errors
+
+    actions = [(obj, method, args, kwargs) for obj in objs]
+    results = indirection_api.object_action_multi(context, actions)
+    for obj, (updates, _result, error) in zip(objs, results):
+        obj._context = context
+        if error is not None:
+            errors.append(_obj_action_error(method, error))
+        else:
+            _obj_apply_updates(obj, updates)
+            errors.append(None)
+    return errors
+
+
 # See comment above for remotable_classmethod()
 #
 # Note that this will use either the provided context, or the one
@@ -138,14 +222,14 @@ def remotable(fn):
         # Force this to be set if it wasn't before.
         self._context = ctxt
         if NovaObject.indirection_api:
-            updates, result = NovaObject.indirection_api.object_action(
-                ctxt, self, fn.__name__, args, kwargs)
-            for key, value in updates.iteritems():
-                if key in self.fields:
-                    field = self.fields[key]
-                    self[key] = field.from_primitive(self, key, value)
-            self.obj_reset_changes()
-            self._changed_fields = set(updates.get('obj_what_changed', []))
+            if (fn.__name__ in self.obj_delta_methods and hasattr(
+                    NovaObject.indirection_api, 'object_action_delta')):
+                object_action = NovaObject.indirection_api.object_action_delta
+            else:
+                object_action = NovaObject.indirection_api.object_action
+            updates, result = object_action(ctxt, self, fn.__name__, args,
+                                            kwargs)
+            _obj_apply_updates(self, updates)
             return result
         else:
             return fn(self, ctxt, *args, **kwargs)
@@ -179,6 +263,11 @@ class NovaObject(object):
     fields = {}
     obj_extra_fields = []
 
+    # Remotable methods that only need the identity and the changed fields
+    # of the object to run on the remote side, see obj_make_delta().
+    obj_delta_methods = ()
+    obj_delta_identity_fields = ('id',)
+
     def __init__(self, context=None, **kwargs):
         self._changed_fields = set()
         self._context = context
@@ -273,6 +362,39 @@ class NovaObject(object):
         """Create a copy."""
         return copy.deepcopy(self)
 
+    def obj_make_delta(self):
+        """Create a copy with only the identity and changed fields set.
+
+        The other fields that are set are replaced by their digests, which
+        lets the remote side of a delta object action reply with only the
+        fields whose value differs from the one we have.  Fields whose
+        value is smaller than a digest are copied as they are.
+
+        :returns: a (delta, digests, bytes_saved) tuple, where digests maps
+                  field names to obj_field_digest() of their values.
+        """
+        delta = self.__class__()
+        delta._context = self._context
+        delta.VERSION = self.VERSION
+        digests = {}
+        bytes_saved = 0
+        changes = self.obj_what_changed()
+        for name, field in self.fields.items():
+            if not self.obj_attr_is_set(name):
+                continue
+            if name in changes or name in self.obj_delta_identity_fields:
+                setattr(delta, name, getattr(self, name))
+                continue
+            digest, size = obj_field_digest(
+                    field.to_primitive(self, name, getattr(self, name)))
+            if size > len(digest):
+                digests[name] = digest
+                bytes_saved += size - len(digest)
+            else:
+                setattr(delta, name, getattr(self, name))
+        delta._changed_fields = set(self._changed_fields)
+        return delta, digests, bytes_saved
+
     def obj_make_compatible(self, primitive, target_version):
         """Make an object representation compatible with a target version.
 
@@ -76,7 +76,12 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
     # Version 1.11: Update instance from database during destroy
     # Version 1.12: Added ephemeral_key_uuid
     # Version 1.13: Added delete_metadata_key()
-    VERSION = '1.13'
+    # Version 1.14: InstanceInfoCache version 1.6
+    VERSION = '1.14'
+
+    # save() only looks at the changed fields, plus cell_name in API cells
+    obj_delta_methods = ('save',)
+    obj_delta_identity_fields = ('id', 'uuid', 'cell_name')
 
     fields = {
         'id': fields.IntegerField(),
@@ -211,6 +216,12 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
                               'default_ephemeral_device',
                               'default_swap_device', 'config_drive',
                               'cell_name']
+        if (target_version < (1, 14) and
+                primitive.get('info_cache') is not None):
+            # NOTE: Instance <= 1.13 had info_cache 1.5, without addresses
+            self.info_cache.obj_make_compatible(
+                primitive['info_cache']['nova_object.data'], '1.5')
+            primitive['info_cache']['nova_object.version'] = '1.5'
         if target_version < (1, 10) and 'info_cache' in primitive:
             # NOTE(danms): Instance <= 1.9 (havana) had info_cache 1.4
             self.info_cache.obj_make_compatible(primitive['info_cache'],
@@ -329,10 +340,16 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
         if self.obj_attr_is_set('id'):
             raise exception.ObjectActionError(action='create',
                                               reason='already created')
-        updates = self.obj_get_changes()
-        updates.pop('id', None)
+        updates = self._get_create_updates()
         expected_attrs = [attr for attr in INSTANCE_DEFAULT_FIELDS
                           if attr in updates]
+        db_inst = db.instance_create(context, updates)
+        Instance._from_db_object(context, self, db_inst, expected_attrs)
+
+    def _get_create_updates(self):
+        """Return the values to create this instance with in the DB."""
+        updates = self.obj_get_changes()
+        updates.pop('id', None)
         if 'security_groups' in updates:
             updates['security_groups'] = [x.name for x in
                                           updates['security_groups']]
@@ -340,8 +357,7 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
             updates['info_cache'] = {
                 'network_info': updates['info_cache'].network_info.json()
                 }
-        db_inst = db.instance_create(context, updates)
-        Instance._from_db_object(context, self, db_inst, expected_attrs)
+        return updates
 
     @base.remotable
     def destroy(self, context):
@@ -604,7 +620,10 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
     # Version 1.4: Instance <= version 1.12
     # Version 1.5: Added method get_active_by_window_joined.
     # Version 1.6: Instance <= version 1.13
-    VERSION = '1.6'
+    # Version 1.7: Added update_power_states()
+    # Version 1.8: Added create_all()
+    # Version 1.9: Instance version 1.14
+    VERSION = '1.9'
 
     fields = {
         'objects': fields.ListOfObjectsField('Instance'),
@@ -617,6 +636,9 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
         '1.4': '1.12',
         '1.5': '1.12',
         '1.6': '1.13',
+        '1.7': '1.13',
+        '1.8': '1.13',
+        '1.9': '1.14',
         }
 
     @base.remotable_classmethod
@@ -713,6 +735,67 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
     def get_by_security_group(cls, context, security_group):
         return cls.get_by_security_group_id(context, security_group.id)
 
+    @base.remotable_classmethod
+    def _update_power_states(cls, context, host, power_states):
+        updated = db.instance_update_power_states(context, host, power_states)
+        cell_type = cells_opts.get_cell_type()
+        for old_ref, inst_ref in updated:
+            if cell_type == 'compute':
+                cells_api = cells_rpcapi.CellsAPI()
+                cells_api.instance_update_at_top(context, inst_ref)
+            notifications.send_update(context, old_ref, inst_ref)
+        return [inst_ref['uuid'] for _old_ref, inst_ref in updated]
+
+    def update_power_states(self, host, power_states):
+        """Bulk update the power state of instances on a host.
+
+        Only the instances whose power state differs are written, with a
+        single database call. Instances with a pending task, or which are
+        not on the host any more, are left alone.
+
+        :param host: the host the instances are expected to be on
+        :param power_states: a dict mapping instance uuids to power states
+        :returns: A list of instance uuids whose power state was updated.
+        """
+        uuids = self._update_power_states(self._context, host, power_states)
+        updated = set(uuids)
+        for instance in self:
+            if instance.uuid in updated:
+                instance.power_state = power_states[instance.uuid]
+                instance.obj_reset_changes(['power_state'])
+        return uuids
+
+    @base.remotable_classmethod
+    def _create_all(cls, context, updates_list, block_device_mappings):
+        db_inst_list = db.instance_create_bulk(context, updates_list,
+                                               block_device_mappings)
+        expected_attrs = [attr for attr in INSTANCE_DEFAULT_FIELDS
+                          if updates_list and attr in updates_list[0]]
+        return _make_instance_list(context, cls(), db_inst_list,
+                                   expected_attrs)
+
+    @classmethod
+    def create_all(cls, context, instances, block_device_mappings=None):
+        """Create new instances in the database with a single call.
+
+        :param context: nova request context
+        :param instances: the Instance objects to create, which must not
+                          have been created yet
+        :param block_device_mappings: a dict mapping instance uuids to the
+                                      block device mappings to create for
+                                      them, in the new format
+        :returns: An InstanceList of the created instances, in the order of
+                  instances.
+        """
+        updates_list = []
+        for instance in instances:
+            if instance.obj_attr_is_set('id'):
+                raise exception.ObjectActionError(action='create',
+                                                  reason='already created')
+            updates_list.append(instance._get_create_updates())
+        return cls._create_all(context, updates_list,
+                               block_device_mappings or {})
+
     def fill_faults(self):
         """Batch query the database for our instances' faults.
 
@@ -736,3 +819,22 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
             instance.obj_reset_changes(['fault'])
 
         return faults_by_uuid.keys()
+
+    def save_all(self, expected_vm_state=None, expected_task_state=None):
+        """Save the changes of all our instances with a single call.
+
+        Instances without changes are skipped.
+
+        :param expected_vm_state: Passed to Instance.save() for each instance
+        :param expected_task_state: Passed to Instance.save() for each
+                                    instance
+        :returns: A dict mapping the uuids of the instances which could not
+                  be saved to the exception raised when saving them.
+        """
+        changed = [inst for inst in self if inst.obj_what_changed()]
+        kwargs = {'expected_vm_state': expected_vm_state,
+                  'expected_task_state': expected_task_state}
+        errors = base.obj_action_multi(self._context, changed, 'save',
+                                       kwargs=kwargs)
+        return dict((inst.uuid, error)
+                    for inst, error in zip(changed, errors) if error)
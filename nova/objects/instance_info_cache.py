@@ -12,6 +12,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import six
+
 from nova.cells import opts as cells_opts
 from nova.cells import rpcapi as cells_rpcapi
 from nova import db
@@ -19,6 +21,7 @@ from nova import exception
 from nova.objects import base
 from nova.objects import fields
 from nova.openstack.common.gettextutils import _
+from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
@@ -32,21 +35,61 @@ class InstanceInfoCache(base.NovaPersistentObject, base.NovaObject):
     # Version 1.4: String attributes updated to support unicode
     # Version 1.5: Actually set the deleted, created_at, updated_at, and
     #              deleted_at attributes
-    VERSION = '1.5'
+    # Version 1.6: Added addresses
+    VERSION = '1.6'
 
     fields = {
         'instance_uuid': fields.UUIDField(),
         'network_info': fields.Field(fields.NetworkModel(), nullable=True),
+        # NOTE: The addresses are computed from network_info by the
+        # database API when it is saved, they are read-only here.
+        'addresses': fields.Field(fields.Dict(fields.FieldType()),
+                                  nullable=True),
         }
 
+    # The JSON of network_info until it is first read, see _from_db_object()
+    _network_info_json = None
+
     @staticmethod
     def _from_db_object(context, info_cache, db_obj):
         for field in info_cache.fields:
+            if field in ('network_info', 'addresses'):
+                continue
             info_cache[field] = db_obj[field]
+        # NOTE: Hydrating network_info is costly and the server views only
+        # read the addresses, so the JSON is only parsed when read.
+        nw_info = db_obj['network_info']
+        if isinstance(nw_info, six.string_types):
+            info_cache._network_info_json = nw_info
+        else:
+            info_cache.network_info = nw_info
+        addresses = db_obj.get('addresses')
+        if isinstance(addresses, six.string_types):
+            addresses = jsonutils.loads(addresses)
+        info_cache.addresses = addresses
         info_cache.obj_reset_changes()
         info_cache._context = context
         return info_cache
 
+    def obj_attr_is_set(self, attrname):
+        if attrname == 'network_info' and self._network_info_json is not None:
+            return True
+        return super(InstanceInfoCache, self).obj_attr_is_set(attrname)
+
+    def obj_load_attr(self, attrname):
+        if attrname != 'network_info' or self._network_info_json is None:
+            return super(InstanceInfoCache, self).obj_load_attr(attrname)
+        nw_info_json = self._network_info_json
+        self._network_info_json = None
+        self.network_info = nw_info_json
+        self.obj_reset_changes(['network_info'])
+
+    def obj_make_compatible(self, primitive, target_version):
+        target_version = (int(target_version.split('.')[0]),
+                          int(target_version.split('.')[1]))
+        if target_version < (1, 6):
+            primitive.pop('addresses', None)
+
     @classmethod
     def new(cls, context, instance_uuid):
         """Create an InfoCache object that can be used to create the DB
@@ -89,6 +132,9 @@ class InstanceInfoCache(base.NovaPersistentObject, base.NovaObject):
                 self, 'network_info', self.network_info)
             rv = db.instance_info_cache_update(context, self.instance_uuid,
                                                {'network_info': nw_info_json})
+            # NOTE: The addresses stored for the old network_info are
+            # stale now, let the readers walk network_info instead.
+            self.addresses = None
             if update_cells and rv:
                 self._info_cache_cells_update(context, rv)
         self.obj_reset_changes()
@@ -16,12 +16,14 @@
 """Policy Engine For Nova."""
 
 import os.path
+import re
 
 from oslo.config import cfg
 
 from nova import exception
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import policy
+from nova.openstack.common import timeutils
 from nova import utils
 
 
@@ -32,6 +34,10 @@ policy_opts = [
     cfg.StrOpt('policy_default_rule',
                default='default',
                help=_('Rule checked when requested rule is not found')),
+    cfg.IntOpt('policy_check_interval',
+               default=0,
+               help=_('Number of seconds between checks of the policy file '
+                      'for changes. 0 checks it on every policy check')),
     ]
 
 CONF = cfg.CONF
@@ -39,19 +45,37 @@ CONF.register_opts(policy_opts)
 
 _POLICY_PATH = None
 _POLICY_CACHE = {}
+_POLICY_CHECKED_AT = None
+
+# The rules the compiled checks were built from, and the compiled checks
+# themselves keyed by rule name.
+_COMPILED_FROM = None
+_COMPILED = {}
+
+_TARGET_KEYS_RE = re.compile(r'%\(([^)]+)\)')
+_MISSING = object()
+# Upper bound of the results memoized on a single context
+_CONTEXT_CACHE_SIZE = 1000
 
 
 def reset():
     global _POLICY_PATH
     global _POLICY_CACHE
+    global _POLICY_CHECKED_AT
     _POLICY_PATH = None
     _POLICY_CACHE = {}
+    _POLICY_CHECKED_AT = None
     policy.reset()
 
 
 def init():
     global _POLICY_PATH
     global _POLICY_CACHE
+    global _POLICY_CHECKED_AT
+    if (_POLICY_CACHE and _POLICY_CHECKED_AT is not None and
+            not timeutils.is_older_than(_POLICY_CHECKED_AT,
+                                        CONF.policy_check_interval)):
+        return
     if not _POLICY_PATH:
         _POLICY_PATH = CONF.policy_file
         if not os.path.exists(_POLICY_PATH):
@@ -60,6 +84,8 @@ def init():
             raise exception.ConfigNotFound(path=CONF.policy_file)
     utils.read_cached_file(_POLICY_PATH, _POLICY_CACHE,
                            reload_func=_set_rules)
+    if CONF.policy_check_interval > 0:
+        _POLICY_CHECKED_AT = timeutils.utcnow()
 
 
 def _set_rules(data):
@@ -93,12 +119,10 @@ def enforce(context, action, target, do_raise=True):
 
     credentials = context.to_dict()
 
-    # Add the exception arguments if asked to do a raise
-    extra = {}
-    if do_raise:
-        extra.update(exc=exception.PolicyNotAuthorized, action=action)
-
-    return policy.check(action, target, credentials, **extra)
+    result = _check(action, target, credentials, context)
+    if do_raise and result is False:
+        raise exception.PolicyNotAuthorized(action=action)
+    return result
 
 
 def check_is_admin(context):
@@ -111,7 +135,153 @@ def check_is_admin(context):
     credentials = context.to_dict()
     target = credentials
 
-    return policy.check('context_is_admin', target, credentials)
+    return _check('context_is_admin', target, credentials)
+
+
+def _check(action, target, credentials, context=None):
+    """Evaluate the compiled check for action.
+
+    Like openstack.common.policy.check(), but results are memoized on the
+    context, keyed on the target and credential fields the rule looks at,
+    so repeated checks while serving a request are only evaluated once.
+    """
+    rules = policy._rules
+    if not rules:
+        # No rules to reference means we're going to fail closed
+        return False
+    func, keys = _get_compiled(rules, action)
+
+    if context is None or keys is None:
+        return _call(func, target, credentials)
+    cache = getattr(context, '_policy_cache', None)
+    if (not isinstance(cache, tuple) or cache[0] is not rules or
+            len(cache[1]) >= _CONTEXT_CACHE_SIZE):
+        cache = (rules, {})
+        context._policy_cache = cache
+    try:
+        cache_key = (action,) + tuple(
+                _freeze((target if kind == 'target' else credentials).get(
+                        key, _MISSING))
+                for kind, key in keys)
+        result = cache[1].get(cache_key, _MISSING)
+    except TypeError:
+        # Something unhashable, don't cache it
+        return _call(func, target, credentials)
+    if result is _MISSING:
+        result = cache[1][cache_key] = _call(func, target, credentials)
+    return result
+
+
+def _call(func, target, creds):
+    try:
+        return func(target, creds)
+    except KeyError:
+        # Same as a missing rule, e.g. a target without the key a generic
+        # check looks up; fail closed
+        return False
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def _get_compiled(rules, action):
+    global _COMPILED_FROM
+    global _COMPILED
+    if rules is not _COMPILED_FROM:
+        _COMPILED_FROM = rules
+        _COMPILED = {}
+    compiled = _COMPILED.get(action)
+    if compiled is None:
+        try:
+            rule = rules[action]
+        except KeyError:
+            # If the rule doesn't exist, fail closed
+            rule = policy.FalseCheck()
+        func, keys = _compile(rule, rules, (action,))
+        if keys is not None:
+            keys = tuple(sorted(keys))
+        compiled = _COMPILED[action] = (func, keys)
+    return compiled
+
+
+def _compile(check, rules, seen):
+    """Compile a tree of Check objects into a single function.
+
+    Referenced rules are inlined and the checks nova knows about are
+    turned into closures, so evaluating a rule doesn't go through a
+    __call__ per node of the tree.
+
+    :returns: a (func, keys) tuple, where keys is the set of ('target',
+              key) and ('creds', key) fields the result depends on, or
+              None if the result can't be cached (e.g. for http checks).
+    """
+    kind = type(check)
+    if kind is policy.TrueCheck:
+        return lambda target, creds: True, set()
+    elif kind is policy.FalseCheck:
+        return lambda target, creds: False, set()
+    elif kind is policy.NotCheck:
+        func, keys = _compile(check.rule, rules, seen)
+        return lambda target, creds: not func(target, creds), keys
+    elif kind in (policy.AndCheck, policy.OrCheck):
+        funcs = []
+        all_keys = set()
+        for rule in check.rules:
+            func, keys = _compile(rule, rules, seen)
+            funcs.append(func)
+            if all_keys is not None:
+                all_keys = None if keys is None else all_keys | keys
+        funcs = tuple(funcs)
+        if kind is policy.AndCheck:
+            def and_check(target, creds):
+                for func in funcs:
+                    if not func(target, creds):
+                        return False
+                return True
+            return and_check, all_keys
+
+        def or_check(target, creds):
+            for func in funcs:
+                if func(target, creds):
+                    return True
+            return False
+        return or_check, all_keys
+    elif kind is policy.RuleCheck:
+        if check.match in seen:
+            # A loop in the rules, leave it to the Check objects
+            return check, None
+        try:
+            rule = rules[check.match]
+        except KeyError:
+            # We don't have any matching rule; fail closed
+            return lambda target, creds: False, set()
+        func, keys = _compile(rule, rules, seen + (check.match,))
+        return lambda target, creds: _call(func, target, creds), keys
+    elif kind is policy.RoleCheck:
+        role = check.match.lower()
+        return (lambda target, creds:
+                role in [x.lower() for x in creds['roles']],
+                set([('creds', 'roles')]))
+    elif kind is IsAdminCheck:
+        expected = check.expected
+        return (lambda target, creds: creds['is_admin'] == expected,
+                set([('creds', 'is_admin')]))
+    elif kind is policy.GenericCheck:
+        cred_key = check.kind
+        match = check.match
+        keys = set([('creds', cred_key)])
+        keys.update(('target', key) for key in _TARGET_KEYS_RE.findall(match))
+
+        def generic_check(target, creds):
+            value = match % target
+            if cred_key in creds:
+                return value == unicode(creds[cred_key])
+            return False
+        return generic_check, keys
+    return check, None
 
 
 @policy.register('is_admin')
@@ -22,6 +22,7 @@ __all__ = [
     'RequestContextSerializer',
     'get_client',
     'get_server',
+    'get_notification_listener',
     'get_notifier',
     'TRANSPORT_ALIASES',
 ]
@@ -140,6 +141,16 @@ def get_server(target, endpoints, serializer=None):
                                     serializer=serializer)
 
 
+def get_notification_listener(targets, endpoints, serializer=None):
+    assert TRANSPORT is not None
+    serializer = RequestContextSerializer(serializer)
+    return messaging.get_notification_listener(TRANSPORT,
+                                               targets,
+                                               endpoints,
+                                               executor='eventlet',
+                                               serializer=serializer)
+
+
 def get_notifier(service=None, host=None, publisher_id=None):
     assert NOTIFIER is not None
     if not publisher_id:
@@ -0,0 +1,197 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar execution of scheduler filters and weighers.
+
+Instead of calling every filter and weigher once per host, the resources
+of all hosts are laid out in NumPy arrays (one array per HostState
+attribute) and the filters and weighers which support it are evaluated as
+array operations over all hosts at once.  Filters and weighers which don't
+support it keep running once per host on the hosts still in the running.
+"""
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional, columnar mode is disabled when it is missing.
+    numpy = None
+
+from oslo.config import cfg
+
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+
+columnar_opts = [
+    cfg.BoolOpt('scheduler_columnar_mode',
+                default=False,
+                help='Evaluate the filters and weighers which support it as '
+                     'array operations over all hosts at once instead of '
+                     'once per host. Requires NumPy, this option is '
+                     'ignored when NumPy is not installed'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(columnar_opts)
+
+LOG = logging.getLogger(__name__)
+
+_warned_unavailable = False
+
+
+def is_enabled():
+    """Return True if columnar mode is enabled and can be used."""
+    global _warned_unavailable
+    if not CONF.scheduler_columnar_mode:
+        return False
+    if numpy is None:
+        if not _warned_unavailable:
+            LOG.warn(_("scheduler_columnar_mode is enabled but NumPy is "
+                       "not installed, falling back to per host filtering "
+                       "and weighing"))
+            _warned_unavailable = True
+        return False
+    return True
+
+
+class HostColumns(object):
+    """Resources of a list of hosts laid out as one array per attribute.
+
+    Arrays are built on first access, so only the attributes used by the
+    filters and weighers of a request are gathered.  ``mask`` holds the
+    hosts which are still passing the filters.
+    """
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self.mask = numpy.ones(len(hosts), dtype=bool)
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def __getitem__(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            column = numpy.fromiter(
+                    (getattr(host, name) or 0 for host in self.hosts),
+                    dtype=float, count=len(self.hosts))
+            self._columns[name] = column
+        return column
+
+    def invalidate(self, name=None):
+        """Drop cached arrays after host attributes changed."""
+        if name is None:
+            self._columns.clear()
+        else:
+            self._columns.pop(name, None)
+
+    def set_limit(self, key, values, passes):
+        """Record an oversubscription limit on the hosts passing a filter.
+
+        This is the columnar equivalent of the filters setting
+        host_state.limits[key] for every host they let through.
+        """
+        for i in numpy.flatnonzero(passes & self.mask):
+            self.hosts[i].limits[key] = float(values[i])
+
+    def passing_hosts(self):
+        return [self.hosts[i] for i in numpy.flatnonzero(self.mask)]
+
+
+def get_filtered_hosts(filter_classes, hosts, filter_properties, index=0):
+    """Columnar version of BaseFilterHandler.get_filtered_objects()."""
+    hosts = list(hosts)
+    LOG.debug(_("Starting with %d host(s)"), len(hosts))
+    columns = HostColumns(hosts)
+    positions = None
+    for filter_cls in filter_classes:
+        cls_name = filter_cls.__name__
+        filter = filter_cls()
+
+        if not filter.run_filter_for_index(index):
+            continue
+        passes = filter.host_passes_columns(columns, filter_properties)
+        if passes is None:
+            # The filter has no columnar implementation, run it on the
+            # hosts still passing.
+            objs = filter.filter_all(columns.passing_hosts(),
+                                     filter_properties)
+            if objs is None:
+                LOG.debug(_("Filter %(cls_name)s says to stop filtering"),
+                          {'cls_name': cls_name})
+                return
+            if positions is None:
+                positions = dict((id(host), i)
+                                 for i, host in enumerate(hosts))
+            passes = numpy.zeros(len(hosts), dtype=bool)
+            for obj in objs:
+                passes[positions[id(obj)]] = True
+        columns.mask &= passes
+        num_passing = int(columns.mask.sum())
+        if not num_passing:
+            LOG.info(_("Filter %s returned 0 hosts"), cls_name)
+            break
+        LOG.debug(_("Filter %(cls_name)s returned "
+                    "%(obj_len)d host(s)"),
+                  {'cls_name': cls_name, 'obj_len': num_passing})
+    return columns.passing_hosts()
+
+
+def _weigher_limit(weigher_value, weights, func):
+    # Mirrors BaseWeigher.weigh_objects(): a preset minval/maxval is only
+    # widened by the weights, never narrowed.
+    limit = func(weights)
+    if weigher_value is None:
+        return float(limit)
+    return float(func([weigher_value, limit]))
+
+
+def get_weighed_hosts(object_class, weigher_classes, hosts,
+                      weighing_properties):
+    """Columnar version of BaseWeightHandler.get_weighed_objects()."""
+    if not hosts:
+        return []
+
+    hosts = list(hosts)
+    columns = HostColumns(hosts)
+    weighed_objs = None
+    totals = numpy.zeros(len(hosts), dtype=float)
+    for weigher_cls in weigher_classes:
+        weigher = weigher_cls()
+        weights = weigher.weigh_columns(columns, weighing_properties)
+        if weights is None:
+            # The weigher has no columnar implementation.
+            if weighed_objs is None:
+                weighed_objs = [object_class(host, 0.0) for host in hosts]
+            weights = numpy.array(weigher.weigh_objects(weighed_objs,
+                                                        weighing_properties),
+                                  dtype=float)
+            minval, maxval = weigher.minval, weigher.maxval
+        else:
+            weights = numpy.asarray(weights, dtype=float)
+            minval = _weigher_limit(weigher.minval, weights, numpy.min)
+            maxval = _weigher_limit(weigher.maxval, weights, numpy.max)
+
+        # Normalize the weights, see nova.weights.normalize()
+        if minval == maxval:
+            continue
+        totals += (weigher.weight_multiplier() *
+                   (weights - minval) / (maxval - minval))
+
+    # A stable sort keeps hosts with equal weights in their original
+    # order, like sorted(..., reverse=True) does.
+    order = numpy.argsort(-totals, kind='mergesort')
+    return [object_class(hosts[i], float(totals[i])) for i in order]
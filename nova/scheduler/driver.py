@@ -108,6 +108,14 @@ class Scheduler(object):
         """Manager calls this so drivers can perform periodic tasks."""
         pass
 
+    def update_host_state(self, context, host, node, compute):
+        """Apply a compute node update pushed by a compute host."""
+        self.host_manager.update_host_state(host, node, compute)
+
+    def invalidate_aggregates(self, context):
+        """Drop cached aggregate data after an aggregate changed."""
+        self.host_manager.invalidate_aggregate_metadata()
+
     def hosts_up(self, context, topic):
         """Return the list of hosts that have a running service for topic."""
 
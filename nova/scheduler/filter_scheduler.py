@@ -31,6 +31,7 @@ from nova.openstack.common import log as logging
 from nova.pci import pci_request
 from nova import rpc
 from nova.scheduler import driver
+from nova.scheduler import host_manager
 from nova.scheduler import scheduler_options
 from nova.scheduler import utils as scheduler_utils
 
@@ -48,7 +49,14 @@ filter_scheduler_opts = [
                     'chosen from. A value of 1 chooses the '
                     'first host returned by the weighing functions. '
                     'This value must be at least 1. Any value less than 1 '
-                    'will be ignored, and 1 will be used instead')
+                    'will be ignored, and 1 will be used instead'),
+    cfg.BoolOpt('scheduler_batch_placement',
+                default=False,
+                help='When scheduling several instances in one request, '
+                     'filter and weigh the hosts only once and afterwards '
+                     'only check again the host chosen for the previous '
+                     'instance. Only used when all the enabled filters '
+                     'declare their results invariant across instances'),
 ]
 
 CONF.register_opts(filter_scheduler_opts)
@@ -298,10 +306,17 @@ class FilterScheduler(driver.Scheduler):
             properties['uuid'] = instance_uuids[0]
         self._populate_retry(filter_properties, properties)
 
+        # NOTE: The aggregate metadata index is only meant for the filters
+        # and is removed again before returning, it must not be sent on to
+        # the compute hosts along with the rest of the filter properties.
+        aggregate_metadata = host_manager.AggregateMetadataIndex(
+                self.host_manager, elevated)
         filter_properties.update({'context': context,
                                   'request_spec': request_spec,
                                   'config_options': config_options,
-                                  'instance_type': instance_type})
+                                  'instance_type': instance_type,
+                                  'aggregate_metadata_by_host':
+                                      aggregate_metadata})
 
         self.populate_filter_properties(request_spec,
                                         filter_properties)
@@ -316,11 +331,19 @@ class FilterScheduler(driver.Scheduler):
         # are being scanned in a filter or weighing function.
         hosts = self._get_all_host_states(elevated)
 
-        selected_hosts = []
         if instance_uuids:
             num_instances = len(instance_uuids)
         else:
             num_instances = request_spec.get('num_instances', 1)
+
+        if (CONF.scheduler_batch_placement and num_instances > 1 and
+                self.host_manager.filters_invariant_across_instances()):
+            selected_hosts = self._schedule_batch(hosts, filter_properties,
+                    instance_properties, num_instances, update_group_hosts)
+            filter_properties.pop('aggregate_metadata_by_host', None)
+            return selected_hosts
+
+        selected_hosts = []
         for num in xrange(num_instances):
             # Filter local hosts based on requirements ...
             hosts = self.host_manager.get_filtered_hosts(hosts,
@@ -336,14 +359,55 @@ class FilterScheduler(driver.Scheduler):
 
             LOG.debug(_("Weighed %(hosts)s"), {'hosts': weighed_hosts})
 
-            scheduler_host_subset_size = CONF.scheduler_host_subset_size
-            if scheduler_host_subset_size > len(weighed_hosts):
-                scheduler_host_subset_size = len(weighed_hosts)
-            if scheduler_host_subset_size < 1:
-                scheduler_host_subset_size = 1
+            subset_size = self._get_host_subset_size(len(weighed_hosts))
+            chosen_host = random.choice(weighed_hosts[0:subset_size])
+            selected_hosts.append(chosen_host)
+
+            # Now consume the resources so the filter/weights
+            # will change for the next instance.
+            chosen_host.obj.consume_from_instance(instance_properties)
+            if update_group_hosts is True:
+                filter_properties['group_hosts'].add(chosen_host.obj.host)
+
+        filter_properties.pop('aggregate_metadata_by_host', None)
+        return selected_hosts
 
-            chosen_host = random.choice(
-                weighed_hosts[0:scheduler_host_subset_size])
+    def _schedule_batch(self, hosts, filter_properties, instance_properties,
+                        num_instances, update_group_hosts):
+        """Place all the instances of a request filtering and weighing the
+        hosts only once.
+
+        Only the host chosen for an instance has its resources consumed,
+        so as all the filters declare their results invariant across
+        instances, it is the only one which needs to be filtered and
+        weighed again for the next instance.  The result is the same as
+        filtering and weighing all the hosts for every instance.
+        """
+        hosts = self.host_manager.get_filtered_hosts(hosts,
+                filter_properties, index=0)
+        if not hosts:
+            return []
+
+        LOG.debug(_("Filtered %(hosts)s"), {'hosts': hosts})
+
+        weighed_hosts = self.host_manager.get_weighed_host_heap(hosts,
+                filter_properties)
+
+        selected_hosts = []
+        for num in xrange(num_instances):
+            if selected_hosts:
+                last_host = selected_hosts[-1].obj
+                if self.host_manager.get_filtered_hosts([last_host],
+                        filter_properties, index=num):
+                    weighed_hosts.update(last_host)
+                else:
+                    weighed_hosts.remove(last_host)
+                if not weighed_hosts:
+                    # Can't get any more locally.
+                    break
+
+            subset_size = self._get_host_subset_size(len(weighed_hosts))
+            chosen_host = random.choice(weighed_hosts.best(subset_size))
             selected_hosts.append(chosen_host)
 
             # Now consume the resources so the filter/weights
@@ -351,8 +415,18 @@ class FilterScheduler(driver.Scheduler):
             chosen_host.obj.consume_from_instance(instance_properties)
             if update_group_hosts is True:
                 filter_properties['group_hosts'].add(chosen_host.obj.host)
+
         return selected_hosts
 
+    @staticmethod
+    def _get_host_subset_size(num_hosts):
+        scheduler_host_subset_size = CONF.scheduler_host_subset_size
+        if scheduler_host_subset_size > num_hosts:
+            scheduler_host_subset_size = num_hosts
+        if scheduler_host_subset_size < 1:
+            scheduler_host_subset_size = 1
+        return scheduler_host_subset_size
+
     def _get_all_host_states(self, context):
         """Template method, so a subclass can implement caching."""
         return self.host_manager.get_all_host_states(context)
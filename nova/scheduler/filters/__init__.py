@@ -18,6 +18,7 @@ Scheduler host filters
 """
 
 from nova import filters
+from nova.scheduler import columnar
 
 
 class BaseHostFilter(filters.BaseFilter):
@@ -32,11 +33,29 @@ class BaseHostFilter(filters.BaseFilter):
         """
         raise NotImplementedError()
 
+    def host_passes_columns(self, columns, filter_properties):
+        """Columnar version of host_passes().
+
+        Return a boolean array telling which of the hosts in the
+        nova.scheduler.columnar.HostColumns pass the filter, or None if
+        the filter has no columnar implementation, in which case
+        host_passes() is called for each host instead.
+        """
+        return None
+
 
 class HostFilterHandler(filters.BaseFilterHandler):
     def __init__(self):
         super(HostFilterHandler, self).__init__(BaseHostFilter)
 
+    def get_filtered_objects(self, filter_classes, objs,
+            filter_properties, index=0):
+        if columnar.is_enabled():
+            return columnar.get_filtered_hosts(filter_classes, objs,
+                                               filter_properties, index)
+        return super(HostFilterHandler, self).get_filtered_objects(
+                filter_classes, objs, filter_properties, index)
+
 
 def all_filters():
     """Return a list of filter classes found in this directory.
@@ -104,6 +104,9 @@ class GroupAntiAffinityFilter(AffinityFilter):
     hosts.
     """
 
+    # Only the chosen host is added to the group hosts within a request
+    invariant_unless_chosen = True
+
     def host_passes(self, host_state, filter_properties):
         # Only invoke the filter is 'anti-affinity' is configured
         policies = filter_properties.get('group_policies', [])
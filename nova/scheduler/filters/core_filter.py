@@ -17,10 +17,10 @@
 
 from oslo.config import cfg
 
-from nova import db
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.scheduler import filters
+from nova.scheduler.filters import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -37,6 +37,9 @@ CONF.register_opt(cpu_allocation_ratio_opt)
 
 class BaseCoreFilter(filters.BaseHostFilter):
 
+    # Only the vCPUs of the chosen host are consumed within a request
+    invariant_unless_chosen = True
+
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
         raise NotImplementedError
 
@@ -70,6 +73,26 @@ class CoreFilter(BaseCoreFilter):
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
         return CONF.cpu_allocation_ratio
 
+    def host_passes_columns(self, columns, filter_properties):
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return columns.mask.copy()
+
+        host_vcpus_total = columns['vcpus_total']
+        not_collected = host_vcpus_total == 0
+        if (not_collected & columns.mask).any():
+            # Fail safe
+            LOG.warning(_("VCPUs not set; assuming CPU collection broken"))
+
+        vcpus_total = host_vcpus_total * CONF.cpu_allocation_ratio
+        passes = ((vcpus_total - columns['vcpus_used']) >=
+                  instance_type['vcpus'])
+
+        # Only provide a VCPU limit to compute if the virt driver is reporting
+        # an accurate count of installed VCPUs. (XenServer driver does not)
+        columns.set_limit('vcpu', vcpus_total, passes & (vcpus_total > 0))
+        return passes | not_collected
+
 
 class AggregateCoreFilter(BaseCoreFilter):
     """AggregateCoreFilter with per-aggregate CPU subscription flag.
@@ -78,12 +101,8 @@ class AggregateCoreFilter(BaseCoreFilter):
     """
 
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
-        context = filter_properties['context'].elevated()
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        metadata = db.aggregate_metadata_get_by_host(
-                     context, host_state.host, key='cpu_allocation_ratio')
+        metadata = utils.aggregate_metadata_get_by_host(host_state,
+                filter_properties, key='cpu_allocation_ratio')
         aggregate_vals = metadata.get('cpu_allocation_ratio', set())
         num_values = len(aggregate_vals)
 
@@ -32,6 +32,9 @@ CONF.register_opt(max_io_ops_per_host_opt)
 class IoOpsFilter(filters.BaseHostFilter):
     """Filter out hosts with too many concurrent I/O operations."""
 
+    # Only the I/O operations of the chosen host change within a request
+    invariant_unless_chosen = True
+
     def host_passes(self, host_state, filter_properties):
         """Use information about current vm and task states collected from
         compute node statistics to decide whether to filter.
@@ -45,3 +48,6 @@ class IoOpsFilter(filters.BaseHostFilter):
                         {'host_state': host_state,
                          'max_io_ops': max_io_ops})
         return passes
+
+    def host_passes_columns(self, columns, filter_properties):
+        return columns['num_io_ops'] < CONF.max_io_ops_per_host
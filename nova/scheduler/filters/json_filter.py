@@ -25,6 +25,11 @@ class JsonFilter(filters.BaseHostFilter):
     """Host Filter to allow simple JSON-based grammar for
     selecting hosts.
     """
+
+    # The query is only evaluated against the state of the host, of which
+    # only the chosen host changes within a request
+    invariant_unless_chosen = True
+
     def _op_compare(self, args, op):
         """Returns True if the specified operator can successfully
         compare the first item in the args with all the rest. Will
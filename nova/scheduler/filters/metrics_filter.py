@@ -36,6 +36,9 @@ class MetricsFilter(filters.BaseHostFilter):
     these hosts.
     """
 
+    # The metrics of a host don't change within a request
+    invariant_unless_chosen = True
+
     def __init__(self):
         super(MetricsFilter, self).__init__()
         opts = utils.parse_options(CONF.metrics.weight_setting,
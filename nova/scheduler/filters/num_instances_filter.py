@@ -32,6 +32,9 @@ CONF.register_opt(max_instances_per_host_opt)
 class NumInstancesFilter(filters.BaseHostFilter):
     """Filter out hosts with too many instances."""
 
+    # Only the instances of the chosen host change within a request
+    invariant_unless_chosen = True
+
     def host_passes(self, host_state, filter_properties):
         num_instances = host_state.num_instances
         max_instances = CONF.max_instances_per_host
@@ -42,3 +45,6 @@ class NumInstancesFilter(filters.BaseHostFilter):
                         {'host_state': host_state,
                          'max_instances': max_instances})
         return passes
+
+    def host_passes_columns(self, columns, filter_properties):
+        return columns['num_instances'] < CONF.max_instances_per_host
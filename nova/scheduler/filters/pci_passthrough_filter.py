@@ -32,6 +32,9 @@ class PciPassthroughFilter(filters.BaseHostFilter):
     The filter checks if the host passes or not based on this information.
     """
 
+    # Only the PCI devices of the chosen host are consumed within a request
+    invariant_unless_chosen = True
+
     def host_passes(self, host_state, filter_properties):
         """Return true if the host has the required PCI devices."""
         if not filter_properties.get('pci_requests'):
@@ -277,6 +277,9 @@ class ComputeAttestation(object):
 class TrustedFilter(filters.BaseHostFilter):
     """Trusted filter to support Trusted Compute Pools."""
 
+    # The trust level of a host doesn't change within a request
+    invariant_unless_chosen = True
+
     def __init__(self):
         self.compute_attestation = ComputeAttestation()
 
@@ -0,0 +1,40 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Utility methods for scheduler filters."""
+
+from nova import db
+
+
+def aggregate_metadata_get_by_host(host_state, filter_properties, key=None):
+    """Returns the aggregate metadata of a host.
+
+    The result is the same as db.aggregate_metadata_get_by_host(), but
+    is read from the per-request 'aggregate_metadata_by_host' index in
+    filter_properties when the scheduler provides one, so filters don't
+    need a database round trip per host.
+    """
+    index = filter_properties.get('aggregate_metadata_by_host')
+    if index is None:
+        context = filter_properties['context'].elevated()
+        return db.aggregate_metadata_get_by_host(context, host_state.host,
+                                                 key=key)
+
+    metadata = index.get(host_state.host, {})
+    if key is None:
+        return metadata
+    if key in metadata:
+        return {key: metadata[key]}
+    return {}
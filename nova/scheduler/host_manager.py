@@ -18,6 +18,7 @@ Manage hosts in the current zone.
 """
 
 import collections
+import datetime
 import UserDict
 
 from oslo.config import cfg
@@ -56,6 +57,31 @@ host_manager_opts = [
     cfg.ListOpt('scheduler_weight_classes',
                 default=['nova.scheduler.weights.all_weighers'],
                 help='Which weight class names to use for weighing hosts'),
+    cfg.BoolOpt('scheduler_host_state_cache',
+                default=False,
+                help='Keep host states between scheduling requests and only '
+                     'reload the compute nodes that changed since the last '
+                     'sync, instead of reloading every compute node for '
+                     'every request'),
+    cfg.IntOpt('scheduler_host_state_consistency_window',
+               default=0,
+               help='When the host state cache is enabled, number of '
+                    'seconds cached host states are used without checking '
+                    'the database for changed compute nodes. Updates pushed '
+                    'by compute nodes are still applied within this window. '
+                    'A value of 0 checks the database on every request'),
+    cfg.IntOpt('scheduler_host_state_full_sync_interval',
+               default=600,
+               help='When the host state cache is enabled, number of '
+                    'seconds between full reloads of all compute nodes. '
+                    'A value of 0 disables periodic full reloads'),
+    cfg.IntOpt('scheduler_aggregate_metadata_max_age',
+               default=300,
+               help='Number of seconds the host aggregate metadata index '
+                    'used by the aggregate filters is kept before being '
+                    'reloaded from the database. The index is also reloaded '
+                    'whenever aggregates are changed through the API. '
+                    'A value of 0 reloads the index for every request'),
     ]
 
 CONF = cfg.CONF
@@ -63,6 +89,13 @@ CONF.register_opts(host_manager_opts)
 
 LOG = logging.getLogger(__name__)
 
+# How far an incremental sync reaches back before the previous sync. A
+# compute node update may be stamped before the previous sync but only be
+# committed after it, and MySQL truncates the stamps to the second, so the
+# sync point alone would miss these updates. Applying a compute node again
+# is harmless.
+_SYNC_MARGIN = datetime.timedelta(seconds=5)
+
 
 class ReadOnlyDict(UserDict.IterableUserDict):
     """A read-only dict."""
@@ -101,6 +134,26 @@ MetricItem = collections.namedtuple(
              'MetricItem', ['value', 'timestamp', 'source'])
 
 
+class AggregateMetadataIndex(object):
+    """Host to aggregate metadata index shared by the aggregate filters.
+
+    The index is only loaded from the HostManager the first time a filter
+    looks a host up, so requests which don't run any aggregate filter
+    don't pay for it.
+    """
+
+    def __init__(self, host_manager, context):
+        self.host_manager = host_manager
+        self.context = context
+        self._index = None
+
+    def get(self, host, default=None):
+        if self._index is None:
+            self._index = self.host_manager.get_aggregate_metadata(
+                    self.context)
+        return self._index.get(host, default)
+
+
 class HostState(object):
     """Mutable and immutable information tracked for a host.
     This is an attempt to remove the ad-hoc data structures
@@ -123,6 +176,7 @@ class HostState(object):
         self.vcpus_used = 0
 
         # Additional host information from the compute node stats:
+        self.stats = {}
         self.vm_states = {}
         self.task_states = {}
         self.num_instances = 0
@@ -335,6 +389,13 @@ class HostManager(object):
         self.weight_handler = weights.HostWeightHandler()
         self.weight_classes = self.weight_handler.get_matching_classes(
                 CONF.scheduler_weight_classes)
+        # Host state cache bookkeeping, see get_all_host_states()
+        self._last_sync = None
+        self._last_full_sync = None
+        self.host_state_cache_stats = dict(hits=0, misses=0, stale=0,
+                                           pushed=0)
+        self._aggregate_metadata = None
+        self._aggregate_metadata_loaded = None
 
     def _choose_host_filters(self, filter_cls_names):
         """Since the caller may specify which filters to use we need
@@ -438,42 +499,163 @@ class HostManager(object):
         return self.weight_handler.get_weighed_objects(self.weight_classes,
                 hosts, weight_properties)
 
+    def get_weighed_host_heap(self, hosts, weight_properties):
+        """Weigh the hosts once and return them as a WeighedHostHeap."""
+        return weights.WeighedHostHeap(self.weight_classes, hosts,
+                                       weight_properties)
+
+    def filters_invariant_across_instances(self, filter_class_names=None):
+        """Return True if, within a request, the filters only need to be
+        run again on the host chosen for the previous instance.
+        """
+        filter_classes = self._choose_host_filters(filter_class_names)
+        return all(filter_cls.invariant_across_instances()
+                   for filter_cls in filter_classes)
+
     def get_all_host_states(self, context):
         """Returns a list of HostStates that represents all the hosts
         the HostManager knows about. Also, each of the consumable resources
         in HostState are pre-populated and adjusted based on data in the db.
+
+        With scheduler_host_state_cache enabled, only the compute nodes
+        created, updated or deleted since the previous sync are read from
+        the db, and no db access happens at all within the configured
+        consistency window.
         """
+        if not CONF.scheduler_host_state_cache:
+            self._sync_all_host_states(context)
+            return self.host_state_map.itervalues()
+
+        now = timeutils.utcnow()
+        window = CONF.scheduler_host_state_consistency_window
+        if (window > 0 and self._last_sync is not None and
+                not timeutils.is_older_than(self._last_sync, window)):
+            self.host_state_cache_stats['hits'] += 1
+            return self.host_state_map.itervalues()
+
+        self.host_state_cache_stats['misses'] += 1
+        full_sync_interval = CONF.scheduler_host_state_full_sync_interval
+        if (self._last_full_sync is None or (full_sync_interval > 0 and
+                timeutils.is_older_than(self._last_full_sync,
+                                        full_sync_interval))):
+            self._sync_all_host_states(context)
+            self._last_full_sync = now
+        else:
+            self._sync_changed_host_states(context,
+                                           self._last_sync - _SYNC_MARGIN)
+        self._last_sync = now
+        return self.host_state_map.itervalues()
 
+    def _update_host_state_from_compute_node(self, compute):
+        """Create or refresh the HostState for a compute node row.
+
+        :returns: the (host, node) key of the HostState, or None if the
+                  compute node has no service.
+        """
+        service = compute['service']
+        if not service:
+            LOG.warn(_("No service for compute ID %s") % compute['id'])
+            return None
+        host = service['host']
+        node = compute.get('hypervisor_hostname')
+        state_key = (host, node)
+        capabilities = self.service_states.get(state_key, None)
+        host_state = self.host_state_map.get(state_key)
+        if host_state:
+            host_state.update_capabilities(capabilities,
+                                           dict(service.iteritems()))
+        else:
+            host_state = self.host_state_cls(host, node,
+                    capabilities=capabilities,
+                    service=dict(service.iteritems()))
+            self.host_state_map[state_key] = host_state
+        host_state.update_from_compute_node(compute)
+        return state_key
+
+    def _remove_host_state(self, state_key):
+        host, node = state_key
+        LOG.info(_("Removing dead compute node %(host)s:%(node)s "
+                   "from scheduler") % {'host': host, 'node': node})
+        del self.host_state_map[state_key]
+
+    def _sync_all_host_states(self, context):
+        """Reload every compute node from the db."""
         # Get resource usage across the available compute nodes:
         compute_nodes = db.compute_node_get_all(context)
         seen_nodes = set()
         for compute in compute_nodes:
-            service = compute['service']
-            if not service:
-                LOG.warn(_("No service for compute ID %s") % compute['id'])
-                continue
-            host = service['host']
-            node = compute.get('hypervisor_hostname')
-            state_key = (host, node)
-            capabilities = self.service_states.get(state_key, None)
-            host_state = self.host_state_map.get(state_key)
-            if host_state:
-                host_state.update_capabilities(capabilities,
-                                               dict(service.iteritems()))
-            else:
-                host_state = self.host_state_cls(host, node,
-                        capabilities=capabilities,
-                        service=dict(service.iteritems()))
-                self.host_state_map[state_key] = host_state
-            host_state.update_from_compute_node(compute)
-            seen_nodes.add(state_key)
+            state_key = self._update_host_state_from_compute_node(compute)
+            if state_key:
+                seen_nodes.add(state_key)
 
         # remove compute nodes from host_state_map if they are not active
         dead_nodes = set(self.host_state_map.keys()) - seen_nodes
         for state_key in dead_nodes:
-            host, node = state_key
-            LOG.info(_("Removing dead compute node %(host)s:%(node)s "
-                       "from scheduler") % {'host': host, 'node': node})
-            del self.host_state_map[state_key]
+            self._remove_host_state(state_key)
 
-        return self.host_state_map.itervalues()
+    def _sync_changed_host_states(self, context, changed_since):
+        """Apply only the compute nodes changed since the last sync."""
+        compute_nodes, services = db.compute_node_get_all_changed_since(
+                context, changed_since)
+        for compute in compute_nodes:
+            service = compute['service']
+            state_key = None
+            if service:
+                state_key = (service['host'],
+                             compute.get('hypervisor_hostname'))
+            if compute.get('deleted'):
+                if state_key in self.host_state_map:
+                    self._remove_host_state(state_key)
+                continue
+            if state_key in self.host_state_map:
+                self.host_state_cache_stats['stale'] += 1
+            self._update_host_state_from_compute_node(compute)
+
+        # NOTE: Services are disabled, enabled and report their state
+        # without touching their compute nodes, so the service of every
+        # cached host is refreshed, and the hosts whose service is gone
+        # are dropped.
+        services = dict((service['host'], service) for service in services)
+        for state_key, host_state in self.host_state_map.items():
+            service = services.get(state_key[0])
+            if not service:
+                self._remove_host_state(state_key)
+                continue
+            host_state.update_capabilities(
+                    self.service_states.get(state_key, None),
+                    dict(service.iteritems()))
+
+    def update_host_state(self, host, node, compute):
+        """Apply a compute node update pushed by a compute host.
+
+        Only hosts already known to the cache are updated; new compute
+        nodes are picked up by the next sync with the db.
+        """
+        host_state = self.host_state_map.get((host, node))
+        if not host_state:
+            return
+        updated_at = compute.get('updated_at')
+        if isinstance(updated_at, basestring):
+            compute = dict(compute)
+            compute['updated_at'] = timeutils.parse_strtime(updated_at)
+        host_state.update_from_compute_node(compute)
+        self.host_state_cache_stats['pushed'] += 1
+
+    def get_aggregate_metadata(self, context):
+        """Returns the aggregate metadata of every host, keyed by host.
+
+        The index is loaded with a single query and shared by all the
+        aggregate filters, see nova.scheduler.filters.utils.
+        """
+        max_age = CONF.scheduler_aggregate_metadata_max_age
+        if (self._aggregate_metadata is None or max_age <= 0 or
+                timeutils.is_older_than(self._aggregate_metadata_loaded,
+                                        max_age)):
+            self._aggregate_metadata = db.aggregate_host_metadata_get_all(
+                    context)
+            self._aggregate_metadata_loaded = timeutils.utcnow()
+        return self._aggregate_metadata
+
+    def invalidate_aggregate_metadata(self):
+        """Drop the aggregate metadata index after an aggregate changed."""
+        self._aggregate_metadata = None
@@ -298,10 +298,18 @@ class SchedulerManager(manager.Manager):
             filter_properties)
         return jsonutils.to_primitive(dests)
 
+    def update_host_state(self, context, host, node, compute):
+        """Apply a compute node update pushed by a compute host."""
+        self.driver.update_host_state(context, host, node, compute)
+
+    def invalidate_aggregates(self, context):
+        """Drop cached aggregate data after an aggregate changed."""
+        self.driver.invalidate_aggregates(context)
+
 
 class _SchedulerManagerV3Proxy(object):
 
-    target = messaging.Target(version='3.0')
+    target = messaging.Target(version='3.2')
 
     def __init__(self, manager):
         self.manager = manager
@@ -326,3 +334,10 @@ class _SchedulerManagerV3Proxy(object):
                 instance_type=instance_type, image=image,
                 request_spec=request_spec, filter_properties=filter_properties,
                 reservations=reservations)
+
+    def update_host_state(self, ctxt, host, node, compute):
+        return self.manager.update_host_state(ctxt, host=host, node=node,
+                                              compute=compute)
+
+    def invalidate_aggregates(self, ctxt):
+        return self.manager.invalidate_aggregates(ctxt)
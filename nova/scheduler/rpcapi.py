@@ -80,6 +80,8 @@ class SchedulerAPI(object):
         ... - Deprecated select_hosts()
 
         3.0 - Removed backwards compat
+        3.1 - Added update_host_state()
+        3.2 - Added invalidate_aggregates()
     '''
 
     VERSION_ALIASES = {
@@ -127,3 +129,17 @@ class SchedulerAPI(object):
                    image=image_p, request_spec=request_spec,
                    filter_properties=filter_properties,
                    reservations=reservations_p)
+
+    def update_host_state(self, ctxt, host, node, compute):
+        cctxt = self.client.prepare(fanout=True, version='3.1')
+        cctxt.cast(ctxt, 'update_host_state', host=host, node=node,
+                   compute=jsonutils.to_primitive(compute))
+
+    def invalidate_aggregates(self, ctxt):
+        # Schedulers which can't receive this message reload their
+        # aggregate data on their own after
+        # scheduler_aggregate_metadata_max_age seconds.
+        if not self.client.can_send_version('3.2'):
+            return
+        cctxt = self.client.prepare(fanout=True, version='3.2')
+        cctxt.cast(ctxt, 'invalidate_aggregates')
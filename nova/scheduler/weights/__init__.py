@@ -17,8 +17,11 @@
 Scheduler host weights
 """
 
+import heapq
+
 from oslo.config import cfg
 
+from nova.scheduler import columnar
 from nova import weights
 
 CONF = cfg.CONF
@@ -37,7 +40,15 @@ class WeighedHost(weights.WeighedObject):
 
 class BaseHostWeigher(weights.BaseWeigher):
     """Base class for host weights."""
-    pass
+
+    def weigh_columns(self, columns, weight_properties):
+        """Columnar version of weigh_objects().
+
+        Return an array with the weight of each of the hosts in the
+        nova.scheduler.columnar.HostColumns, or None if the weigher has no
+        columnar implementation, in which case weigh_objects() is used.
+        """
+        return None
 
 
 class HostWeightHandler(weights.BaseWeightHandler):
@@ -46,6 +57,123 @@ class HostWeightHandler(weights.BaseWeightHandler):
     def __init__(self):
         super(HostWeightHandler, self).__init__(BaseHostWeigher)
 
+    def get_weighed_objects(self, weigher_classes, obj_list,
+            weighing_properties):
+        if columnar.is_enabled():
+            return columnar.get_weighed_hosts(self.object_class,
+                    weigher_classes, obj_list, weighing_properties)
+        return super(HostWeightHandler, self).get_weighed_objects(
+                weigher_classes, obj_list, weighing_properties)
+
+
+class WeighedHostHeap(object):
+    """Heap of weighed hosts used to place all the instances of a request.
+
+    The hosts are weighed once.  After that only the weight of a host
+    whose state changed is recomputed with update(), and the weights of
+    all hosts are only normalized again when this changes the minimum or
+    maximum weight of a weigher.  The resulting order is the same as when
+    weighing all the hosts again with HostWeightHandler.
+    """
+
+    def __init__(self, weigher_classes, hosts, weight_properties):
+        self.hosts = list(hosts)
+        self.weight_properties = weight_properties
+        self.weighers = [weigher_cls() for weigher_cls in weigher_classes]
+        self._multipliers = [weigher.weight_multiplier()
+                             for weigher in self.weighers]
+        # weigh_objects() widens minval and maxval, keep the preset ones
+        self._presets = [(weigher.minval, weigher.maxval)
+                         for weigher in self.weighers]
+        self._positions = dict((id(host), i)
+                               for i, host in enumerate(self.hosts))
+        self._active = set(xrange(len(self.hosts)))
+        self._versions = [0] * len(self.hosts)
+
+        weighed_objs = [WeighedHost(host, 0.0) for host in self.hosts]
+        self._weights = []
+        self._bounds = []
+        for weigher in self.weighers:
+            self._weights.append(list(weigher.weigh_objects(
+                    weighed_objs, weight_properties)))
+            self._bounds.append((weigher.minval, weigher.maxval))
+        self._build()
+
+    def __len__(self):
+        return len(self._active)
+
+    def _weigh(self, pos):
+        """Sum the normalized weights of a host, see nova.weights."""
+        weight = 0.0
+        for i, multiplier in enumerate(self._multipliers):
+            minval, maxval = self._bounds[i]
+            if minval == maxval:
+                continue
+            minval = float(minval)
+            weight += multiplier * ((self._weights[i][pos] - minval) /
+                                    (float(maxval) - minval))
+        return weight
+
+    def _build(self):
+        self._heap = [(-self._weigh(pos), pos, self._versions[pos])
+                      for pos in self._active]
+        heapq.heapify(self._heap)
+
+    def _update_bounds(self):
+        """Recompute the minimum and maximum weight of every weigher.
+
+        Return True if any of them changed.
+        """
+        changed = False
+        for i, (minval, maxval) in enumerate(self._presets):
+            weights = [self._weights[i][pos] for pos in self._active]
+            if weights:
+                low, high = min(weights), max(weights)
+                minval = low if minval is None else min(minval, low)
+                maxval = high if maxval is None else max(maxval, high)
+            if (minval, maxval) != self._bounds[i]:
+                self._bounds[i] = (minval, maxval)
+                changed = True
+        return changed
+
+    def _invalidate(self, host):
+        pos = self._positions[id(host)]
+        self._versions[pos] += 1
+        return pos
+
+    def best(self, count):
+        """Return the count best WeighedHosts, best first."""
+        best = []
+        while self._heap and len(best) < count:
+            entry = heapq.heappop(self._heap)
+            weight, pos, version = entry
+            if pos in self._active and version == self._versions[pos]:
+                best.append(entry)
+        for entry in best:
+            heapq.heappush(self._heap, entry)
+        return [WeighedHost(self.hosts[pos], -weight)
+                for weight, pos, version in best]
+
+    def update(self, host):
+        """Weigh a host again after its state changed."""
+        pos = self._invalidate(host)
+        weighed_obj = WeighedHost(host, 0.0)
+        for i, weigher in enumerate(self.weighers):
+            self._weights[i][pos] = weigher.weigh_objects(
+                    [weighed_obj], self.weight_properties)[0]
+        if self._update_bounds():
+            self._build()
+        else:
+            heapq.heappush(self._heap,
+                           (-self._weigh(pos), pos, self._versions[pos]))
+
+    def remove(self, host):
+        """Remove a host which doesn't pass the filters anymore."""
+        pos = self._invalidate(host)
+        self._active.discard(pos)
+        if self._update_bounds():
+            self._build()
+
 
 def all_weighers():
     """Return a list of weight plugin classes found in this directory."""
@@ -0,0 +1,66 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Image Cache Weigher.  Weigh hosts by whether they hold the requested image.
+
+Compute hosts report the images found in their local image cache, see the
+image_prefetch_ids option.  Booting an instance on a host which already has
+its image avoids downloading the image.  The default multiplier of 0.0
+disables this weigher, set 'image_cache_weight_multiplier' to a positive
+number to prefer those hosts.
+"""
+
+from oslo.config import cfg
+
+from nova.scheduler import weights
+
+image_cache_weight_opts = [
+        cfg.FloatOpt('image_cache_weight_multiplier',
+                     default=0.0,
+                     help='Multiplier used for weighing hosts which hold '
+                          'the image of the instance in their image '
+                          'cache.  Positive numbers mean to prefer these '
+                          'hosts.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(image_cache_weight_opts)
+
+
+def _get_image_id(weight_properties):
+    request_spec = weight_properties.get('request_spec') or {}
+    image = request_spec.get('image') or {}
+    image_id = image.get('id')
+    if not image_id:
+        instance_properties = request_spec.get('instance_properties') or {}
+        image_id = instance_properties.get('image_ref')
+    return image_id
+
+
+class ImageCacheWeigher(weights.BaseHostWeigher):
+    minval = 0
+    maxval = 1
+
+    def weight_multiplier(self):
+        """Override the weight multiplier."""
+        return CONF.image_cache_weight_multiplier
+
+    def _weigh_object(self, host_state, weight_properties):
+        """Hosts which hold the image win."""
+        image_id = _get_image_id(weight_properties)
+        if image_id and host_state.stats.get('image_cached_%s' % image_id):
+            return 1
+        return 0
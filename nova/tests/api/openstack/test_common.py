@@ -27,7 +27,12 @@ from nova.api.openstack import xmlutil
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova import exception
+from nova.network import model as network_model
+from nova.objects import instance as instance_obj
+from nova.objects import instance_info_cache
+from nova.openstack.common import jsonutils
 from nova import test
+from nova.tests import fake_network_cache_model
 from nova.tests import utils
 
 
@@ -374,6 +379,45 @@ class MiscFunctionsTest(test.TestCase):
                      task_states.RESIZE_PREP])
         self.assertEqual(expected, actual)
 
+    def test_get_networks_for_instance(self):
+        instance = instance_obj.Instance()
+        addresses = {'private': {'ips': [{'address': '10.0.0.2',
+                                          'version': 4,
+                                          'type': 'fixed',
+                                          'mac_address': 'aa:aa'}],
+                                 'floating_ips': []}}
+        nw_info = network_model.NetworkInfo(
+            [fake_network_cache_model.new_vif()])
+        instance.info_cache = instance_info_cache.InstanceInfoCache()
+        instance.info_cache.network_info = nw_info
+        instance.info_cache.addresses = addresses
+        instance.info_cache.obj_reset_changes()
+
+        self.assertEqual(addresses,
+                         common.get_networks_for_instance(None, instance))
+
+        instance.info_cache.addresses = None
+        self.assertEqual(nw_info.addresses(),
+                         common.get_networks_for_instance(None, instance))
+
+    def test_get_networks_for_instance_changed_network_info(self):
+        instance = instance_obj.Instance()
+        instance.info_cache = instance_info_cache.InstanceInfoCache()
+        instance.info_cache.addresses = {}
+        instance.info_cache.network_info = network_model.NetworkInfo(
+            [fake_network_cache_model.new_vif()])
+        self.assertEqual(instance.info_cache.network_info.addresses(),
+                         common.get_networks_for_instance(None, instance))
+
+    def test_get_networks_for_instance_dict(self):
+        addresses = {'private': {'ips': [], 'floating_ips': []}}
+        instance = {'info_cache': {'network_info': '[]',
+                                   'addresses': jsonutils.dumps(addresses)}}
+        self.assertEqual(addresses,
+                         common.get_networks_for_instance(None, instance))
+        instance['info_cache']['addresses'] = None
+        self.assertEqual({}, common.get_networks_for_instance(None, instance))
+
 
 class MetadataXMLDeserializationTest(test.TestCase):
 
@@ -42,8 +42,16 @@ class CellsUtilsTestCase(test.NoDBTestCase):
             call_info['get_all'] += 1
             return ['fake_instance1', 'fake_instance2', 'fake_instance3']
 
+        def instance_get_all_by_filters_chunked(context, filters,
+                sort_key, sort_order):
+            for instance in instance_get_all_by_filters(context, filters,
+                                                        sort_key, sort_order):
+                yield instance
+
         self.stubs.Set(db, 'instance_get_all_by_filters',
                 instance_get_all_by_filters)
+        self.stubs.Set(db, 'instance_get_all_by_filters_chunked',
+                instance_get_all_by_filters_chunked)
         self.stubs.Set(random, 'shuffle', random_shuffle)
 
         instances = cells_utils.get_instances_to_sync(fake_context)
@@ -81,6 +89,19 @@ class CellsUtilsTestCase(test.NoDBTestCase):
                  'project_id': 'fake-project'})
         self.assertEqual(call_info['shuffle'], 2)
 
+    def test_get_instances_to_sync_uuids_only(self):
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_filters_chunked')
+        db.instance_get_all_by_filters_chunked('fake_context', {},
+                'deleted', 'asc', columns=['uuid'],
+                columns_to_join=[]).AndReturn(
+                        iter([{'id': 1, 'uuid': 'fake-uuid1'},
+                              {'id': 2, 'uuid': 'fake-uuid2'}]))
+        self.mox.ReplayAll()
+
+        uuids = cells_utils.get_instances_to_sync('fake_context',
+                                                  uuids_only=True)
+        self.assertEqual(['fake-uuid1', 'fake-uuid2'], list(uuids))
+
     def test_split_cell_and_item(self):
         path = 'australia', 'queensland', 'gold_coast'
         cell = cells_utils.PATH_CELL_SEP.join(path)
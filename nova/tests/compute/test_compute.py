@@ -5953,6 +5953,33 @@ class ComputeTestCase(BaseTestCase):
         for uuid, status in expected_migration_status.iteritems():
             self.assertEqual(status, fetch_instance_migration_status(uuid))
 
+    def test_poll_unconfirmed_resizes_saves_errors_at_once(self):
+        migrations = []
+        for i in range(1, 3):
+            fake_mig = test_migration.fake_db_migration()
+            fake_mig.update({'id': i, 'instance_uuid': 'noexist%d' % i,
+                             'status': None})
+            migrations.append(fake_mig)
+        self.flags(resize_confirm_window=60)
+        ctxt = context.get_admin_context()
+
+        with contextlib.nested(
+            mock.patch.object(db, 'migration_get_unconfirmed_by_dest_compute',
+                              return_value=migrations),
+            mock.patch.object(db, 'instance_get_by_uuid',
+                              side_effect=exception.InstanceNotFound(
+                                  instance_id='noexist')),
+            mock.patch.object(obj_base, 'obj_action_multi',
+                              return_value=[None, None])
+        ) as (mock_get, mock_inst_get, mock_multi):
+            self.compute._poll_unconfirmed_resizes(ctxt)
+            self.assertEqual(1, mock_multi.call_count)
+            saved = mock_multi.call_args[0][1]
+            self.assertEqual([1, 2], [migration.id for migration in saved])
+            self.assertEqual(['error', 'error'],
+                             [migration.status for migration in saved])
+            self.assertEqual('save', mock_multi.call_args[0][2])
+
     def test_instance_build_timeout_disabled(self):
         # Tests that no instances are set to error state when there is no
         # instance_build_timeout configured.
@@ -6413,9 +6440,11 @@ class ComputeTestCase(BaseTestCase):
         self._create_fake_instance({'host': self.compute.host})
         self._create_fake_instance({'host': self.compute.host})
         self._create_fake_instance({'host': self.compute.host})
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
         self.mox.StubOutWithMock(self.compute.driver, 'get_info')
         self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
 
+        self.compute.driver.get_power_states().AndRaise(NotImplementedError)
         # Check to make sure task continues on error.
         self.compute.driver.get_info(mox.IgnoreArg()).AndRaise(
             exception.InstanceNotFound(instance_id='fake-uuid'))
@@ -6436,6 +6465,33 @@ class ComputeTestCase(BaseTestCase):
         self.mox.ReplayAll()
         self.compute._sync_power_states(ctxt)
 
+    def test_sync_power_states_bulk(self):
+        ctxt = self.context.elevated()
+        running = self._create_fake_instance(
+            {'host': self.compute.host, 'power_state': power_state.RUNNING})
+        stopped = self._create_fake_instance(
+            {'host': self.compute.host, 'power_state': power_state.RUNNING})
+        busy = self._create_fake_instance(
+            {'host': self.compute.host, 'power_state': power_state.RUNNING,
+             'task_state': task_states.REBOOTING})
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_info')
+        self.mox.StubOutWithMock(self.compute.compute_api, 'stop')
+
+        self.compute.driver.get_power_states().AndReturn(
+            {running['uuid']: power_state.RUNNING,
+             stopped['uuid']: power_state.SHUTDOWN,
+             busy['uuid']: power_state.SHUTDOWN})
+        self.compute.compute_api.stop(ctxt, mox.IsA(instance_obj.Instance))
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(ctxt)
+
+        power_states = dict((inst['uuid'], inst['power_state'])
+                            for inst in db.instance_get_all(ctxt))
+        self.assertEqual({running['uuid']: power_state.RUNNING,
+                          stopped['uuid']: power_state.SHUTDOWN,
+                          busy['uuid']: power_state.RUNNING}, power_states)
+
     def _test_lifecycle_event(self, lifecycle_event, power_state):
         instance = self._create_fake_instance()
         uuid = instance['uuid']
@@ -8209,6 +8265,24 @@ class ComputeAPITestCase(BaseTestCase):
 
         db.instance_destroy(self.context, refs[0]['uuid'])
 
+    def test_create_multiple_instances_in_bulk(self):
+        (refs, resv_id) = self.compute_api.create(self.context,
+                flavors.get_default_flavor(), image_href='some-fake-image',
+                min_count=3, max_count=3, display_name='x')
+        self.assertEqual([0, 1, 2], [ref['launch_index'] for ref in refs])
+        self.assertEqual(3, len(set(ref['uuid'] for ref in refs)))
+        for ref in refs:
+            instance = instance_obj.Instance.get_by_uuid(
+                self.context, ref['uuid'],
+                expected_attrs=['system_metadata', 'security_groups'])
+            self.assertEqual(resv_id, instance.reservation_id)
+            self.assertEqual('x-%s' % instance.uuid, instance.display_name)
+            self.assertEqual('x-%s' % instance.uuid, instance.hostname)
+            self.assertEqual(['default'],
+                             [group.name for group in
+                              instance.security_groups])
+            self.assertIn('instance_type_id', instance.system_metadata)
+
     def test_multi_instance_display_name_template(self):
         self.flags(multi_instance_display_name_template='%(name)s')
         (refs, resv_id) = self.compute_api.create(self.context,
@@ -9445,6 +9519,25 @@ class ComputeAPIAggrTestCase(BaseTestCase):
                          'aggregate.addhost.end')
         self.assertEqual(len(aggr['hosts']), 1)
 
+    def test_aggregate_changes_invalidate_scheduler_aggregates(self):
+        values = _create_service_entries(self.context)
+        fake_zone = values.keys()[0]
+        fake_host = values[fake_zone][0]
+        aggr = self.api.create_aggregate(self.context,
+                                         'fake_aggregate', fake_zone)
+        with mock.patch.object(self.api.scheduler_rpcapi,
+                               'invalidate_aggregates') as invalidate:
+            self.api.add_host_to_aggregate(self.context, aggr['id'],
+                                           fake_host)
+            self.api.update_aggregate_metadata(self.context, aggr['id'],
+                                               {'foo_key1': 'foo_value1'})
+            self.api.update_aggregate(self.context, aggr['id'],
+                                      {'name': 'new_fake_aggregate'})
+            self.api.remove_host_from_aggregate(self.context, aggr['id'],
+                                                fake_host)
+            self.assertEqual([mock.call(self.context)] * 3,
+                             invalidate.call_args_list)
+
     def test_add_host_to_aggr_with_no_az(self):
         values = _create_service_entries(self.context)
         fake_zone = values.keys()[0]
@@ -737,6 +737,191 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                 self._test_sync_to_stop(power_state.RUNNING, vs, ps,
                                         stop=False)
 
+    def test_sync_power_states_bulk(self):
+        instances = instance_obj.InstanceList()
+        instances.objects = []
+        for i, task_state in enumerate((None, None, None,
+                                        task_states.REBOOTING)):
+            instance = instance_obj.Instance()
+            instance.uuid = 'fake-uuid%d' % i
+            instance.power_state = power_state.RUNNING
+            instance.vm_state = vm_states.ACTIVE
+            instance.host = self.compute.host
+            instance.task_state = task_state
+            instance.obj_reset_changes()
+            instances.objects.append(instance)
+        vm_power_states = {'fake-uuid0': power_state.RUNNING,
+                           'fake-uuid1': power_state.SHUTDOWN,
+                           'fake-uuid2': power_state.SHUTDOWN,
+                           'fake-uuid3': power_state.SHUTDOWN}
+
+        def fake_update_power_states(host, power_states):
+            self.assertEqual(self.compute.host, host)
+            self.assertEqual({'fake-uuid1': power_state.SHUTDOWN,
+                              'fake-uuid2': power_state.SHUTDOWN},
+                             power_states)
+            # NOTE: fake-uuid2 got a task since it was listed
+            return ['fake-uuid1']
+
+        with contextlib.nested(
+            mock.patch.object(instance_obj.InstanceList, 'get_by_host',
+                              return_value=instances),
+            mock.patch.object(instances, 'update_power_states',
+                              side_effect=fake_update_power_states),
+            mock.patch.object(self.compute.driver, 'get_power_states',
+                              return_value=vm_power_states),
+            mock.patch.object(self.compute.driver, 'get_info'),
+            mock.patch.object(self.compute, '_sync_instance_vm_state'),
+            mock.patch.object(self.compute, '_sync_instance_power_state'),
+        ) as (get_by_host, update_power_states, get_power_states, get_info,
+              sync_vm_state, sync_power_state):
+            self.compute._sync_power_states(self.context)
+
+        get_by_host.assert_called_once_with(self.context, self.compute.host,
+                                            use_slave=True)
+        self.assertEqual(1, update_power_states.call_count)
+        self.assertFalse(get_info.called)
+        sync_vm_state.assert_called_once_with(self.context, instances[0],
+                                              power_state.RUNNING)
+        # NOTE: instances to stop are re-checked on the master first
+        sync_power_state.assert_called_once_with(self.context, instances[1],
+                                                 power_state.SHUTDOWN)
+
+    def _test_sync_power_states_bulk_stop(self, task_state, stopped):
+        instance = instance_obj.Instance()
+        instance.uuid = 'fake-uuid'
+        instance.power_state = power_state.RUNNING
+        instance.vm_state = vm_states.ACTIVE
+        instance.host = self.compute.host
+        instance.task_state = None
+        instance.obj_reset_changes()
+        instances = instance_obj.InstanceList()
+        instances.objects = [instance]
+
+        def fake_refresh(use_slave=False):
+            self.assertFalse(use_slave)
+            instance.power_state = power_state.SHUTDOWN
+            instance.task_state = task_state
+
+        self.mox.StubOutWithMock(instance_obj.InstanceList, 'get_by_host')
+        self.mox.StubOutWithMock(instances, 'update_power_states')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
+        self.mox.StubOutWithMock(self.compute.compute_api, 'stop')
+        self.stubs.Set(instance, 'refresh', fake_refresh)
+        instance_obj.InstanceList.get_by_host(
+            self.context, self.compute.host,
+            use_slave=True).AndReturn(instances)
+        self.compute.driver.get_power_states().AndReturn(
+            {'fake-uuid': power_state.SHUTDOWN})
+        instances.update_power_states(
+            self.compute.host,
+            {'fake-uuid': power_state.SHUTDOWN}).AndReturn(['fake-uuid'])
+        if stopped:
+            self.compute.compute_api.stop(self.context, instance)
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(self.context)
+
+    def test_sync_power_states_bulk_stops_instance(self):
+        self._test_sync_power_states_bulk_stop(None, True)
+
+    def test_sync_power_states_bulk_rechecks_task_before_stop(self):
+        # NOTE: the instance got a task after the power states were updated
+        self._test_sync_power_states_bulk_stop(task_states.POWERING_ON, False)
+
+    def test_run_image_prefetch_pass(self):
+        self.flags(image_prefetch_interval=60,
+                   image_prefetch_ids=['image1', 'image2', 'image3'])
+        with contextlib.nested(
+            mock.patch.dict(self.compute.driver.capabilities,
+                            has_imagecache=True),
+            mock.patch.object(self.compute.driver, 'get_cached_images',
+                              return_value=['image2']),
+            mock.patch.object(self.compute.driver, 'prefetch_image',
+                              side_effect=[test.TestingException, None]),
+        ) as (capabilities, get_cached_images, prefetch_image):
+            self.compute._run_image_prefetch_pass(self.context)
+            self.compute._prefetch_pool.waitall()
+
+        self.assertEqual([mock.call(self.context, 'image1'),
+                          mock.call(self.context, 'image3')],
+                         prefetch_image.call_args_list)
+        self.assertEqual(set(), self.compute._prefetching)
+
+    def test_run_image_prefetch_pass_skips_running_prefetches(self):
+        self.flags(image_prefetch_interval=60,
+                   image_prefetch_ids=['image1', 'image2'])
+        self.compute._prefetching.add('image1')
+        with contextlib.nested(
+            mock.patch.dict(self.compute.driver.capabilities,
+                            has_imagecache=True),
+            mock.patch.object(self.compute.driver, 'get_cached_images',
+                              return_value=[]),
+            mock.patch.object(self.compute._prefetch_pool, 'spawn_n'),
+        ) as (capabilities, get_cached_images, spawn_n):
+            self.compute._run_image_prefetch_pass(self.context)
+
+        spawn_n.assert_called_once_with(self.compute._prefetch_image_safe,
+                                        self.context, 'image2')
+        self.assertEqual(set(['image1', 'image2']), self.compute._prefetching)
+
+    def test_run_image_prefetch_pass_keystone(self):
+        self.flags(image_prefetch_interval=60, image_prefetch_ids=['image1'],
+                   auth_strategy='keystone',
+                   image_prefetch_admin_username='prefetch',
+                   image_prefetch_admin_password='secret',
+                   image_prefetch_admin_tenant_name='service')
+        keystone = mock.Mock(auth_token='fake-token',
+                             auth_user_id='fake-user',
+                             auth_tenant_id='fake-tenant')
+        with contextlib.nested(
+            mock.patch.dict(self.compute.driver.capabilities,
+                            has_imagecache=True),
+            mock.patch.object(self.compute.driver, 'get_cached_images',
+                              return_value=[]),
+            mock.patch.object(self.compute.driver, 'prefetch_image'),
+            mock.patch('keystoneclient.v2_0.client.Client',
+                       return_value=keystone),
+        ) as (capabilities, get_cached_images, prefetch_image, client):
+            self.compute._run_image_prefetch_pass(self.context)
+            self.compute._prefetch_pool.waitall()
+
+        client.assert_called_once_with(
+                username='prefetch', password='secret',
+                tenant_name='service', auth_url='http://localhost:5000/v2.0')
+        prefetch_context, image_id = prefetch_image.call_args[0]
+        self.assertEqual('image1', image_id)
+        self.assertEqual('fake-token', prefetch_context.auth_token)
+        self.assertEqual('fake-user', prefetch_context.user_id)
+        self.assertEqual('fake-tenant', prefetch_context.project_id)
+
+    def test_run_image_prefetch_pass_keystone_without_user(self):
+        self.flags(image_prefetch_interval=60, image_prefetch_ids=['image1'],
+                   auth_strategy='keystone')
+        with contextlib.nested(
+            mock.patch.dict(self.compute.driver.capabilities,
+                            has_imagecache=True),
+            mock.patch.object(self.compute.driver, 'get_cached_images',
+                              return_value=[]),
+            mock.patch.object(self.compute.driver, 'prefetch_image'),
+            mock.patch('keystoneclient.v2_0.client.Client'),
+        ) as (capabilities, get_cached_images, prefetch_image, client):
+            self.compute._run_image_prefetch_pass(self.context)
+
+        self.assertFalse(client.called)
+        self.assertFalse(prefetch_image.called)
+        self.assertEqual(set(), self.compute._prefetching)
+
+    def test_run_image_prefetch_pass_disabled(self):
+        self.flags(image_prefetch_interval=0, image_prefetch_ids=['image1'])
+        with contextlib.nested(
+            mock.patch.dict(self.compute.driver.capabilities,
+                            has_imagecache=True),
+            mock.patch.object(self.compute.driver, 'prefetch_image'),
+        ) as (capabilities, prefetch_image):
+            self.compute._run_image_prefetch_pass(self.context)
+
+        self.assertFalse(prefetch_image.called)
+
     def test_run_pending_deletes(self):
         self.flags(instance_delete_interval=10)
 
@@ -15,9 +15,11 @@
 
 """Tests for compute resource tracking."""
 
-import mock
+import contextlib
 import uuid
 
+import mock
+
 from oslo.config import cfg
 
 from nova.compute import flavors
@@ -535,6 +537,68 @@ class TrackerTestCase(BaseTrackerTestCase):
         self.assertEqual(driver.pci_stats,
             jsonutils.loads(self.tracker.compute_node['pci_stats']))
 
+    def test_update_pushes_host_state(self):
+        self.flags(compute_push_host_state=True)
+        with mock.patch.object(self.tracker.scheduler_rpcapi,
+                               'update_host_state') as mock_push:
+            self.tracker.update_available_resource(self.context)
+            mock_push.assert_called_once_with(self.context,
+                    self.tracker.host, self.tracker.nodename,
+                    self.tracker.compute_node)
+
+    def test_update_does_not_push_host_state_by_default(self):
+        with mock.patch.object(self.tracker.scheduler_rpcapi,
+                               'update_host_state') as mock_push:
+            self.tracker.update_available_resource(self.context)
+            self.assertFalse(mock_push.called)
+
+    def test_update_sends_only_changes(self):
+        values = dict(self.tracker.compute_node, free_ram_mb=1)
+        with mock.patch.object(self.tracker.conductor_api,
+                               'compute_node_update',
+                               return_value=values) as mock_update:
+            self.tracker._update(self.context, values)
+            mock_update.assert_called_once_with(self.context,
+                    {'id': self.compute['id']}, {'free_ram_mb': 1})
+
+    def test_update_touches_compute_node_without_changes(self):
+        self.flags(compute_push_host_state=True)
+        values = dict(self.tracker.compute_node)
+        with contextlib.nested(
+            mock.patch.object(self.tracker.conductor_api,
+                              'compute_node_update', return_value=values),
+            mock.patch.object(self.tracker.scheduler_rpcapi,
+                              'update_host_state')
+        ) as (mock_update, mock_push):
+            self.tracker._update(self.context, values)
+            mock_update.assert_called_once_with(self.context,
+                    {'id': self.compute['id']}, {})
+            mock_push.assert_called_once_with(self.context,
+                    self.tracker.host, self.tracker.nodename, values)
+
+    def test_audit_interval(self):
+        self.flags(resource_audit_interval=600)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.tracker._last_audit = timeutils.utcnow()
+
+        with contextlib.nested(
+            mock.patch.object(self.tracker.driver,
+                              'get_available_resource', return_value=None),
+            mock.patch.object(self.tracker, '_update')
+        ) as (mock_resources, mock_update):
+            timeutils.advance_time_seconds(599)
+            self.tracker.update_available_resource(self.context)
+            self.assertFalse(mock_resources.called)
+            mock_update.assert_called_once_with(self.context,
+                                                self.tracker.compute_node)
+            self.assertEqual('[]', self.tracker.compute_node['metrics'])
+
+            timeutils.advance_time_seconds(1)
+            self.tracker.update_available_resource(self.context)
+            mock_resources.assert_called_once_with(self.tracker.nodename)
+            self.assertTrue(self.tracker.disabled)
+
 
 class TrackerPciStatsTestCase(BaseTrackerTestCase):
 
@@ -801,6 +801,47 @@ class ConductorTestCase(_BaseTestCase, test.TestCase):
         self.assertIn('dict', updates)
         self.assertEqual({'foo': 'bar'}, updates['dict'])
 
+    def test_object_action_delta(self):
+        class TestObject(obj_base.NovaObject):
+            fields = {'foo': fields.IntegerField(),
+                      'bar': fields.StringField(),
+                      'baz': fields.StringField()}
+
+            def touch(self, context):
+                self.bar = 'changed'
+                self.obj_reset_changes()
+
+        obj = TestObject(foo=1, bar='bar' * 20, baz='baz' * 20)
+        obj.obj_reset_changes()
+        obj.foo = 2
+        delta, digests, bytes_saved = obj.obj_make_delta()
+        updates, result = self.conductor.object_action_delta(
+            self.context, delta, 'touch', tuple(), {}, digests)
+        self.assertEqual({'bar': 'changed', 'obj_what_changed': set()},
+                         updates)
+
+    def test_object_action_multi(self):
+        class TestObject(obj_base.NovaObject):
+            fields = {'foo': fields.IntegerField()}
+
+            def touch(self, context, value):
+                if value < 0:
+                    raise exc.InvalidInput(reason='negative')
+                self.foo = value
+
+        objs = [TestObject(foo=1), TestObject(foo=2)]
+        actions = [(objs[0], 'touch', (3,), {}),
+                   (objs[1], 'touch', (-1,), {})]
+        results = self.conductor.object_action_multi(self.context, actions)
+        self.assertEqual(2, len(results))
+        updates, result, error = results[0]
+        self.assertEqual(3, updates['foo'])
+        self.assertIsNone(error)
+        updates, result, error = results[1]
+        self.assertIsNone(updates)
+        self.assertEqual('InvalidInput', error['class'])
+        self.assertIn('negative', error['message'])
+
     def test_aggregate_metadata_add(self):
         aggregate = {'name': 'fake aggregate', 'id': 'fake-id'}
         metadata = {'foo': 'bar'}
@@ -1773,6 +1814,8 @@ class ConductorV2ManagerProxyTestCase(test.NoDBTestCase):
             ('object_class_action', 5),
             ('object_action', 4),
             ('object_backport', 2),
+            ('object_action_delta', 5),
+            ('object_action_multi', 1),
         ]
 
         for method, num_args in methods:
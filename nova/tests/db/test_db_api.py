@@ -44,12 +44,14 @@ from nova.db.sqlalchemy import api as sqlalchemy_api
 from nova.db.sqlalchemy import models
 from nova.db.sqlalchemy import utils as db_utils
 from nova import exception
+from nova.network import model as network_model
 from nova.openstack.common.db import exception as db_exc
 from nova.openstack.common import jsonutils
 from nova.openstack.common import timeutils
 from nova.openstack.common import uuidutils
 from nova import quota
 from nova import test
+from nova.tests import fake_network_cache_model
 from nova.tests import matchers
 from nova import utils
 
@@ -431,6 +433,33 @@ class AggregateDBApiTestCase(test.TestCase):
                                                key='good')
         self.assertNotIn('good', r2)
 
+    def test_aggregate_host_metadata_get_all(self):
+        ctxt = context.get_admin_context()
+        values2 = {'name': 'fake_aggregate12'}
+        values3 = {'name': 'fake_aggregate23'}
+        values4 = {'name': 'fake_aggregate_no_metadata'}
+        a2_hosts = ['foo1.openstack.org', 'foo2.openstack.org']
+        a2_metadata = {'good': 'value12', 'bad': 'badvalue12'}
+        a3_hosts = ['foo2.openstack.org', 'foo3.openstack.org']
+        a3_metadata = {'good': 'value23'}
+        _create_aggregate_with_hosts(context=ctxt, values=values2,
+                hosts=a2_hosts, metadata=a2_metadata)
+        _create_aggregate_with_hosts(context=ctxt, values=values3,
+                hosts=a3_hosts, metadata=a3_metadata)
+        _create_aggregate_with_hosts(context=ctxt, values=values4,
+                hosts=['foo4.openstack.org'], metadata={})
+        r1 = db.aggregate_host_metadata_get_all(ctxt)
+        self.assertEqual({
+            'foo1.openstack.org': {'good': set(['value12']),
+                                   'bad': set(['badvalue12'])},
+            'foo2.openstack.org': {'good': set(['value12', 'value23']),
+                                   'bad': set(['badvalue12'])},
+            'foo3.openstack.org': {'good': set(['value23'])},
+        }, r1)
+        for host in a2_hosts + a3_hosts:
+            self.assertEqual(db.aggregate_metadata_get_by_host(ctxt, host),
+                             r1[host])
+
     def test_aggregate_host_get_by_metadata_key(self):
         ctxt = context.get_admin_context()
         values2 = {'name': 'fake_aggregate12'}
@@ -1415,6 +1444,86 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         for key in dt_keys:
             self.assertEqual(inst[key], dt)
 
+    def test_instance_create_bulk(self):
+        values_list = []
+        for hostname in ('h1', 'h2'):
+            values = self.sample_data.copy()
+            values.update({'uuid': uuidutils.generate_uuid(),
+                           'hostname': hostname,
+                           'info_cache': {'network_info': '[]'},
+                           'security_groups': ['default']})
+            values_list.append(values)
+        bdms = {values_list[0]['uuid']: [
+            {'instance_uuid': values_list[0]['uuid'], 'device_name': 'vdb',
+             'source_type': 'blank', 'destination_type': 'local',
+             'guest_format': 'swap', 'volume_size': 1},
+            {'instance_uuid': values_list[0]['uuid'], 'device_name': 'vdb',
+             'source_type': 'blank', 'destination_type': 'local',
+             'guest_format': 'swap', 'volume_size': 2},
+            {'instance_uuid': values_list[0]['uuid'], 'device_name': 'vdc',
+             'source_type': 'blank', 'destination_type': 'local',
+             'guest_format': 'swap', 'volume_size': 3}]}
+
+        instances = db.instance_create_bulk(self.ctxt, values_list, bdms)
+
+        self.assertEqual([values['uuid'] for values in values_list],
+                         [instance['uuid'] for instance in instances])
+        for instance, values in zip(instances, values_list):
+            self.assertEqual(values['hostname'], instance['hostname'])
+            self.assertEqual(self.sample_data['metadata'],
+                             utils.metadata_to_dict(instance['metadata']))
+            self.assertEqual(self.sample_data['system_metadata'],
+                             utils.metadata_to_dict(
+                                 instance['system_metadata']))
+            self.assertEqual('[]', instance['info_cache']['network_info'])
+            self.assertEqual('{}', instance['info_cache']['addresses'])
+            self.assertEqual(['default'], [group['name'] for group in
+                                           instance['security_groups']])
+            self.assertTrue(db.get_ec2_instance_id_by_uuid(self.ctxt,
+                                                           values['uuid']))
+        # The later mappings override or replace the earlier ones the way
+        # block_device_mapping_update_or_create() does.
+        created_bdms = db.block_device_mapping_get_all_by_instance(
+                self.ctxt, values_list[0]['uuid'])
+        self.assertEqual([('vdc', 3)],
+                         [(bdm['device_name'], bdm['volume_size'])
+                          for bdm in created_bdms])
+        self.assertEqual([], db.block_device_mapping_get_all_by_instance(
+                self.ctxt, values_list[1]['uuid']))
+
+    def test_instance_create_bulk_duplicate_names(self):
+        self.flags(osapi_compute_unique_server_name_scope='project')
+        values_list = [{'uuid': uuidutils.generate_uuid(), 'hostname': name}
+                       for name in ('h1', 'H1')]
+        self.assertRaises(exception.InstanceExists,
+                          db.instance_create_bulk, self.ctxt, values_list)
+        self.assertRaises(exception.InstanceNotFound,
+                          db.instance_get_by_uuid, self.ctxt,
+                          values_list[0]['uuid'])
+
+    def test_instance_create_bulk_unknown_security_group(self):
+        values = {'uuid': uuidutils.generate_uuid(),
+                  'security_groups': ['default', 'unknown']}
+        self.assertRaises(exception.SecurityGroupNotFoundForProject,
+                          db.instance_create_bulk, self.ctxt, [values])
+        self.assertRaises(exception.InstanceNotFound,
+                          db.instance_get_by_uuid, self.ctxt, values['uuid'])
+
+    def test_instance_info_cache_update_addresses(self):
+        instance = self.create_instance_with_args()
+        nw_info = network_model.NetworkInfo(
+            [fake_network_cache_model.new_vif()])
+        db.instance_info_cache_update(self.ctxt, instance['uuid'],
+                                      {'network_info': nw_info.json()})
+        info_cache = db.instance_info_cache_get(self.ctxt, instance['uuid'])
+        self.assertEqual(nw_info.addresses(),
+                         jsonutils.loads(info_cache['addresses']))
+
+        db.instance_info_cache_update(self.ctxt, instance['uuid'],
+                                      {'network_info': None})
+        info_cache = db.instance_info_cache_get(self.ctxt, instance['uuid'])
+        self.assertIsNone(info_cache['addresses'])
+
     def test_instance_update_with_object_values(self):
         values = {
             'access_ip_v4': netaddr.IPAddress('1.2.3.4'),
@@ -1742,6 +1851,102 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
             self.assertTrue(result[1]['cleaned'])
             self.assertFalse(result[0]['cleaned'])
 
+    def test_instance_get_all_by_filters_keyset_ties(self):
+        # All instances share the same host, so pages are keyed on id
+        instances = [self.create_instance_with_args() for i in range(5)]
+        expected = sorted(inst['uuid'] for inst in instances)
+        result = db.instance_get_all_by_filters(self.ctxt, {}, 'host',
+                                                'asc', limit=2)
+        pages = [result]
+        while result:
+            result = db.instance_get_all_by_filters(self.ctxt, {}, 'host',
+                                                    'asc', limit=2,
+                                                    marker=result[-1]['uuid'])
+            pages.append(result)
+        self.assertEqual([2, 2, 1, 0], [len(page) for page in pages])
+        uuids = sorted(inst['uuid'] for page in pages for inst in page)
+        self.assertEqual(expected, uuids)
+
+    def test_instance_get_all_by_filters_keyset_desc(self):
+        instances = [self.create_instance_with_args() for i in range(3)]
+        result = db.instance_get_all_by_filters(self.ctxt, {}, 'id', 'desc')
+        self.assertEqual([inst['uuid'] for inst in reversed(instances)],
+                         [inst['uuid'] for inst in result])
+        result = db.instance_get_all_by_filters(self.ctxt, {}, 'id', 'desc',
+                                                marker=instances[2]['uuid'])
+        self.assertEqual([instances[1]['uuid'], instances[0]['uuid']],
+                         [inst['uuid'] for inst in result])
+
+    def test_instance_get_all_by_filters_keyset_null_sort_value(self):
+        inst1 = self.create_instance_with_args()
+        inst2 = self.create_instance_with_args()
+        inst3 = self.create_instance_with_args(launched_at=timeutils.utcnow())
+        result = db.instance_get_all_by_filters(self.ctxt, {}, 'launched_at',
+                                                'asc', marker=inst1['uuid'])
+        self.assertEqual([inst2['uuid'], inst3['uuid']],
+                         [inst['uuid'] for inst in result])
+
+    def test_instance_get_all_by_filters_keyset_desc_null_sort_value(self):
+        # NULLs are sorted last in descending order on SQLite
+        inst1 = self.create_instance_with_args(launched_at=timeutils.utcnow())
+        inst2 = self.create_instance_with_args()
+        inst3 = self.create_instance_with_args()
+        result = db.instance_get_all_by_filters(self.ctxt, {}, 'launched_at',
+                                                'desc', marker=inst1['uuid'])
+        self.assertEqual([inst3['uuid'], inst2['uuid']],
+                         [inst['uuid'] for inst in result])
+        result = db.instance_get_all_by_filters(self.ctxt, {}, 'launched_at',
+                                                'desc', marker=inst3['uuid'])
+        self.assertEqual([inst2['uuid']], [inst['uuid'] for inst in result])
+
+    def test_instance_get_all_by_filters_marker_not_found(self):
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters, self.ctxt, {},
+                          'created_at', 'desc', marker='fake-uuid')
+
+    def test_instance_get_all_by_filters_columns(self):
+        inst = self.create_instance_with_args(display_name='foo')
+        result = db.instance_get_all_by_filters(self.ctxt, {}, 'created_at',
+                                                'desc',
+                                                columns=['display_name'],
+                                                columns_to_join=['metadata'])
+        self.assertEqual(1, len(result))
+        self.assertEqual(set(['id', 'uuid', 'created_at', 'display_name',
+                              'metadata', 'system_metadata']),
+                         set(result[0].keys()))
+        self.assertEqual(inst['uuid'], result[0]['uuid'])
+        self.assertEqual('foo', result[0]['display_name'])
+        self.assertEqual(self.sample_data['metadata'],
+                         utils.metadata_to_dict(result[0]['metadata']))
+        self.assertEqual([], result[0]['system_metadata'])
+
+    def test_instance_get_all_by_filters_columns_with_filters(self):
+        inst = self.create_instance_with_args(host='h2')
+        self.create_instance_with_args()
+        result = db.instance_get_all_by_filters(self.ctxt,
+                                                {'host': 'h2',
+                                                 'deleted': False},
+                                                'created_at', 'desc',
+                                                columns=['uuid'],
+                                                columns_to_join=[])
+        self.assertEqual([inst['uuid']], [i['uuid'] for i in result])
+
+    def test_instance_get_all_by_filters_chunked(self):
+        instances = [self.create_instance_with_args() for i in range(5)]
+        result = db.instance_get_all_by_filters_chunked(self.ctxt, {}, 'id',
+                                                        'asc', chunk_size=2)
+        self.assertIsInstance(result, types.GeneratorType)
+        self._assertEqualListsOfInstances(instances, list(result))
+
+    def test_instance_get_all_by_filters_chunked_columns(self):
+        instances = [self.create_instance_with_args() for i in range(3)]
+        result = db.instance_get_all_by_filters_chunked(self.ctxt, {},
+                                                        chunk_size=1,
+                                                        columns=['uuid'],
+                                                        columns_to_join=[])
+        self.assertEqual([inst['uuid'] for inst in reversed(instances)],
+                         [inst['uuid'] for inst in result])
+
     def test_instance_get_all_by_host_and_node_no_join(self):
         instance = self.create_instance_with_args()
         result = db.instance_get_all_by_host_and_node(self.ctxt, 'h1', 'n1')
@@ -1868,6 +2073,34 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         meta = utils.metadata_to_dict(new_ref['metadata'])
         self.assertEqual(meta, {'mk1': 'mv3'})
 
+    def test_instance_update_power_states(self):
+        changed = self.create_instance_with_args(power_state=1)
+        unchanged = self.create_instance_with_args(power_state=4)
+        busy = self.create_instance_with_args(power_state=1,
+                                              task_state='rebooting')
+        moved = self.create_instance_with_args(power_state=1, host='h2')
+        power_states = dict((inst['uuid'], 4)
+                            for inst in (changed, unchanged, busy, moved))
+
+        updated = db.instance_update_power_states(self.ctxt, 'h1',
+                                                  power_states)
+
+        self.assertEqual(1, len(updated))
+        old_ref, new_ref = updated[0]
+        self.assertEqual(changed['uuid'], new_ref['uuid'])
+        self.assertEqual(1, old_ref['power_state'])
+        self.assertEqual(4, new_ref['power_state'])
+        sys_meta = utils.metadata_to_dict(new_ref['system_metadata'])
+        self.assertEqual(self.sample_data['system_metadata'], sys_meta)
+        for inst, power_state in ((changed, 4), (unchanged, 4), (busy, 1),
+                                  (moved, 1)):
+            self.assertEqual(power_state, db.instance_get_by_uuid(
+                self.ctxt, inst['uuid'])['power_state'])
+
+    def test_instance_update_power_states_empty(self):
+        self.assertEqual([], db.instance_update_power_states(self.ctxt, 'h1',
+                                                             {}))
+
     def test_instance_update_unique_name(self):
         context1 = context.RequestContext('user1', 'p1')
         context2 = context.RequestContext('user2', 'p2')
@@ -3367,6 +3600,29 @@ class FixedIPTestCase(BaseInstanceTypeTestCase):
         fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
         self.assertEqual(fixed_ip['instance_uuid'], instance_uuid)
 
+    def test_fixed_ip_associate_pool_sets_network_and_host(self):
+        network = db.network_create_safe(self.ctxt, {})
+
+        address = self.create_fixed_ip()
+        db.fixed_ip_associate_pool(self.ctxt, network['id'], host='host1')
+        fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
+        self.assertEqual(network['id'], fixed_ip['network_id'])
+        self.assertEqual('host1', fixed_ip['host'])
+        self.assertIsNone(fixed_ip['instance_uuid'])
+
+    def test_fixed_ip_associate_pool_spread(self):
+        self.flags(fixed_ip_allocation_spread=10)
+        instance_uuid = self._create_instance()
+        network = db.network_create_safe(self.ctxt, {})
+
+        address = self.create_fixed_ip(network_id=network['id'])
+        db.fixed_ip_associate_pool(self.ctxt, network['id'], instance_uuid)
+        fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
+        self.assertEqual(fixed_ip['instance_uuid'], instance_uuid)
+        self.assertRaises(exception.NoMoreFixedIps,
+                          db.fixed_ip_associate_pool,
+                          self.ctxt, network['id'], instance_uuid)
+
     def test_fixed_ip_create_same_address(self):
         address = '192.168.1.5'
         params = {'address': address}
@@ -5573,6 +5829,31 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self._assertEqualListsOfObjects(expected, result,
                                         ignored_keys=['stats'])
 
+    def test_compute_node_get_all_changed_since(self):
+        before = timeutils.utcnow() - datetime.timedelta(seconds=10)
+        after = timeutils.utcnow() + datetime.timedelta(seconds=10)
+
+        nodes, services = db.compute_node_get_all_changed_since(self.ctxt,
+                                                                before)
+        self.assertEqual([self.item['id']], [n['id'] for n in nodes])
+        self.assertEqual(self.service['host'], nodes[0]['service']['host'])
+        self.assertEqual([self.service['host']],
+                         [service['host'] for service in services])
+        nodes, services = db.compute_node_get_all_changed_since(self.ctxt,
+                                                                after)
+        self.assertEqual([], nodes)
+        self.assertEqual([self.service['host']],
+                         [service['host'] for service in services])
+
+    def test_compute_node_get_all_changed_since_deleted(self):
+        before = timeutils.utcnow() - datetime.timedelta(seconds=10)
+        db.compute_node_delete(self.ctxt, self.item['id'])
+
+        nodes, services = db.compute_node_get_all_changed_since(self.ctxt,
+                                                                before)
+        self.assertEqual(1, len(nodes))
+        self.assertTrue(nodes[0]['deleted'])
+
     def test_compute_node_get(self):
         compute_node_id = self.item['id']
         node = db.compute_node_get(self.ctxt, compute_node_id)
@@ -694,6 +694,29 @@ class TestNovaMigrations(BaseWalkMigrationTestCase, CommonTestsMixIn):
         # confirm compute_node_stats exists
         db_utils.get_table(engine, 'compute_node_stats')
 
+    def _check_234(self, engine, data):
+        self.assertIndexMembers(engine, 'instances',
+                                'instances_deleted_created_at_idx',
+                                ['deleted', 'created_at', 'id'])
+
+    def _post_downgrade_234(self, engine):
+        instances = db_utils.get_table(engine, 'instances')
+        self.assertNotIn('instances_deleted_created_at_idx',
+                         [idx.name for idx in instances.indexes])
+
+    def _check_235(self, engine, data):
+        for table_name in ('instance_info_caches',
+                           'shadow_instance_info_caches'):
+            self.assertColumnExists(engine, table_name, 'addresses')
+            table = db_utils.get_table(engine, table_name)
+            self.assertIsInstance(table.c.addresses.type,
+                                  sqlalchemy.types.Text)
+
+    def _post_downgrade_235(self, engine):
+        for table_name in ('instance_info_caches',
+                           'shadow_instance_info_caches'):
+            self.assertColumnNotExists(engine, table_name, 'addresses')
+
 
 class TestBaremetalMigrations(BaseWalkMigrationTestCase, CommonTestsMixIn):
     """Test sqlalchemy-migrate migrations."""
@@ -166,6 +166,8 @@ class _FakeImageService(object):
         elif dst_path:
             with open(dst_path, 'wb') as data:
                 data.write(self._imagedata.get(image_id, ''))
+        else:
+            return iter([self._imagedata.get(image_id, '')])
 
     def show(self, context, image_id):
         """Get data about specified image.
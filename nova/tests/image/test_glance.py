@@ -16,6 +16,7 @@
 
 import datetime
 import filecmp
+import hashlib
 import os
 import random
 import tempfile
@@ -24,6 +25,7 @@ import time
 import sys
 import testtools
 
+import fixtures
 import mock
 import mox
 
@@ -33,6 +35,8 @@ from oslo.config import cfg
 from nova import context
 from nova import exception
 from nova.image import glance
+from nova.openstack.common import jsonutils
+from nova.openstack.common import units
 from nova import test
 from nova.tests.api.openstack import fakes
 from nova.tests.glance import stubs as glance_stubs
@@ -1130,6 +1134,155 @@ class TestGlanceApiServers(test.TestCase):
                 break
 
 
+class TestGlanceRangedDownload(test.NoDBTestCase):
+    def setUp(self):
+        super(TestGlanceRangedDownload, self).setUp()
+        self.flags(glance_download_workers=4, glance_download_range_size=1,
+                   glance_api_servers=['host1:9292', 'host2:9292'])
+        self.data = ''.join(chr(i) for i in range(256)) * 10 * 1024
+        self.image = mock.Mock(id='fake-image', size=len(self.data),
+                               checksum=hashlib.md5(self.data).hexdigest())
+        self.client = mock.Mock()
+        self.client.call.side_effect = self._fake_call
+        self.service = glance.GlanceImageService(client=self.client)
+        self.dst_path = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'image.part')
+        self.requested = []
+        self.stubs.Set(glance, '_get_image_range', self._fake_get_range)
+
+    def _fake_call(self, context, version, method, image_id):
+        if method == 'get':
+            return self.image
+        return [self.data]
+
+    def _fake_get_range(self, context, host, port, use_ssl, image_id,
+                        start, end):
+        self.requested.append((host, start, end))
+        return iter([self.data[start:end + 1]])
+
+    def _read_dst(self):
+        with open(self.dst_path) as f:
+            return f.read()
+
+    def test_download(self):
+        self.service.download('context', 'fake-image',
+                              dst_path=self.dst_path)
+        self.assertEqual(self.data, self._read_dst())
+        self.assertEqual([(0, units.Mi - 1),
+                          (units.Mi, 2 * units.Mi - 1),
+                          (2 * units.Mi, len(self.data) - 1)],
+                         sorted((start, end)
+                                for _host, start, end in self.requested))
+        self.assertEqual(set(['host1', 'host2']),
+                         set(host for host, _start, _end in self.requested))
+        self.assertFalse(os.path.exists(self.dst_path + '.ranges'))
+
+    def test_download_range_not_supported(self):
+        def fake_get_range(*args):
+            raise glance._RangeNotSupported()
+
+        self.stubs.Set(glance, '_get_image_range', fake_get_range)
+        self.service.download('context', 'fake-image',
+                              dst_path=self.dst_path)
+        self.assertEqual(self.data, self._read_dst())
+        self.client.call.assert_called_with('context', 1, 'data',
+                                            'fake-image')
+
+    def test_download_range_not_supported_by_other_server(self):
+        def fake_get_range(context, host, port, use_ssl, image_id, start,
+                           end):
+            if start > 0:
+                raise glance._RangeNotSupported()
+            return iter([self.data[start:end + 1]])
+
+        self.stubs.Set(glance, '_get_image_range', fake_get_range)
+        self.service.download('context', 'fake-image',
+                              dst_path=self.dst_path)
+        self.assertEqual(self.data, self._read_dst())
+        self.client.call.assert_called_with('context', 1, 'data',
+                                            'fake-image')
+        self.assertFalse(os.path.exists(self.dst_path + '.ranges'))
+
+    def test_download_range_translates_errors(self):
+        def fake_get_range(context, host, port, use_ssl, image_id, start,
+                           end):
+            if start > 0:
+                raise glanceclient.exc.NotFound()
+            return iter([self.data[start:end + 1]])
+
+        self.stubs.Set(glance, '_get_image_range', fake_get_range)
+        self.assertRaises(exception.ImageNotFound,
+                          self.service.download, 'context', 'fake-image',
+                          dst_path=self.dst_path)
+
+    def test_download_first_range_translates_errors(self):
+        def fake_get_range(*args):
+            raise glanceclient.exc.Forbidden()
+
+        self.stubs.Set(glance, '_get_image_range', fake_get_range)
+        self.assertRaises(exception.ImageNotAuthorized,
+                          self.service.download, 'context', 'fake-image',
+                          dst_path=self.dst_path)
+
+    def test_download_resumes(self):
+        with open(self.dst_path, 'wb') as f:
+            f.write(self.data[:units.Mi])
+            f.truncate(len(self.data))
+        with open(self.dst_path + '.ranges', 'w') as f:
+            f.write(jsonutils.dumps({'id': self.image.id,
+                                     'size': self.image.size,
+                                     'checksum': self.image.checksum,
+                                     'done': [0]}))
+        self.service.download('context', 'fake-image',
+                              dst_path=self.dst_path)
+        self.assertEqual(self.data, self._read_dst())
+        self.assertNotIn(0, [start for _host, start, _end in self.requested])
+
+    def test_download_keeps_partial_file(self):
+        def fake_get_range(context, host, port, use_ssl, image_id, start,
+                           end):
+            if start >= 2 * units.Mi:
+                raise glanceclient.exc.CommunicationError()
+            return iter([self.data[start:end + 1]])
+
+        self.stubs.Set(glance, '_get_image_range', fake_get_range)
+        self.assertRaises(exception.GlanceConnectionFailed,
+                          self.service.download, 'context', 'fake-image',
+                          dst_path=self.dst_path)
+        with open(self.dst_path + '.ranges') as f:
+            state = jsonutils.loads(f.read())
+        self.assertEqual([0, units.Mi], state['done'])
+
+    def test_download_retries_from_last_byte(self):
+        self.flags(glance_num_retries=1)
+        calls = []
+
+        def fake_get_range(context, host, port, use_ssl, image_id, start,
+                           end):
+            calls.append(start)
+            if len(calls) == 2:
+                # Send half of the range and fail.
+                def body():
+                    yield self.data[start:start + 100]
+                    raise IOError('connection reset')
+                return body()
+            return iter([self.data[start:end + 1]])
+
+        self.stubs.Set(glance, '_get_image_range', fake_get_range)
+        self.service.download('context', 'fake-image',
+                              dst_path=self.dst_path)
+        self.assertEqual(self.data, self._read_dst())
+        self.assertEqual(calls[1] + 100, calls[2])
+
+    def test_download_checksum_mismatch(self):
+        self.image.checksum = 'bad-checksum'
+        self.assertRaises(exception.ImageUnacceptable,
+                          self.service.download, 'context', 'fake-image',
+                          dst_path=self.dst_path)
+        self.assertFalse(os.path.exists(self.dst_path))
+        self.assertFalse(os.path.exists(self.dst_path + '.ranges'))
+
+
 class TestUpdateGlanceImage(test.NoDBTestCase):
     def test_start(self):
         consumer = glance.UpdateGlanceImage(
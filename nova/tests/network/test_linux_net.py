@@ -269,6 +269,8 @@ class LinuxNetworkTestCase(test.NoDBTestCase):
         self.stubs.Set(db, 'virtual_interface_get_by_instance', get_vifs)
         self.stubs.Set(db, 'instance_get', get_instance)
         self.stubs.Set(db, 'network_get_associated_fixed_ips', get_associated)
+        self.stubs.Set(linux_net, '_dhcp_hosts', {})
+        self.stubs.Set(linux_net, '_dhcp_hosts_timers', {})
 
     def _test_add_snat_rule(self, expected):
         def verify_add_rule(chain, rule):
@@ -338,6 +340,77 @@ class LinuxNetworkTestCase(test.NoDBTestCase):
 
         self.driver.update_dhcp(self.context, "eth0", networks[0])
 
+    def _stub_dhcp_hosts_file(self):
+        written = []
+        self.stubs.Set(linux_net, 'write_to_file',
+                       lambda path, data: written.append(data))
+        self.stubs.Set(linux_net, 'restart_dhcp', lambda *args: None)
+        return written
+
+    def test_add_and_remove_dhcp_host(self):
+        written = self._stub_dhcp_hosts_file()
+        fixedip = fixed_ip_obj.FixedIPList.get_by_network(self.context,
+                                                          networks[0])[1]
+        full_hosts = self.driver.get_dhcp_hosts(self.context, networks[0])
+        self.driver.update_dhcp(self.context, "eth0", networks[0])
+        self.assertEqual([full_hosts], written)
+
+        self.mox.StubOutWithMock(db, 'network_get_associated_fixed_ips')
+        self.mox.ReplayAll()
+
+        self.driver.remove_dhcp_host(self.context, "eth0", networks[0],
+                                     fixedip)
+        self.assertEqual('\n'.join(line for line in full_hosts.split('\n')
+                                   if str(fixedip.address) not in line),
+                         written[-1])
+
+        self.driver.add_dhcp_host(self.context, "eth0", networks[0],
+                                  fixedip)
+        self.assertEqual(3, len(written))
+        self.assertEqual(sorted(full_hosts.split('\n')),
+                         sorted(written[-1].split('\n')))
+
+    def test_add_dhcp_host_keeps_position(self):
+        written = self._stub_dhcp_hosts_file()
+        fixedip = fixed_ip_obj.FixedIPList.get_by_network(self.context,
+                                                          networks[0])[0]
+        self.driver.update_dhcp(self.context, "eth0", networks[0])
+        self.driver.add_dhcp_host(self.context, "eth0", networks[0],
+                                  fixedip)
+        self.assertEqual(written[0], written[1])
+
+    def test_add_dhcp_host_without_hosts(self):
+        fixedip = fixed_ip_obj.FixedIPList.get_by_network(self.context,
+                                                          networks[0])[0]
+        with mock.patch.object(linux_net, 'update_dhcp') as update_dhcp:
+            self.driver.add_dhcp_host(self.context, "eth0", networks[0],
+                                      fixedip)
+        update_dhcp.assert_called_once_with(self.context, "eth0",
+                                            networks[0])
+
+    def test_add_dhcp_host_delayed(self):
+        self.flags(dhcp_hosts_update_delay=2.0)
+        written = self._stub_dhcp_hosts_file()
+        fixedips = fixed_ip_obj.FixedIPList.get_by_network(self.context,
+                                                           networks[0])
+        self.driver.update_dhcp(self.context, "eth0", networks[0])
+
+        with mock.patch.object(linux_net.greenthread,
+                               'spawn_after') as spawn_after:
+            for fixedip in fixedips:
+                self.driver.add_dhcp_host(self.context, "eth0", networks[0],
+                                          fixedip)
+        spawn_after.assert_called_once_with(
+                2.0, linux_net._flush_dhcp_hosts_delayed, self.context,
+                "eth0", networks[0])
+        self.assertEqual(1, len(written))
+
+        linux_net._flush_dhcp_hosts_delayed(self.context, "eth0",
+                                            networks[0])
+        self.assertEqual(2, len(written))
+        self.assertEqual(written[0], written[1])
+        self.assertEqual({}, linux_net._dhcp_hosts_timers)
+
     def test_get_dhcp_hosts_for_nw00(self):
         self.flags(use_single_default_gateway=True)
 
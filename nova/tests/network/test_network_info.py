@@ -500,6 +500,34 @@ class NetworkInfoTests(test.NoDBTestCase):
                     {'address': 'bb:bb:bb:bb:bb:bb'})])
         self.assertEqual(ninfo.floating_ips(), ['192.168.1.1'])
 
+    def test_addresses(self):
+        vif = fake_network_cache_model.new_vif()
+        vif['network']['subnets'][0]['ips'][0].add_floating_ip(
+            fake_network_cache_model.new_ip({'address': '192.168.1.1',
+                                             'type': 'floating'}))
+        ninfo = model.NetworkInfo([vif,
+                fake_network_cache_model.new_vif(
+                    {'address': 'bb:bb:bb:bb:bb:bb',
+                     'network': fake_network_cache_model.new_network(
+                         {'label': 'private'})})])
+
+        def _ips(mac_address):
+            return [{'address': address,
+                     'version': 4,
+                     'type': 'fixed',
+                     'mac_address': mac_address}
+                    for address in ['10.10.0.2', '10.10.0.3'] * 2]
+
+        expected = {'public': {'ips': _ips('aa:aa:aa:aa:aa:aa'),
+                               'floating_ips': [
+                                   {'address': '192.168.1.1',
+                                    'version': 4,
+                                    'type': 'floating',
+                                    'mac_address': 'aa:aa:aa:aa:aa:aa'}]},
+                    'private': {'ips': _ips('bb:bb:bb:bb:bb:bb'),
+                                'floating_ips': []}}
+        self.assertEqual(expected, ninfo.addresses())
+
     def test_hydrate(self):
         ninfo = model.NetworkInfo([fake_network_cache_model.new_vif(),
                 fake_network_cache_model.new_vif(
@@ -70,7 +70,7 @@ class _TestInstanceObject(object):
         primitive = inst.obj_to_primitive()
         expected = {'nova_object.name': 'Instance',
                     'nova_object.namespace': 'nova',
-                    'nova_object.version': '1.13',
+                    'nova_object.version': '1.14',
                     'nova_object.data':
                         {'uuid': 'fake-uuid',
                          'launched_at': '1955-11-05T00:00:00Z'},
@@ -86,7 +86,7 @@ class _TestInstanceObject(object):
         primitive = inst.obj_to_primitive()
         expected = {'nova_object.name': 'Instance',
                     'nova_object.namespace': 'nova',
-                    'nova_object.version': '1.13',
+                    'nova_object.version': '1.14',
                     'nova_object.data':
                         {'uuid': 'fake-uuid',
                          'access_ip_v4': '1.2.3.4',
@@ -764,6 +764,15 @@ class _TestInstanceObject(object):
             '1.4',
             primitive['nova_object.data']['info_cache']['nova_object.version'])
 
+    def test_compat_info_cache_addresses(self):
+        inst = instance.Instance()
+        inst.info_cache = instance_info_cache.InstanceInfoCache()
+        inst.info_cache.addresses = {}
+        primitive = inst.obj_to_primitive(target_version='1.13')
+        info_cache = primitive['nova_object.data']['info_cache']
+        self.assertEqual('1.5', info_cache['nova_object.version'])
+        self.assertNotIn('addresses', info_cache['nova_object.data'])
+
     def _test_get_flavor(self, namespace):
         prefix = '%s_' % namespace if namespace is not None else ''
         db_inst = db.instance_create(self.context, {
@@ -1052,6 +1061,101 @@ class _TestInstanceListObject(object):
         for inst in inst_list:
             self.assertEqual(inst.obj_what_changed(), set())
 
+    def test_create_all(self):
+        fake_insts = [fake_instance.fake_db_instance(uuid='uuid%d' % i,
+                                                     host='foo-host')
+                      for i in (1, 2)]
+        bdms = {'uuid1': [{'device_name': 'vdb', 'instance_uuid': 'uuid1'}]}
+        self.mox.StubOutWithMock(db, 'instance_create_bulk')
+        db.instance_create_bulk(self.context,
+                                [{'uuid': 'uuid1', 'host': 'foo-host'},
+                                 {'uuid': 'uuid2', 'host': 'foo-host'}],
+                                bdms).AndReturn(fake_insts)
+        self.mox.ReplayAll()
+
+        insts = [instance.Instance(uuid='uuid%d' % i, host='foo-host')
+                 for i in (1, 2)]
+        inst_list = instance.InstanceList.create_all(self.context, insts,
+                                                     bdms)
+        self.assertEqual(['uuid1', 'uuid2'], [inst.uuid for inst in inst_list])
+        for inst, fake_inst in zip(inst_list, fake_insts):
+            self.assertEqual(fake_inst['id'], inst.id)
+            self.assertEqual(set(), inst.obj_what_changed())
+
+    def test_create_all_already_created(self):
+        inst = instance.Instance(id=1, uuid='uuid1')
+        self.assertRaises(exception.ObjectActionError,
+                          instance.InstanceList.create_all, self.context,
+                          [inst])
+
+    def test_update_power_states(self):
+        inst1 = instance.Instance(uuid='uuid1', power_state=1)
+        inst2 = instance.Instance(uuid='uuid2', power_state=1)
+        for inst in (inst1, inst2):
+            inst.obj_reset_changes()
+        old_ref = fake_instance.fake_db_instance(uuid='uuid1', power_state=1)
+        new_ref = fake_instance.fake_db_instance(uuid='uuid1', power_state=4)
+
+        self.mox.StubOutWithMock(db, 'instance_update_power_states')
+        self.mox.StubOutWithMock(notifications, 'send_update')
+        db.instance_update_power_states(
+            self.context, 'foo', {'uuid1': 4, 'uuid2': 4}).AndReturn(
+                [(old_ref, new_ref)])
+        notifications.send_update(self.context, mox.IgnoreArg(),
+                                  mox.IgnoreArg())
+        self.mox.ReplayAll()
+
+        inst_list = instance.InstanceList()
+        inst_list._context = self.context
+        inst_list.objects = [inst1, inst2]
+        updated = inst_list.update_power_states('foo',
+                                                {'uuid1': 4, 'uuid2': 4})
+        self.assertEqual(['uuid1'], updated)
+        self.assertEqual(4, inst1.power_state)
+        self.assertEqual(1, inst2.power_state)
+        for inst in inst_list:
+            self.assertEqual(set(), inst.obj_what_changed())
+
+    def test_update_power_states_with_cells(self):
+        self.flags(enable=True, cell_type='compute', group='cells')
+        new_ref = fake_instance.fake_db_instance(uuid='uuid1', power_state=4)
+        self.mox.StubOutWithMock(db, 'instance_update_power_states')
+        self.mox.StubOutWithMock(cells_rpcapi.CellsAPI,
+                                 'instance_update_at_top')
+        db.instance_update_power_states(self.context, 'foo',
+                                        {'uuid1': 4}).AndReturn(
+                                            [(new_ref, new_ref)])
+        cells_rpcapi.CellsAPI.instance_update_at_top(self.context, new_ref)
+        self.mox.ReplayAll()
+
+        inst_list = instance.InstanceList()
+        inst_list._context = self.context
+        inst_list.objects = []
+        self.assertEqual(['uuid1'],
+                         inst_list.update_power_states('foo', {'uuid1': 4}))
+
+    def test_save_all(self):
+        insts = [instance.Instance(uuid='uuid%i' % i, host='foo')
+                 for i in range(3)]
+        for inst in insts:
+            inst.obj_reset_changes()
+        insts[0].host = 'bar'
+        insts[1].host = 'bar'
+        inst_list = instance.InstanceList()
+        inst_list._context = self.context
+        inst_list.objects = insts
+        error = exception.UnexpectedTaskStateError(expected='foo',
+                                                   actual='bar')
+        with mock.patch.object(instance.Instance, 'save',
+                               side_effect=[None, error]) as mock_save:
+            errors = inst_list.save_all(expected_task_state='foo')
+        self.assertEqual(2, mock_save.call_count)
+        mock_save.assert_called_with(self.context, expected_vm_state=None,
+                                     expected_task_state='foo')
+        self.assertEqual(['uuid1'], errors.keys())
+        self.assertIsInstance(errors['uuid1'],
+                              exception.UnexpectedTaskStateError)
+
     def test_get_by_security_group(self):
         fake_secgroup = dict(test_security_group.fake_secgroup)
         fake_secgroup['instances'] = [
@@ -18,6 +18,7 @@ from nova import db
 from nova import exception
 from nova.network import model as network_model
 from nova.objects import instance_info_cache
+from nova.openstack.common import jsonutils
 from nova.tests.objects import test_objects
 
 
@@ -42,8 +43,44 @@ class _TestInstanceInfoCacheObject(object):
             self.context, 'fake-uuid')
         self.assertEqual(obj.instance_uuid, 'fake-uuid')
         self.assertEqual(obj.network_info, nwinfo)
+        self.assertIsNone(obj.addresses)
         self.assertRemotes()
 
+    def test_get_by_instance_uuid_with_addresses(self):
+        addresses = {'private': {'ips': [{'address': '10.0.0.2',
+                                          'version': 4,
+                                          'type': 'fixed',
+                                          'mac_address': 'aa:aa'}],
+                                 'floating_ips': []}}
+        self.mox.StubOutWithMock(db, 'instance_info_cache_get')
+        db.instance_info_cache_get(self.context, 'fake-uuid').AndReturn(
+            dict(fake_info_cache, addresses=jsonutils.dumps(addresses)))
+        self.mox.ReplayAll()
+        obj = instance_info_cache.InstanceInfoCache.get_by_instance_uuid(
+            self.context, 'fake-uuid')
+        self.assertEqual(addresses, obj.addresses)
+        self.assertEqual(set(), obj.obj_what_changed())
+
+    def test_from_db_object_hydrates_network_info_lazily(self):
+        nwinfo = network_model.NetworkInfo.hydrate([{'address': 'foo'}])
+        hydrated = []
+        hydrate = network_model.NetworkInfo.hydrate
+
+        def fake_hydrate(network_info):
+            hydrated.append(network_info)
+            return hydrate(network_info)
+
+        self.stubs.Set(network_model.NetworkInfo, 'hydrate',
+                       staticmethod(fake_hydrate))
+        obj = instance_info_cache.InstanceInfoCache._from_db_object(
+            self.context, instance_info_cache.InstanceInfoCache(),
+            dict(fake_info_cache, network_info=nwinfo.json()))
+        self.assertTrue(obj.obj_attr_is_set('network_info'))
+        self.assertEqual([], hydrated)
+        self.assertEqual(nwinfo, obj.network_info)
+        self.assertEqual([nwinfo.json()], hydrated)
+        self.assertEqual(set(), obj.obj_what_changed())
+
     def test_get_by_instance_uuid_no_entries(self):
         self.mox.StubOutWithMock(db, 'instance_info_cache_get')
         db.instance_info_cache_get(self.context, 'fake-uuid').AndReturn(None)
@@ -85,7 +122,9 @@ class _TestInstanceInfoCacheObject(object):
         obj._context = self.context
         obj.instance_uuid = 'fake-uuid'
         obj.network_info = nwinfo
+        obj.addresses = {}
         obj.save(update_cells=update_cells)
+        self.assertIsNone(obj.addresses)
 
     def test_save_with_update_cells_and_compute_cell(self):
         self._save_helper('compute', True)
@@ -106,6 +145,14 @@ class _TestInstanceInfoCacheObject(object):
         obj.refresh()
         self.assertEqual(fake_info_cache['instance_uuid'], obj.instance_uuid)
 
+    def test_compat_addresses(self):
+        obj = instance_info_cache.InstanceInfoCache()
+        obj.instance_uuid = 'fake-uuid'
+        obj.addresses = {}
+        primitive = obj.obj_to_primitive(target_version='1.5')
+        self.assertEqual('1.5', primitive['nova_object.version'])
+        self.assertNotIn('addresses', primitive['nova_object.data'])
+
 
 class TestInstanceInfoCacheObject(test_objects._LocalTest,
                                   _TestInstanceInfoCacheObject):
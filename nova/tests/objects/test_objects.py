@@ -68,6 +68,12 @@ class MyObj(base.NovaPersistentObject, base.NovaObject):
         else:
             self.bar = 'updated'
 
+    @base.remotable
+    def _set_foo_test(self, context, value):
+        if value < 0:
+            raise exception.InvalidInput(reason='negative foo')
+        self.foo = value
+
     @base.remotable
     def save(self, context):
         self.obj_reset_changes()
@@ -411,6 +417,18 @@ class _RemoteTest(_BaseTestCase):
         self.stubs.Set(self.conductor_service.manager, 'object_action',
                        fake_object_action)
 
+        orig_object_action_delta = \
+            self.conductor_service.manager.object_action_delta
+
+        def fake_object_action_delta(*args, **kwargs):
+            self.remote_object_calls.append((kwargs.get('objinst'),
+                                             kwargs.get('objmethod')))
+            with things_temporarily_local():
+                result = orig_object_action_delta(*args, **kwargs)
+            return result
+        self.stubs.Set(self.conductor_service.manager, 'object_action_delta',
+                       fake_object_action_delta)
+
         # Things are remoted by default in this session
         base.NovaObject.indirection_api = conductor_rpcapi.ConductorAPI()
 
@@ -605,6 +623,44 @@ class _TestObject(object):
         self.assertEqual(obj.bar, 'meow')
         self.assertRemotes()
 
+    def test_obj_action_multi(self):
+        objs = [MyObj.query(self.context), MyObj.query(self.context)]
+        errors = base.obj_action_multi(self.context, objs, '_set_foo_test',
+                                       args=(5,))
+        self.assertEqual([None, None], errors)
+        for obj in objs:
+            self.assertEqual(5, obj.foo)
+            self.assertEqual(set(['foo']), obj.obj_what_changed())
+        self.assertRemotes()
+
+    def test_obj_action_multi_errors(self):
+        objs = [MyObj.query(self.context), MyObj.query(self.context)]
+        objs[1].foo = 2
+        errors = base.obj_action_multi(self.context, objs, '_set_foo_test',
+                                       kwargs={'value': -1})
+        self.assertEqual(2, len(errors))
+        for obj, error in zip(objs, errors):
+            self.assertIsInstance(error, exception.InvalidInput)
+            self.assertIn('negative foo', unicode(error))
+        self.assertEqual(2, objs[1].foo)
+
+    def test_obj_action_multi_empty(self):
+        self.assertEqual([], base.obj_action_multi(self.context, [],
+                                                   'refresh'))
+
+    def test_obj_make_delta(self):
+        obj = MyObj(foo=1, bar='bar' * 20, missing='m')
+        obj.obj_reset_changes()
+        obj.foo = 2
+        delta, digests, bytes_saved = obj.obj_make_delta()
+        self.assertEqual(2, delta.foo)
+        self.assertEqual('m', delta.missing)
+        self.assertFalse(delta.obj_attr_is_set('bar'))
+        self.assertEqual(set(['foo']), delta.obj_what_changed())
+        digest, size = base.obj_field_digest('bar' * 20)
+        self.assertEqual({'bar': digest}, digests)
+        self.assertEqual(size - len(digest), bytes_saved)
+
     def test_changed_with_sub_object(self):
         class ParentObject(base.NovaObject):
             fields = {'foo': fields.IntegerField(),
@@ -751,6 +807,58 @@ class TestRemoteObject(_RemoteTest, _TestObject):
         obj = MyObj2.query(self.context)
         self.assertEqual('oldbar', obj.bar)
 
+    def test_obj_action_multi_single_call(self):
+        objs = [MyObj.query(self.context) for i in range(3)]
+        self.mox.StubOutWithMock(conductor_rpcapi.ConductorAPI,
+                                 'object_action')
+        self.mox.ReplayAll()
+        errors = base.obj_action_multi(self.context, objs, 'refresh')
+        self.assertEqual([None] * 3, errors)
+        for obj in objs:
+            self.assertEqual('refreshed', obj.bar)
+        self.assertEqual(['refresh'] * 3,
+                         [method for _obj, method
+                          in self.remote_object_calls[-3:]])
+
+    def test_obj_action_multi_old_conductor(self):
+        self.flags(conductor='2.1', group='upgrade_levels')
+        base.NovaObject.indirection_api = conductor_rpcapi.ConductorAPI()
+        objs = [MyObj.query(self.context), MyObj.query(self.context)]
+        errors = base.obj_action_multi(self.context, objs, '_set_foo_test',
+                                       args=(-1,))
+        for error in errors:
+            self.assertIsInstance(error, exception.InvalidInput)
+        errors = base.obj_action_multi(self.context, objs, 'refresh')
+        self.assertEqual([None, None], errors)
+        self.assertEqual(321, objs[0].foo)
+
+    def test_delta_object_action(self):
+        self.flags(delta_object_actions=True, group='conductor')
+        self.stubs.Set(MyObj, 'obj_delta_methods', ('_update_test',))
+        obj = MyObj.query(self.context)
+        obj.missing = 'missing' * 20
+        obj.obj_reset_changes()
+        obj.foo = 123
+        obj._update_test(self.context)
+        self.assertEqual(set(['foo', 'bar']), obj.obj_what_changed())
+        self.assertEqual(123, obj.foo)
+        self.assertEqual('updated', obj.bar)
+        self.assertEqual('missing' * 20, obj.missing)
+
+        delta, method = self.remote_object_calls[-1]
+        self.assertEqual('_update_test', method)
+        self.assertFalse(delta.obj_attr_is_set('missing'))
+        self.assertTrue(base.delta_bytes_saved['MyObj'] > 0)
+
+    def test_delta_object_action_disabled(self):
+        self.stubs.Set(MyObj, 'obj_delta_methods', ('_update_test',))
+        obj = MyObj.query(self.context)
+        obj.missing = 'missing' * 20
+        obj._update_test(self.context)
+        self.assertEqual('updated', obj.bar)
+        objinst, method = self.remote_object_calls[-1]
+        self.assertEqual('missing' * 20, objinst.missing)
+
 
 class TestObjectListBase(test.TestCase):
     def test_list_like_operations(self):
@@ -0,0 +1,126 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the columnar scheduler filter and weigher mode.
+"""
+
+import testtools
+
+from nova.scheduler import columnar
+from nova.scheduler import filters
+from nova.scheduler import weights
+from nova import test
+from nova.tests.scheduler import fakes
+
+
+class NotColumnarFilter(filters.BaseHostFilter):
+    """Only lets hosts with an even number of instances through."""
+
+    def host_passes(self, host_state, filter_properties):
+        return host_state.num_instances % 2 == 0
+
+
+class NotColumnarWeigher(weights.BaseHostWeigher):
+    def _weigh_object(self, host_state, weight_properties):
+        return host_state.num_instances
+
+
+class ColumnarModeDisabledTestCase(test.NoDBTestCase):
+
+    def test_disabled_by_default(self):
+        self.assertFalse(columnar.is_enabled())
+
+    def test_disabled_without_numpy(self):
+        self.flags(scheduler_columnar_mode=True)
+        self.stubs.Set(columnar, 'numpy', None)
+        self.assertFalse(columnar.is_enabled())
+
+
+@testtools.skipIf(columnar.numpy is None, "NumPy is not installed")
+class ColumnarModeTestCase(test.NoDBTestCase):
+    """Check the columnar mode against the per host mode."""
+
+    def setUp(self):
+        super(ColumnarModeTestCase, self).setUp()
+        self.filter_handler = filters.HostFilterHandler()
+        self.weight_handler = weights.HostWeightHandler()
+        self.filter_classes = self.filter_handler.get_matching_classes(
+                ['nova.scheduler.filters.ram_filter.RamFilter',
+                 'nova.scheduler.filters.core_filter.CoreFilter',
+                 'nova.scheduler.filters.disk_filter.DiskFilter',
+                 'nova.scheduler.filters.io_ops_filter.IoOpsFilter',
+                 'nova.scheduler.filters.num_instances_filter.'
+                 'NumInstancesFilter'])
+        self.filter_properties = {
+            'instance_type': {'memory_mb': 1024, 'vcpus': 2, 'root_gb': 10,
+                              'ephemeral_gb': 0, 'swap': 0}}
+        self.flags(max_io_ops_per_host=4, max_instances_per_host=10)
+
+    def _hosts(self):
+        hosts = []
+        for i in xrange(40):
+            hosts.append(fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                    {'free_ram_mb': 256 * (i % 8) - 256,
+                     'total_usable_ram_mb': 2048,
+                     'vcpus_total': i % 5,
+                     'vcpus_used': i % 7,
+                     'free_disk_mb': 1024 * (i % 30),
+                     'total_usable_disk_gb': 20,
+                     'num_io_ops': i % 6,
+                     'num_instances': i % 13}))
+        return hosts
+
+    def _filter(self, columnar_mode, filter_classes=None):
+        self.flags(scheduler_columnar_mode=columnar_mode)
+        hosts = self._hosts()
+        result = self.filter_handler.get_filtered_objects(
+                filter_classes or self.filter_classes, hosts,
+                self.filter_properties)
+        return [(h.host, h.limits) for h in result]
+
+    def _weigh(self, columnar_mode, weigher_classes):
+        self.flags(scheduler_columnar_mode=columnar_mode)
+        result = self.weight_handler.get_weighed_objects(weigher_classes,
+                self._hosts(), {})
+        return [(w.obj.host, round(w.weight, 6)) for w in result]
+
+    def test_filters(self):
+        expected = self._filter(False)
+        self.assertTrue(expected)
+        self.assertEqual(expected, self._filter(True))
+
+    def test_filters_fallback(self):
+        filter_classes = self.filter_classes + [NotColumnarFilter]
+        expected = self._filter(False, filter_classes)
+        self.assertTrue(expected)
+        self.assertEqual(expected, self._filter(True, filter_classes))
+
+    def test_filters_no_host_passes(self):
+        self.filter_properties['instance_type']['memory_mb'] = 1000000
+        self.assertEqual([], self._filter(True))
+
+    def test_ram_weigher(self):
+        weigher_classes = self.weight_handler.get_matching_classes(
+                ['nova.scheduler.weights.ram.RAMWeigher'])
+        self.assertEqual(self._weigh(False, weigher_classes),
+                         self._weigh(True, weigher_classes))
+
+    def test_weighers_fallback(self):
+        self.flags(ram_weight_multiplier=-1.0)
+        weigher_classes = self.weight_handler.get_matching_classes(
+                ['nova.scheduler.weights.ram.RAMWeigher'])
+        weigher_classes.append(NotColumnarWeigher)
+        self.assertEqual(self._weigh(False, weigher_classes),
+                         self._weigh(True, weigher_classes))
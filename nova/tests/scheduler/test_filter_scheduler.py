@@ -435,6 +435,40 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         # one host should be chosen
         self.assertEqual(len(hosts), 1)
 
+    def test_schedule_aggregate_metadata_index(self):
+        """The aggregate metadata index is available to the filters only."""
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        seen_indexes = []
+
+        def _fake_get_filtered_hosts(hosts, filter_properties, index):
+            seen_indexes.append(
+                    filter_properties.get('aggregate_metadata_by_host'))
+            return list(hosts)
+
+        self.stubs.Set(sched.host_manager, 'get_filtered_hosts',
+                _fake_get_filtered_hosts)
+        fakes.mox_host_manager_db_calls(self.mox, fake_context)
+
+        instance_properties = {'project_id': 1,
+                               'root_gb': 512,
+                               'memory_mb': 512,
+                               'ephemeral_gb': 0,
+                               'vcpus': 1,
+                               'os_type': 'Linux'}
+        request_spec = dict(instance_properties=instance_properties,
+                            instance_type={})
+        filter_properties = {}
+        self.mox.ReplayAll()
+        sched._schedule(self.context, request_spec,
+                        filter_properties=filter_properties)
+
+        self.assertEqual(1, len(seen_indexes))
+        self.assertIsInstance(seen_indexes[0],
+                              host_manager.AggregateMetadataIndex)
+        self.assertNotIn('aggregate_metadata_by_host', filter_properties)
+
     def test_schedule_large_host_pool(self):
         """Hosts should still be chosen if pool size
         is larger than number of filtered hosts.
@@ -511,6 +545,78 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.assertEqual(50, hosts[0].weight)
 
+    def _schedule_many_instances(self, batch_placement):
+        self.flags(scheduler_batch_placement=batch_placement,
+                   scheduler_default_filters=['RamFilter', 'CoreFilter',
+                                              'NumInstancesFilter'],
+                   scheduler_weight_classes=[
+                        'nova.scheduler.weights.ram.RAMWeigher'],
+                   max_instances_per_host=3)
+        sched = fakes.FakeFilterScheduler()
+        hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                     {'free_ram_mb': 1024 * i,
+                                      'total_usable_ram_mb': 4096,
+                                      'vcpus_total': 4,
+                                      'vcpus_used': i % 3,
+                                      'num_instances': i % 2})
+                 for i in xrange(8)]
+        self.stubs.Set(sched, '_get_all_host_states',
+                       lambda context: iter(hosts))
+
+        instance_properties = {'project_id': 1,
+                               'root_gb': 0,
+                               'memory_mb': 768,
+                               'ephemeral_gb': 0,
+                               'vcpus': 1,
+                               'os_type': 'Linux'}
+        request_spec = dict(instance_properties=instance_properties,
+                            instance_type={'memory_mb': 768, 'vcpus': 1},
+                            num_instances=20)
+        selected_hosts = sched._schedule(self.context, request_spec,
+                filter_properties={})
+        return [(h.obj.host, h.weight) for h in selected_hosts]
+
+    def test_schedule_batch_placement(self):
+        expected = self._schedule_many_instances(False)
+        # RAM and the number of instances per host only allow for 19
+        self.assertEqual(19, len(expected))
+        self.assertEqual(expected, self._schedule_many_instances(True))
+
+    def test_schedule_batch_placement_filters_once(self):
+        self.flags(scheduler_batch_placement=True)
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        fakes.mox_host_manager_db_calls(self.mox, fake_context)
+        filtered = []
+
+        def _fake_get_filtered_hosts(hosts, filter_properties, index):
+            hosts = list(hosts)
+            filtered.append((len(hosts), index))
+            return hosts
+
+        self.stubs.Set(sched.host_manager, 'get_filtered_hosts',
+                _fake_get_filtered_hosts)
+        self.stubs.Set(sched.host_manager,
+                'filters_invariant_across_instances', lambda: True)
+
+        instance_properties = {'project_id': 1,
+                               'root_gb': 512,
+                               'memory_mb': 512,
+                               'ephemeral_gb': 0,
+                               'vcpus': 1,
+                               'os_type': 'Linux'}
+        request_spec = dict(instance_properties=instance_properties,
+                            instance_type={}, num_instances=3)
+        self.mox.ReplayAll()
+        hosts = sched._schedule(self.context, request_spec,
+                filter_properties={})
+
+        self.assertEqual(3, len(hosts))
+        # All the hosts are only filtered for the first instance
+        self.assertEqual([(4, 0), (1, 1), (1, 2)],
+                         filtered)
+
     def test_select_destinations(self):
         """select_destinations is basically a wrapper around _schedule().
 
@@ -204,3 +204,12 @@ class FiltersTestCase(test.NoDBTestCase):
                                                      filter_objs_initial,
                                                      filter_properties)
         self.assertIsNone(result)
+
+    def test_invariant_across_instances(self):
+        self.assertFalse(Filter1.invariant_across_instances())
+        self.stubs.Set(Filter1, 'run_filter_once_per_request', True)
+        self.assertTrue(Filter1.invariant_across_instances())
+        self.assertTrue(Filter1().invariant_across_instances())
+        self.assertFalse(Filter2.invariant_across_instances())
+        self.stubs.Set(Filter2, 'invariant_unless_chosen', True)
+        self.assertTrue(Filter2.invariant_across_instances())
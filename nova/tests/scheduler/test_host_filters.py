@@ -1496,6 +1496,34 @@ class HostFiltersTestCase(test.NoDBTestCase):
                                    {'service': service})
         self.assertFalse(filt_cls.host_passes(host, request))
 
+    def test_availability_zone_filter_aggregate_index(self):
+        filt_cls = self.class_map['AvailabilityZoneFilter']()
+        request = self._make_zone_request('zone1')
+        request['aggregate_metadata_by_host'] = {
+            'host1': {'availability_zone': set(['zone1'])},
+            'host2': {'availability_zone': set(['zone2'])}}
+        host1 = fakes.FakeHostState('host1', 'node1', {})
+        host2 = fakes.FakeHostState('host2', 'node2', {})
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_by_host')
+        self.mox.ReplayAll()
+        self.assertTrue(filt_cls.host_passes(host1, request))
+        self.assertFalse(filt_cls.host_passes(host2, request))
+
+    def test_aggregate_core_filter_aggregate_index(self):
+        filt_cls = self.class_map['AggregateCoreFilter']()
+        filter_properties = {'context': self.context,
+                             'instance_type': {'vcpus': 1},
+                             'aggregate_metadata_by_host': {
+                                 'host1': {'cpu_allocation_ratio':
+                                               set(['3'])}}}
+        self.flags(cpu_allocation_ratio=2)
+        host = fakes.FakeHostState('host1', 'node1',
+                {'vcpus_total': 4, 'vcpus_used': 8})
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_by_host')
+        self.mox.ReplayAll()
+        self.assertTrue(filt_cls.host_passes(host, filter_properties))
+        self.assertEqual(4 * 3, host.limits['vcpu'])
+
     def test_retry_filter_disabled(self):
         # Test case where retry/re-scheduling is disabled.
         filt_cls = self.class_map['RetryFilter']()
@@ -15,6 +15,10 @@
 """
 Tests For HostManager
 """
+import datetime
+
+import mox
+
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova import db
@@ -67,6 +71,20 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertEqual(len(filter_classes), 1)
         self.assertEqual(filter_classes[0].__name__, 'FakeFilterClass2')
 
+    def test_filters_invariant_across_instances(self):
+        self.flags(scheduler_default_filters=['FakeFilterClass1',
+                                              'FakeFilterClass2'])
+        self.host_manager.filter_classes = [FakeFilterClass1,
+                FakeFilterClass2]
+        self.assertFalse(
+                self.host_manager.filters_invariant_across_instances())
+        self.stubs.Set(FakeFilterClass1, 'run_filter_once_per_request', True)
+        self.assertFalse(
+                self.host_manager.filters_invariant_across_instances())
+        self.stubs.Set(FakeFilterClass2, 'invariant_unless_chosen', True)
+        self.assertTrue(
+                self.host_manager.filters_invariant_across_instances())
+
     def _mock_get_filtered_hosts(self, info, specified_filters=None):
         self.mox.StubOutWithMock(self.host_manager, '_choose_host_filters')
 
@@ -373,6 +391,235 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         self.assertEqual(len(host_states_map), 0)
 
 
+class HostManagerHostStateCacheTestCase(test.NoDBTestCase):
+    """Test case for the HostManager host state cache."""
+
+    def setUp(self):
+        super(HostManagerHostStateCacheTestCase, self).setUp()
+        self.flags(scheduler_host_state_cache=True)
+        self.host_manager = host_manager.HostManager()
+        self.addCleanup(timeutils.clear_time_override)
+
+    def _fake_node(self, node_id, free_ram_mb, **kwargs):
+        compute = dict(fakes.COMPUTE_NODES[node_id - 1])
+        compute['free_ram_mb'] = free_ram_mb
+        compute.update(kwargs)
+        return compute
+
+    def _fake_services(self, count):
+        return [dict(compute['service'])
+                for compute in fakes.COMPUTE_NODES[:count]]
+
+    def test_get_all_host_states_incremental(self):
+        context = 'fake_context'
+        start = timeutils.utcnow()
+        timeutils.set_time_override(start)
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_changed_since')
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES[:4])
+        db.compute_node_get_all_changed_since(
+                context, start - host_manager._SYNC_MARGIN).AndReturn(
+                        ([self._fake_node(1, 256)], self._fake_services(4)))
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        timeutils.advance_time_seconds(1)
+        self.host_manager.get_all_host_states(context)
+
+        host_states_map = self.host_manager.host_state_map
+        self.assertEqual(4, len(host_states_map))
+        self.assertEqual(256, host_states_map[('host1', 'node1')].free_ram_mb)
+        self.assertEqual(1024,
+                         host_states_map[('host2', 'node2')].free_ram_mb)
+        self.assertEqual(dict(hits=0, misses=2, stale=1, pushed=0),
+                         self.host_manager.host_state_cache_stats)
+
+    def test_get_all_host_states_incremental_same_second_update(self):
+        context = 'fake_context'
+        start = datetime.datetime(2014, 1, 1, 12, 0, 0, 500000)
+        timeutils.set_time_override(start)
+        # Committed after the first sync, but stamped within the same
+        # second, truncated like MySQL does.
+        updated = self._fake_node(1, 256,
+                                  updated_at=start.replace(microsecond=0))
+
+        def fake_changed_since(context, changed_since):
+            nodes = [node for node in [updated]
+                     if node['updated_at'] >= changed_since]
+            return nodes, self._fake_services(4)
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES[:4])
+        self.stubs.Set(db, 'compute_node_get_all_changed_since',
+                       fake_changed_since)
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        timeutils.advance_time_seconds(1)
+        self.host_manager.get_all_host_states(context)
+
+        host_states_map = self.host_manager.host_state_map
+        self.assertEqual(256, host_states_map[('host1', 'node1')].free_ram_mb)
+
+    def test_get_all_host_states_incremental_removes_deleted(self):
+        context = 'fake_context'
+        timeutils.set_time_override()
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_changed_since')
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES[:4])
+        db.compute_node_get_all_changed_since(context, mox.IgnoreArg()).\
+                AndReturn(([self._fake_node(4, 0, deleted=4)],
+                           self._fake_services(4)))
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        timeutils.advance_time_seconds(1)
+        self.host_manager.get_all_host_states(context)
+
+        self.assertNotIn(('host4', 'node4'), self.host_manager.host_state_map)
+        self.assertEqual(3, len(self.host_manager.host_state_map))
+
+    def test_get_all_host_states_incremental_refreshes_services(self):
+        context = 'fake_context'
+        timeutils.set_time_override()
+        services = self._fake_services(3)
+        services[0] = dict(services[0], disabled=True)
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_changed_since')
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES[:4])
+        db.compute_node_get_all_changed_since(context, mox.IgnoreArg()).\
+                AndReturn(([], services))
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        timeutils.advance_time_seconds(1)
+        self.host_manager.get_all_host_states(context)
+
+        host_states_map = self.host_manager.host_state_map
+        host_state = host_states_map[('host1', 'node1')]
+        self.assertTrue(host_state.service['disabled'])
+        self.assertNotIn(('host4', 'node4'), host_states_map)
+        self.assertEqual(3, len(host_states_map))
+
+    def test_get_all_host_states_within_consistency_window(self):
+        self.flags(scheduler_host_state_consistency_window=10)
+        context = 'fake_context'
+        timeutils.set_time_override()
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES[:4])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        timeutils.advance_time_seconds(5)
+        self.host_manager.get_all_host_states(context)
+
+        self.assertEqual(dict(hits=1, misses=1, stale=0, pushed=0),
+                         self.host_manager.host_state_cache_stats)
+
+    def test_get_all_host_states_full_sync_interval(self):
+        self.flags(scheduler_host_state_full_sync_interval=60)
+        context = 'fake_context'
+        timeutils.set_time_override()
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES[:4])
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES[:3])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        timeutils.advance_time_seconds(61)
+        self.host_manager.get_all_host_states(context)
+
+        self.assertEqual(3, len(self.host_manager.host_state_map))
+
+    def test_update_host_state(self):
+        context = 'fake_context'
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES[:4])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        updated_at = timeutils.strtime(timeutils.utcnow())
+        self.host_manager.update_host_state('host2', 'node2',
+                self._fake_node(2, 128, updated_at=updated_at))
+        # Unknown nodes are left for the next sync with the db
+        self.host_manager.update_host_state('host9', 'node9',
+                self._fake_node(2, 128, updated_at=updated_at))
+
+        host_state = self.host_manager.host_state_map[('host2', 'node2')]
+        self.assertEqual(128, host_state.free_ram_mb)
+        self.assertEqual(timeutils.parse_strtime(updated_at),
+                         host_state.updated)
+        self.assertEqual(1, self.host_manager.host_state_cache_stats['pushed'])
+
+
+class HostManagerAggregateMetadataTestCase(test.NoDBTestCase):
+    """Test case for the HostManager aggregate metadata index."""
+
+    def setUp(self):
+        super(HostManagerAggregateMetadataTestCase, self).setUp()
+        self.host_manager = host_manager.HostManager()
+        self.addCleanup(timeutils.clear_time_override)
+        self.index = {'host1': {'availability_zone': set(['az1'])}}
+
+    def test_get_aggregate_metadata_cached(self):
+        timeutils.set_time_override()
+        self.mox.StubOutWithMock(db, 'aggregate_host_metadata_get_all')
+        db.aggregate_host_metadata_get_all('fake_context').AndReturn(
+                self.index)
+        self.mox.ReplayAll()
+
+        self.assertEqual(self.index,
+                self.host_manager.get_aggregate_metadata('fake_context'))
+        timeutils.advance_time_seconds(10)
+        self.assertEqual(self.index,
+                self.host_manager.get_aggregate_metadata('fake_context'))
+
+    def test_get_aggregate_metadata_expired(self):
+        self.flags(scheduler_aggregate_metadata_max_age=60)
+        timeutils.set_time_override()
+        self.mox.StubOutWithMock(db, 'aggregate_host_metadata_get_all')
+        db.aggregate_host_metadata_get_all('fake_context').AndReturn({})
+        db.aggregate_host_metadata_get_all('fake_context').AndReturn(
+                self.index)
+        self.mox.ReplayAll()
+
+        self.assertEqual({},
+                self.host_manager.get_aggregate_metadata('fake_context'))
+        timeutils.advance_time_seconds(61)
+        self.assertEqual(self.index,
+                self.host_manager.get_aggregate_metadata('fake_context'))
+
+    def test_invalidate_aggregate_metadata(self):
+        self.mox.StubOutWithMock(db, 'aggregate_host_metadata_get_all')
+        db.aggregate_host_metadata_get_all('fake_context').AndReturn({})
+        db.aggregate_host_metadata_get_all('fake_context').AndReturn(
+                self.index)
+        self.mox.ReplayAll()
+
+        self.host_manager.get_aggregate_metadata('fake_context')
+        self.host_manager.invalidate_aggregate_metadata()
+        self.assertEqual(self.index,
+                self.host_manager.get_aggregate_metadata('fake_context'))
+
+    def test_aggregate_metadata_index_is_lazy(self):
+        self.mox.StubOutWithMock(self.host_manager, 'get_aggregate_metadata')
+        self.host_manager.get_aggregate_metadata('fake_context').AndReturn(
+                self.index)
+        self.mox.ReplayAll()
+
+        index = host_manager.AggregateMetadataIndex(self.host_manager,
+                                                    'fake_context')
+        self.assertEqual({'availability_zone': set(['az1'])},
+                         index.get('host1'))
+        self.assertEqual({}, index.get('host2', {}))
+
+
 class HostStateTestCase(test.NoDBTestCase):
     """Test case for HostState class."""
 
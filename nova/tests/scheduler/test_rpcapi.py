@@ -82,3 +82,12 @@ class SchedulerRpcAPITestCase(test.NoDBTestCase):
         self._test_scheduler_api('select_destinations', rpc_method='call',
                 request_spec='fake_request_spec',
                 filter_properties='fake_prop')
+
+    def test_update_host_state(self):
+        self._test_scheduler_api('update_host_state', rpc_method='cast',
+                host='fake_host', node='fake_node', compute={'id': 1},
+                fanout=True, version='3.1')
+
+    def test_invalidate_aggregates(self):
+        self._test_scheduler_api('invalidate_aggregates', rpc_method='cast',
+                fanout=True, version='3.2')
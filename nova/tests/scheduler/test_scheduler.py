@@ -582,3 +582,16 @@ class SchedulerV3PassthroughTestCase(test.TestCase):
                 ) as prep_resize:
             self.proxy.prep_resize(None, None, None, None, None, None, None)
             prep_resize.assert_called_once()
+
+    def test_update_host_state(self):
+        with mock.patch.object(self.manager, 'update_host_state'
+                ) as update_host_state:
+            self.proxy.update_host_state(None, 'host', 'node', {})
+            update_host_state.assert_called_once_with(None, host='host',
+                    node='node', compute={})
+
+    def test_invalidate_aggregates(self):
+        with mock.patch.object(self.manager, 'invalidate_aggregates'
+                ) as invalidate_aggregates:
+            self.proxy.invalidate_aggregates(None)
+            invalidate_aggregates.assert_called_once_with(None)
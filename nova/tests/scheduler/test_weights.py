@@ -36,9 +36,10 @@ class TestWeighedHost(test.NoDBTestCase):
     def test_all_weighers(self):
         classes = weights.all_weighers()
         class_names = [cls.__name__ for cls in classes]
-        self.assertEqual(len(classes), 2)
+        self.assertEqual(len(classes), 3)
         self.assertIn('RAMWeigher', class_names)
         self.assertIn('MetricsWeigher', class_names)
+        self.assertIn('ImageCacheWeigher', class_names)
 
 
 class RamWeigherTestCase(test.NoDBTestCase):
@@ -129,6 +130,71 @@ class RamWeigherTestCase(test.NoDBTestCase):
         self.assertEqual(weighed_host.obj.host, "negative")
 
 
+class NumInstancesWeigher(weights.BaseHostWeigher):
+    def weight_multiplier(self):
+        return -2.0
+
+    def _weigh_object(self, host_state, weight_properties):
+        return host_state.num_instances
+
+
+class WeighedHostHeapTestCase(test.NoDBTestCase):
+    """The heap has to give the same order as weighing all the hosts."""
+
+    def setUp(self):
+        super(WeighedHostHeapTestCase, self).setUp()
+        self.weight_handler = weights.HostWeightHandler()
+        self.weight_classes = self.weight_handler.get_matching_classes(
+                ['nova.scheduler.weights.ram.RAMWeigher'])
+        self.weight_classes.append(NumInstancesWeigher)
+        self.hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                          {'free_ram_mb': 512 * (i % 5),
+                                           'num_instances': i % 3})
+                      for i in xrange(10)]
+
+    def _check_order(self, heap, hosts):
+        expected = self.weight_handler.get_weighed_objects(
+                self.weight_classes, hosts, {})
+        result = heap.best(len(hosts) + 1)
+        self.assertEqual(len(hosts), len(heap))
+        self.assertEqual([(w.obj.host, w.weight) for w in expected],
+                         [(w.obj.host, w.weight) for w in result])
+
+    def test_initial_order(self):
+        heap = weights.WeighedHostHeap(self.weight_classes, self.hosts, {})
+        self._check_order(heap, self.hosts)
+
+    def test_best(self):
+        heap = weights.WeighedHostHeap(self.weight_classes, self.hosts, {})
+        best = [(w.obj.host, w.weight) for w in heap.best(3)]
+        self.assertEqual(3, len(best))
+        # Looking at the best hosts doesn't remove them from the heap
+        self.assertEqual(best, [(w.obj.host, w.weight) for w in heap.best(3)])
+        self._check_order(heap, self.hosts)
+
+    def test_update(self):
+        heap = weights.WeighedHostHeap(self.weight_classes, self.hosts, {})
+        for host in (self.hosts[4], self.hosts[9], self.hosts[4]):
+            host.free_ram_mb -= 1024
+            host.num_instances += 1
+            heap.update(host)
+            self._check_order(heap, self.hosts)
+
+    def test_update_without_changing_bounds(self):
+        heap = weights.WeighedHostHeap(self.weight_classes, self.hosts, {})
+        self.hosts[2].free_ram_mb = 768
+        heap.update(self.hosts[2])
+        self._check_order(heap, self.hosts)
+
+    def test_remove(self):
+        heap = weights.WeighedHostHeap(self.weight_classes, self.hosts, {})
+        heap.remove(self.hosts[4])
+        hosts = self.hosts[:4] + self.hosts[5:]
+        self._check_order(heap, hosts)
+        heap.remove(self.hosts[0])
+        self._check_order(heap, hosts[1:])
+
+
 class MetricsWeigherTestCase(test.NoDBTestCase):
     def setUp(self):
         super(MetricsWeigherTestCase, self).setUp()
@@ -246,3 +312,42 @@ class MetricsWeigherTestCase(test.NoDBTestCase):
         self.flags(required=False, group='metrics')
         setting = ['foo=0.0001', 'zot=-1']
         self._do_test(setting, 1.0, 'host5')
+
+
+class ImageCacheWeigherTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(ImageCacheWeigherTestCase, self).setUp()
+        self.weight_handler = weights.HostWeightHandler()
+        self.weight_classes = self.weight_handler.get_matching_classes(
+                ['nova.scheduler.weights.image_cache.ImageCacheWeigher'])
+        self.hosts = [
+            fakes.FakeHostState('host1', 'node1', {'stats': {}}),
+            fakes.FakeHostState('host2', 'node2',
+                                {'stats': {'image_cached_fake-image': 1}}),
+            fakes.FakeHostState('host3', 'node3',
+                                {'stats': {'image_cached_other-image': 1}}),
+        ]
+
+    def _get_weighed_hosts(self, image_id):
+        weight_properties = {'request_spec': {'image': {'id': image_id}}}
+        return self.weight_handler.get_weighed_objects(self.weight_classes,
+                self.hosts, weight_properties)
+
+    def test_disabled_by_default(self):
+        weighed_hosts = self._get_weighed_hosts('fake-image')
+        self.assertEqual([0.0] * 3, [host.weight for host in weighed_hosts])
+
+    def test_prefer_hosts_holding_the_image(self):
+        self.flags(image_cache_weight_multiplier=1.0)
+        weighed_hosts = self._get_weighed_hosts('fake-image')
+        self.assertEqual('host2', weighed_hosts[0].obj.host)
+        self.assertEqual(1.0, weighed_hosts[0].weight)
+        self.assertEqual(0.0, weighed_hosts[1].weight)
+
+    def test_image_ref_from_instance_properties(self):
+        self.flags(image_cache_weight_multiplier=1.0)
+        weight_properties = {'request_spec': {
+            'instance_properties': {'image_ref': 'other-image'}}}
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+                self.weight_classes, self.hosts, weight_properties)
+        self.assertEqual('host3', weighed_hosts[0].obj.host)
@@ -318,6 +318,28 @@ class InstanceTypeToolsTest(test.TestCase):
     def test_extract_flavor_prefix(self):
         self._test_extract_flavor('foo_')
 
+    def test_extract_flavor_cached(self):
+        metadata = flavors.save_flavor_info({}, flavors.get_default_flavor())
+        instance = {'system_metadata': self._dict_to_metadata(metadata)}
+        instance_type = flavors.extract_flavor(instance)
+        instance_type['name'] = 'foo'
+
+        instance = {'system_metadata': metadata}
+        _instance_type = flavors.extract_flavor(instance)
+        self.assertEqual(flavors.get_default_flavor()['name'],
+                         _instance_type['name'])
+        self.assertIsNot(instance_type, _instance_type)
+
+    def test_extract_flavor_deleted_metadata(self):
+        metadata = flavors.save_flavor_info({}, flavors.get_default_flavor())
+        instance = {'system_metadata': self._dict_to_metadata(metadata)}
+        instance['system_metadata'][0]['deleted'] = True
+        self.assertRaises(KeyError, flavors.extract_flavor, instance)
+
+    def test_extract_flavor_missing_metadata(self):
+        self.assertRaises(KeyError, flavors.extract_flavor,
+                          {'system_metadata': {}})
+
     def test_save_flavor_info(self):
         instance_type = flavors.get_default_flavor()
 
@@ -15,7 +15,13 @@
 #    under the License.
 """Unit Tests for network code."""
 
+import contextlib
+
+from eventlet import greenthread
+import mock
+
 from nova.network import linux_net
+from nova.openstack.common import timeutils
 from nova import test
 
 
@@ -276,3 +282,119 @@ class IptablesManagerTestCase(test.NoDBTestCase):
                                                self.manager.ipv4['filter'],
                                                'filter')
         self.assertEqual(current_lines, new_lines)
+
+    def _fake_execute(self):
+        calls = []
+
+        def fake_execute(*cmd, **kwargs):
+            calls.append((cmd, kwargs.get('process_input')))
+            if cmd[0].endswith('-save'):
+                return '\n'.join(self.sample_filter + self.sample_nat), ''
+            return '', ''
+
+        self.manager.execute = fake_execute
+        return calls
+
+    def test_incremental_apply_changed_chain(self):
+        self.flags(iptables_incremental_apply=True)
+        calls = self._fake_execute()
+        self.manager.apply()
+        self.assertEqual([('iptables-save', '-c'), ('iptables-restore', '-c')],
+                         [cmd for cmd, process_input in calls])
+
+        del calls[:]
+        self.manager.ipv4['filter'].add_rule('FORWARD', '-s 1.2.3.4/5 -j DROP')
+        self.manager.apply()
+        expected = ['*filter',
+                    ':%s-FORWARD - [0:0]' % self.binary_name,
+                    '[0:0] -A %s-FORWARD -s 1.2.3.4/5 -j DROP' %
+                    self.binary_name,
+                    'COMMIT']
+        self.assertEqual([(('iptables-restore', '-c', '--noflush'),
+                           '\n'.join(expected))], calls)
+        self.assertFalse(self.manager.dirty())
+
+        del calls[:]
+        self.manager.ipv4['filter'].remove_rule('FORWARD',
+                                                '-s 1.2.3.4/5 -j DROP')
+        self.manager.apply()
+        expected = ['*filter',
+                    ':%s-FORWARD - [0:0]' % self.binary_name,
+                    'COMMIT']
+        self.assertEqual([(('iptables-restore', '-c', '--noflush'),
+                           '\n'.join(expected))], calls)
+
+    def test_incremental_apply_new_chain(self):
+        self.flags(iptables_incremental_apply=True)
+        calls = self._fake_execute()
+        self.manager.apply()
+
+        del calls[:]
+        self.manager.ipv4['filter'].add_chain('foo')
+        self.manager.apply()
+        self.assertEqual([('iptables-save', '-c'), ('iptables-restore', '-c')],
+                         [cmd for cmd, process_input in calls])
+
+    def test_incremental_apply_unwrapped_rule(self):
+        self.flags(iptables_incremental_apply=True)
+        calls = self._fake_execute()
+        self.manager.apply()
+
+        del calls[:]
+        self.manager.ipv4['filter'].add_rule('FORWARD', '-j DROP', wrap=False)
+        self.manager.apply()
+        self.assertEqual([('iptables-save', '-c'), ('iptables-restore', '-c')],
+                         [cmd for cmd, process_input in calls])
+
+    def test_incremental_apply_periodic_full_apply(self):
+        self.flags(iptables_incremental_apply=True,
+                   iptables_full_apply_interval=600)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        calls = self._fake_execute()
+        self.manager.apply()
+
+        del calls[:]
+        self.manager.ipv4['filter'].add_rule('FORWARD', '-s 1.2.3.4/5 -j DROP')
+        self.manager.apply()
+        self.assertEqual([('iptables-restore', '-c', '--noflush')],
+                         [cmd for cmd, process_input in calls])
+
+        del calls[:]
+        timeutils.advance_time_seconds(601)
+        self.manager.ipv4['filter'].add_rule('FORWARD', '-s 5.6.7.8/9 -j DROP')
+        self.manager.apply()
+        self.assertEqual([('iptables-save', '-c'), ('iptables-restore', '-c')],
+                         [cmd for cmd, process_input in calls])
+
+    def test_apply_delay_coalesces_applies(self):
+        self.flags(iptables_apply_delay=0.5)
+        with contextlib.nested(
+                mock.patch.object(greenthread, 'spawn_after'),
+                mock.patch.object(self.manager, '_apply')
+        ) as (mock_spawn_after, mock_apply):
+            mock_spawn_after.return_value = 'timer'
+            self.manager.apply()
+            self.manager.ipv4['filter'].add_rule('FORWARD', '-j DROP')
+            self.manager.apply()
+            mock_spawn_after.assert_called_once_with(
+                    0.5, self.manager._apply_delayed)
+            self.assertFalse(mock_apply.called)
+
+            self.manager._apply_delayed()
+            mock_apply.assert_called_once_with()
+            self.assertIsNone(self.manager._apply_timer)
+
+    def test_apply_now_does_not_wait_for_delay(self):
+        self.flags(iptables_apply_delay=0.5)
+        timer = mock.Mock()
+        with contextlib.nested(
+                mock.patch.object(greenthread, 'spawn_after',
+                                  return_value=timer),
+                mock.patch.object(self.manager, '_apply')
+        ) as (mock_spawn_after, mock_apply):
+            self.manager.apply()
+            self.manager.apply_now()
+            timer.cancel.assert_called_once_with()
+            mock_apply.assert_called_once_with()
+            self.assertIsNone(self.manager._apply_timer)
@@ -0,0 +1,125 @@
+#    Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from nova import memorycache
+from nova.openstack.common import timeutils
+from nova import test
+
+
+class MemoryCacheClientTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(MemoryCacheClientTestCase, self).setUp()
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.client = memorycache.Client()
+
+    def _stats(self):
+        return self.client.get_stats()[0][1]
+
+    def test_set_get(self):
+        self.assertTrue(self.client.set('foo', 'bar'))
+        self.assertEqual('bar', self.client.get('foo'))
+        self.assertIsNone(self.client.get('baz'))
+        stats = self._stats()
+        self.assertEqual(1, stats['get_hits'])
+        self.assertEqual(1, stats['get_misses'])
+        self.assertEqual(1, stats['curr_items'])
+
+    def test_expiry(self):
+        self.client.set('foo', 'bar', time=10)
+        self.client.set('baz', 'qux')
+        timeutils.advance_time_seconds(9)
+        self.assertEqual('bar', self.client.get('foo'))
+        timeutils.advance_time_seconds(1)
+        self.assertIsNone(self.client.get('foo'))
+        self.assertEqual('qux', self.client.get('baz'))
+        self.assertEqual(1, self._stats()['expirations'])
+
+    def test_expiry_of_key_set_again(self):
+        self.client.set('foo', 'bar', time=10)
+        timeutils.advance_time_seconds(5)
+        self.client.set('foo', 'baz', time=10)
+        timeutils.advance_time_seconds(5)
+        self.assertEqual('baz', self.client.get('foo'))
+        timeutils.advance_time_seconds(5)
+        self.assertIsNone(self.client.get('foo'))
+
+    def test_outdated_timeouts_are_dropped(self):
+        for i in xrange(1000):
+            self.client.set('foo', i, time=60)
+        self.assertTrue(len(self.client._timeouts) < 100)
+        self.assertEqual(999, self.client.get('foo'))
+
+    def test_unbounded_by_default(self):
+        self.flags(memorycache_max_entries=1)
+        client = memorycache.get_client()
+        client.set('a', 1)
+        client.set('b', 2)
+        self.assertEqual(1, client.get('a'))
+        self.assertEqual(2, client.get('b'))
+
+    def test_max_entries_evicts_least_recently_used(self):
+        client = memorycache.Client(max_entries=2)
+        client.set('a', 1)
+        client.set('b', 2)
+        client.get('a')
+        client.set('c', 3)
+        self.assertIsNone(client.get('b'))
+        self.assertEqual(1, client.get('a'))
+        self.assertEqual(3, client.get('c'))
+        self.assertEqual(1, client.get_stats()[0][1]['evictions'])
+
+    def test_max_entries_argument(self):
+        client = memorycache.Client(max_entries=1)
+        client.set('a', 1)
+        client.set('b', 2)
+        self.assertIsNone(client.get('a'))
+        self.assertEqual(2, client.get('b'))
+
+    def test_outdated_uses_are_dropped(self):
+        self.client.set('foo', 'bar')
+        for i in xrange(1000):
+            self.client.get('foo')
+        self.assertTrue(len(self.client._lru) < 100)
+        self.assertEqual('bar', self.client.get('foo'))
+
+    def test_get_client(self):
+        self.assertIsInstance(memorycache.get_client(), memorycache.Client)
+        self.assertEqual(5, memorycache.get_client(max_entries=5).max_entries)
+
+    def test_add(self):
+        self.assertTrue(self.client.add('foo', 'bar'))
+        self.assertFalse(self.client.add('foo', 'baz'))
+        self.assertEqual('bar', self.client.get('foo'))
+
+    def test_add_expired(self):
+        self.client.set('foo', 'bar', time=1)
+        timeutils.advance_time_seconds(1)
+        self.assertTrue(self.client.add('foo', 'baz'))
+        self.assertEqual('baz', self.client.get('foo'))
+
+    def test_incr(self):
+        self.assertIsNone(self.client.incr('foo'))
+        self.client.set('foo', '1', time=10)
+        self.assertEqual(3, self.client.incr('foo', delta=2))
+        self.assertEqual('3', self.client.get('foo'))
+        timeutils.advance_time_seconds(10)
+        self.assertIsNone(self.client.get('foo'))
+
+    def test_delete(self):
+        self.client.set('foo', 'bar', time=10)
+        self.client.delete('foo')
+        self.client.delete('foo')
+        self.assertIsNone(self.client.get('foo'))
+        self.assertEqual(0, self._stats()['curr_items'])
@@ -20,6 +20,7 @@ import base64
 import hashlib
 import hmac
 import json
+import os
 import re
 
 try:
@@ -27,6 +28,7 @@ try:
 except ImportError:
     import pickle
 
+import mock
 import mox
 from oslo.config import cfg
 import webob
@@ -41,8 +43,11 @@ from nova import context
 from nova import db
 from nova.db.sqlalchemy import api
 from nova import exception
+from nova import memorycache
 from nova.network import api as network_api
 from nova.objects import instance as instance_obj
+from nova.openstack.common import timeutils
+from nova import rpc
 from nova import test
 from nova.tests import fake_block_device
 from nova.tests import fake_instance
@@ -155,6 +160,23 @@ class MetadataTestCase(test.TestCase):
         md = fake_InstanceMetadata(self.stubs, self.instance.obj_clone())
         pickle.dumps(md, protocol=0)
 
+    def test_can_pickle_prerendered_metadata(self):
+        md = fake_InstanceMetadata(self.stubs, self.instance.obj_clone())
+        md.prerender()
+        md = pickle.loads(pickle.dumps(md, protocol=0))
+        self.assertEqual(set(base.VERSIONS), set(md._ec2_metadata))
+        self.assertEqual('my_displayname',
+                         md._openstack_metadata['name'])
+
+    def test_ec2_metadata_is_a_copy(self):
+        md = fake_InstanceMetadata(self.stubs, self.instance.obj_clone())
+        data = md.get_ec2_metadata(version='2009-04-04')
+        data['meta-data']['hostname'] = 'changed'
+        self.assertEqual(md.get_ec2_metadata(version='2009-04-04'),
+                         md.get_ec2_metadata(version='latest'))
+        self.assertNotEqual('changed',
+                            md.lookup('/2009-04-04/meta-data/hostname'))
+
     def test_user_data(self):
         inst = self.instance.obj_clone()
         inst['user_data'] = base64.b64encode("happy")
@@ -497,6 +519,18 @@ class OpenStackMetadataTestCase(test.TestCase):
         mdjson = mdinst.lookup("/openstack/2012-08-10/meta_data.json")
         self.assertNotIn("random_seed", json.loads(mdjson))
 
+    def test_random_seed_differs_between_requests(self):
+        inst = self.instance.obj_clone()
+        mdinst = fake_InstanceMetadata(self.stubs, inst)
+
+        path = "/openstack/latest/meta_data.json"
+        first = json.loads(mdinst.lookup(path))
+        second = json.loads(mdinst.lookup(path))
+
+        self.assertNotEqual(first.pop('random_seed'),
+                            second.pop('random_seed'))
+        self.assertEqual(first, second)
+
     def test_no_dashes_in_metadata(self):
         # top level entries in meta_data should not contain '-' in their name
         inst = self.instance.obj_clone()
@@ -758,6 +792,149 @@ class MetadataHandlerTestCase(test.TestCase):
         self.assertEqual(response.status_int, 500)
 
 
+class MetadataCacheTestCase(test.TestCase):
+    """Test the caching of pre-rendered metadata."""
+
+    def setUp(self):
+        super(MetadataCacheTestCase, self).setUp()
+        fake_network.stub_out_nw_api_get_instance_nw_info(self.stubs)
+        self.context = context.RequestContext('fake', 'fake')
+        self.instance = fake_inst_obj(self.context)
+        self.instance.system_metadata = get_default_sys_meta()
+        self.flags(use_local=True, group='conductor')
+        self.mdinst = fake_InstanceMetadata(self.stubs, self.instance)
+        self.uuid = self.instance['uuid']
+
+        self.built = []
+
+        def fake_get_metadata(conductor_api, instance_id, address):
+            self.built.append((instance_id, address))
+            return self.mdinst
+
+        self.stubs.Set(base, 'get_metadata_by_instance_id',
+                       fake_get_metadata)
+        self.stubs.Set(base, 'get_instance_uuid_by_address',
+                       lambda address: self.uuid)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+
+    def _handler(self):
+        self.listener = mock.Mock()
+        self.stubs.Set(rpc, 'get_notification_listener',
+                       lambda targets, endpoints: self.listener)
+        with mock.patch.object(memorycache, 'get_client',
+                               return_value=memorycache.Client()):
+            app = handler.MetadataRequestHandler()
+        app(webob.Request.blank('/'))
+        return app
+
+    def test_metadata_is_prerendered(self):
+        app = self._handler()
+        self.assertEqual(self.mdinst,
+                         app.get_metadata_by_remote_address('10.0.0.1'))
+        self.assertEqual(self.mdinst,
+                         app.get_metadata_by_remote_address('10.0.0.1'))
+        self.assertEqual([(self.uuid, '10.0.0.1')], self.built)
+        self.assertEqual(set(base.VERSIONS), set(self.mdinst._ec2_metadata))
+
+    def test_metadata_expires_without_notifications(self):
+        app = self._handler()
+        self.assertFalse(self.listener.start.called)
+        app.get_metadata_by_instance_id(self.uuid, '10.0.0.1')
+        timeutils.advance_time_seconds(CONF.metadata_cache_expiration)
+        app.get_metadata_by_instance_id(self.uuid, '10.0.0.1')
+        self.assertEqual(2, len(self.built))
+
+    def test_metadata_kept_with_notifications(self):
+        self.flags(metadata_cache_notification_topic='metadata',
+                   memcached_servers=['localhost:11211'])
+        app = self._handler()
+        self.listener.start.assert_called_once_with()
+        app.get_metadata_by_instance_id(self.uuid, '10.0.0.1')
+        timeutils.advance_time_seconds(CONF.metadata_cache_expiration * 10)
+        app.get_metadata_by_instance_id(self.uuid, '10.0.0.1')
+        self.assertEqual(1, len(self.built))
+        timeutils.advance_time_seconds(
+            CONF.metadata_cache_notification_expiration)
+        app.get_metadata_by_instance_id(self.uuid, '10.0.0.1')
+        self.assertEqual(2, len(self.built))
+
+    def test_listener_started_in_each_process(self):
+        self.flags(metadata_cache_notification_topic='metadata',
+                   memcached_servers=['localhost:11211'])
+        app = self._handler()
+        with mock.patch.object(os, 'getpid', return_value=-1):
+            app(webob.Request.blank('/'))
+        self.assertEqual(2, self.listener.start.call_count)
+
+    def test_notifications_require_memcached_servers(self):
+        self.flags(metadata_cache_notification_topic='metadata')
+        app = self._handler()
+        self.assertFalse(self.listener.start.called)
+        app.get_metadata_by_instance_id(self.uuid, '10.0.0.1')
+        timeutils.advance_time_seconds(CONF.metadata_cache_expiration)
+        app.get_metadata_by_instance_id(self.uuid, '10.0.0.1')
+        self.assertEqual(2, len(self.built))
+
+    def test_notification_invalidates_metadata(self):
+        self.flags(metadata_cache_notification_topic='metadata')
+        app = self._handler()
+        endpoint = handler.MetadataCacheEndpoint(app)
+        app.get_metadata_by_remote_address('10.0.0.1')
+
+        endpoint.info(self.context, 'compute.host1',
+                      'compute.instance.update', {'instance_id': 'other'})
+        app.get_metadata_by_remote_address('10.0.0.1')
+        self.assertEqual(1, len(self.built))
+
+        endpoint.info(self.context, 'network.host1',
+                      'network.floating_ip.associate',
+                      {'instance_id': self.uuid, 'floating_ip': '1.2.3.4'})
+        self.assertIsNone(app._cache.get('metadata-generation-%s' %
+                                         self.uuid))
+        app.get_metadata_by_remote_address('10.0.0.1')
+        self.assertEqual(2, len(self.built))
+
+    def test_invalidate_drops_metadata_of_all_addresses(self):
+        app = self._handler()
+        app.get_metadata_by_remote_address('10.0.0.1')
+        app.get_metadata_by_remote_address('10.0.0.2')
+        app.get_metadata_by_remote_address('10.0.0.1')
+        app.get_metadata_by_remote_address('10.0.0.2')
+        self.assertEqual([(self.uuid, '10.0.0.1'), (self.uuid, '10.0.0.2')],
+                         self.built)
+
+        app.invalidate(self.uuid)
+        app.get_metadata_by_remote_address('10.0.0.1')
+        app.get_metadata_by_remote_address('10.0.0.2')
+        self.assertEqual(4, len(self.built))
+
+    def test_host_enabled_warms_up_cache(self):
+        self.flags(metadata_cache_notification_topic='metadata')
+        app = self._handler()
+        endpoint = handler.MetadataCacheEndpoint(app)
+
+        def fake_get_metadata_by_host(conductor_api, host):
+            self.assertEqual('host1', host)
+            yield ('10.0.0.1', self.mdinst)
+
+        self.stubs.Set(base, 'get_metadata_by_host',
+                       fake_get_metadata_by_host)
+        self.stubs.Set(base, 'get_instance_uuid_by_address',
+                       return_non_existing_address)
+
+        endpoint.info(self.context, 'HostAPI', 'HostAPI.set_enabled.end',
+                      {'host_name': 'host1', 'enabled': False})
+        self.assertIsNone(app.get_metadata_by_remote_address('10.0.0.1'))
+
+        endpoint.info(self.context, 'HostAPI', 'HostAPI.set_enabled.end',
+                      {'host_name': 'host1', 'enabled': True})
+        self.assertEqual(self.mdinst,
+                         app.get_metadata_by_remote_address('10.0.0.1'))
+        self.assertEqual([], self.built)
+        self.assertEqual(set(base.VERSIONS), set(self.mdinst._ec2_metadata))
+
+
 class MetadataPasswordTestCase(test.TestCase):
     def setUp(self):
         super(MetadataPasswordTestCase, self).setUp()
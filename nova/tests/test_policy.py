@@ -22,6 +22,7 @@ import urllib2
 from nova import context
 from nova import exception
 from nova.openstack.common import policy as common_policy
+from nova.openstack.common import timeutils
 from nova import policy
 from nova import test
 from nova.tests import policy_fixture
@@ -57,6 +58,34 @@ class PolicyFileTestCase(test.NoDBTestCase):
             self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
                               self.context, action, self.target)
 
+    def test_policy_check_interval(self):
+        self.flags(policy_check_interval=60)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        with utils.tempdir() as tmpdir:
+            tmpfilename = os.path.join(tmpdir, 'policy')
+            self.flags(policy_file=tmpfilename)
+            policy.reset()
+
+            action = "example:test"
+            with open(tmpfilename, "w") as policyfile:
+                policyfile.write('{"example:test": ""}')
+            policy.enforce(self.context, action, self.target)
+
+            self.mox.StubOutWithMock(utils, 'read_cached_file')
+            self.mox.ReplayAll()
+            timeutils.advance_time_seconds(59)
+            policy.enforce(self.context, action, self.target)
+            self.mox.VerifyAll()
+
+            self.mox.UnsetStubs()
+            with open(tmpfilename, "w") as policyfile:
+                policyfile.write('{"example:test": "!"}')
+            policy._POLICY_CACHE = {}
+            timeutils.advance_time_seconds(1)
+            self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                              self.context, action, self.target)
+
 
 class PolicyTestCase(test.NoDBTestCase):
     def setUp(self):
@@ -134,6 +163,50 @@ class PolicyTestCase(test.NoDBTestCase):
         action = "example:early_or_success"
         policy.enforce(self.context, action, self.target)
 
+    def test_templatized_enforcement_missing_target_key(self):
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, "example:my_file", {})
+
+    def test_enforce_memoized_on_context(self):
+        target = {'project_id': 'fake', 'user_id': 'other'}
+        policy.enforce(self.context, "example:my_file", target)
+        self.assertEqual({("example:my_file", 'fake', ('member',), 'fake'):
+                          True},
+                         self.context._policy_cache[1])
+
+        self.mox.StubOutWithMock(policy, '_call')
+        self.mox.ReplayAll()
+        self.assertTrue(policy.enforce(self.context, "example:my_file",
+                                       {'project_id': 'fake'}))
+
+    def test_enforce_memoized_results_dropped_with_rules(self):
+        target = {'project_id': 'fake'}
+        policy.enforce(self.context, "example:my_file", target)
+        self.policy.set_rules({"example:my_file": "!"})
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, "example:my_file", target)
+
+    def test_compiled_rules_match_check_tree(self):
+        rules = {
+            "admin": "role:admin or is_admin:True",
+            "owner": "project_id:%(project_id)s and not rule:admin",
+            "example:nested": "rule:owner or (rule:admin and @)",
+            "example:missing": "rule:noexist or user_id:%(user_id)s",
+        }
+        self.policy.set_rules(rules)
+        contexts = [self.context,
+                    context.RequestContext('fake', 'other'),
+                    context.RequestContext('fake', 'fake', roles=['admin'])]
+        targets = [{'project_id': 'fake', 'user_id': 'fake'},
+                   {'project_id': 'other', 'user_id': 'other'}]
+        for action in ('example:nested', 'example:missing'):
+            for ctxt in contexts:
+                for target in targets:
+                    creds = ctxt.to_dict()
+                    self.assertEqual(
+                            common_policy.check(action, target, creds),
+                            policy.enforce(ctxt, action, target, False))
+
     def test_ignore_case_role_check(self):
         lowercase_action = "example:lowercase_admin"
         uppercase_action = "example:uppercase_admin"
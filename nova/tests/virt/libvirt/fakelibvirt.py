@@ -137,6 +137,15 @@ VIR_CONNECT_RO = 1
 # virConnectBaselineCPU flags
 VIR_CONNECT_BASELINE_CPU_EXPAND_FEATURES = 1
 
+# virConnectGetAllDomainStats stats and flags
+VIR_DOMAIN_STATS_STATE = 1
+VIR_DOMAIN_STATS_CPU_TOTAL = 2
+VIR_DOMAIN_STATS_BALLOON = 4
+VIR_DOMAIN_STATS_VCPU = 8
+VIR_DOMAIN_STATS_INTERFACE = 16
+VIR_DOMAIN_STATS_BLOCK = 32
+VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE = 16
+
 # snapshotCreateXML flags
 VIR_DOMAIN_SNAPSHOT_CREATE_NO_METADATA = 4
 VIR_DOMAIN_SNAPSHOT_CREATE_DISK_ONLY = 16
@@ -598,6 +607,9 @@ class Connection(object):
                            'id %d' % id,
                            VIR_ERR_NO_DOMAIN, VIR_FROM_QEMU)
 
+    def listAllDomains(self, flags):
+        return self._vms.values()
+
     def lookupByName(self, name):
         if name in self._vms:
             return self._vms[name]
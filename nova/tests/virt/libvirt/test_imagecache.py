@@ -109,7 +109,8 @@ class ImageCacheManagerTestCase(test.NoDBTestCase):
         listing = ['00000001',
                    'ephemeral_0_20_None',
                    '17d1b00b81642842e514494a78e804e9a511637c_5368709120.info',
-                    '00000004']
+                    '00000004',
+                   'e09c675c2d1cfac32dae3c2d83689c8c94bc693b.part']
         images = ['e97222e91fc4241f49a7f520d1dcf446751129b3_sm',
                   'e09c675c2d1cfac32dae3c2d83689c8c94bc693b_sm',
                   'e97222e91fc4241f49a7f520d1dcf446751129b3',
@@ -148,6 +149,11 @@ class ImageCacheManagerTestCase(test.NoDBTestCase):
         for ent in image_cache_manager.unexplained_images:
             self.assertTrue(ent.startswith(base_dir))
 
+        self.assertEqual([os.path.join(base_dir,
+                                       'e09c675c2d1cfac32dae3c2d83689c8c94bc'
+                                       '693b.part')],
+                         image_cache_manager.partial_downloads)
+
         self.assertEqual(len(image_cache_manager.originals), 2)
 
         expected = os.path.join(base_dir,
@@ -244,6 +250,84 @@ class ImageCacheManagerTestCase(test.NoDBTestCase):
         self.assertRaises(processutils.ProcessExecutionError,
                           image_cache_manager._list_backing_images)
 
+    def test_list_backing_images_incremental(self):
+        backing_calls = []
+
+        def fake_get_disk(disk_path):
+            backing_calls.append(disk_path)
+            return 'e97222e91fc4241f49a7f520d1dcf446751129b3'
+
+        self.stubs.Set(virtutils, 'get_disk_backing_file', fake_get_disk)
+
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self.flags(image_cache_incremental=True, group='libvirt')
+            for ent in ('instance-00000001', 'instance-00000002'):
+                os.mkdir(os.path.join(tmpdir, ent))
+                open(os.path.join(tmpdir, ent, 'disk'), 'w').close()
+            found = os.path.join(tmpdir, CONF.image_cache_subdirectory_name,
+                                 'e97222e91fc4241f49a7f520d1dcf446751129b3')
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.instance_names = self.stock_instance_names
+            self.assertEqual([found],
+                             image_cache_manager._list_backing_images())
+            self.assertEqual(2, len(backing_calls))
+
+            # Nothing changed, qemu-img is not run again
+            self.assertEqual([found],
+                             image_cache_manager._list_backing_images())
+            self.assertEqual(2, len(backing_calls))
+
+            # The index survives a restart of nova-compute
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.instance_names = self.stock_instance_names
+            self.assertEqual([found],
+                             image_cache_manager._list_backing_images())
+            self.assertEqual(2, len(backing_calls))
+
+            # Only the instance whose disk was created again is inspected,
+            # even if the new disk file got the inode of the old one
+            instance_dir = os.path.join(tmpdir, 'instance-00000002')
+            os.utime(instance_dir, (-1, time.time() - 60))
+            self.assertEqual([found],
+                             image_cache_manager._list_backing_images())
+            self.assertEqual(
+                os.path.join(tmpdir, 'instance-00000002', 'disk'),
+                backing_calls[-1])
+            self.assertEqual(3, len(backing_calls))
+
+            # Deleted instances are forgotten
+            os.remove(os.path.join(tmpdir, 'instance-00000001', 'disk'))
+            image_cache_manager._list_backing_images()
+            self.assertEqual(['instance-00000002'],
+                             image_cache_manager.backing_index.keys())
+
+    def test_list_backing_images_incremental_shared_index(self):
+        self.stubs.Set(virtutils, 'get_disk_backing_file',
+                       lambda disk_path: 'e97222e91fc4241f49a7f520d1dcf446751'
+                                         '129b3')
+
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self.flags(image_cache_incremental=True, group='libvirt')
+            for ent in ('instance-00000001', 'instance-00000002'):
+                os.mkdir(os.path.join(tmpdir, ent))
+                open(os.path.join(tmpdir, ent, 'disk'), 'w').close()
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.instance_names = set(['instance-00000001'])
+            other_node = imagecache.ImageCacheManager()
+            other_node.instance_names = set(['instance-00000002'])
+
+            image_cache_manager._list_backing_images()
+            other_node._list_backing_images()
+            image_cache_manager._list_backing_images()
+
+            # The entries written by the other node are kept
+            self.assertEqual(['instance-00000001', 'instance-00000002'],
+                             sorted(image_cache_manager._load_backing_index()))
+
     def test_find_base_file_nothing(self):
         self.stubs.Set(os.path, 'exists', lambda x: False)
 
@@ -374,6 +458,21 @@ class ImageCacheManagerTestCase(test.NoDBTestCase):
             self.assertFalse(os.path.exists(fname))
             self.assertFalse(os.path.exists(info_fname))
 
+    def test_remove_partial_download(self):
+        with utils.tempdir() as tmpdir:
+            fname = os.path.join(tmpdir, 'aaa.part')
+            with open(fname, 'w') as f:
+                f.write('data')
+            image_cache_manager = imagecache.ImageCacheManager()
+
+            # A download may still be resumed from a recent partial file
+            image_cache_manager._remove_partial_download(fname)
+            self.assertTrue(os.path.exists(fname))
+
+            os.utime(fname, (-1, time.time() - 3600 * 25))
+            image_cache_manager._remove_partial_download(fname)
+            self.assertFalse(os.path.exists(fname))
+
     def test_remove_base_file_dne(self):
         # This test is solely to execute the "does not exist" code path. We
         # don't expect the method being tested to do anything in this case.
@@ -439,6 +538,23 @@ class ImageCacheManagerTestCase(test.NoDBTestCase):
             self.assertEqual(image_cache_manager.removable_base_files, [])
             self.assertEqual(image_cache_manager.corrupt_base_files, [])
 
+    def test_handle_base_image_prefetched(self):
+        self.stubs.Set(virtutils, 'chown', lambda x, y: None)
+        self.flags(image_prefetch_ids=['123'])
+        img = '123'
+
+        with self._make_base_file() as fname:
+            os.utime(fname, (-1, time.time() - 3601))
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.unexplained_images = [fname]
+            image_cache_manager.used_images = {'123': (0, 0, [])}
+            image_cache_manager._handle_base_image(img, fname)
+
+            self.assertEqual(image_cache_manager.unexplained_images, [])
+            self.assertEqual(image_cache_manager.removable_base_files, [])
+            self.assertEqual(image_cache_manager.active_base_files, [fname])
+
     def test_handle_base_image_used_remotely(self):
         self.stubs.Set(virtutils, 'chown', lambda x, y: None)
         img = '123'
@@ -825,6 +941,22 @@ class VerifyChecksumTestCase(test.NoDBTestCase):
             res = image_cache_manager._verify_checksum(self.img, fname)
             self.assertTrue(res)
 
+    def test_verify_checksum_budget(self):
+        self.flags(checksum_max_bytes_per_pass=1, group='libvirt')
+        self.flags(checksum_interval_seconds=0, group='libvirt')
+        with utils.tempdir() as tmpdir:
+            image_cache_manager, fname = self._check_body(tmpdir, "csum valid")
+            # The first checksum of a pass is allowed whatever its size
+            res = image_cache_manager._verify_checksum(self.img, fname)
+            self.assertTrue(res)
+            res = image_cache_manager._verify_checksum(self.img, fname)
+            self.assertIsNone(res)
+
+            # The next pass gets a new budget
+            image_cache_manager._reset_state()
+            res = image_cache_manager._verify_checksum(self.img, fname)
+            self.assertTrue(res)
+
     def test_verify_checksum_disabled(self):
         self.flags(checksum_base_images=False, group='libvirt')
         with utils.tempdir() as tmpdir:
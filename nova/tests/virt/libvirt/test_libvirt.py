@@ -73,6 +73,7 @@ from nova.virt.libvirt import config as vconfig
 from nova.virt.libvirt import driver as libvirt_driver
 from nova.virt.libvirt import firewall
 from nova.virt.libvirt import imagebackend
+from nova.virt.libvirt import imagecache
 from nova.virt.libvirt import utils as libvirt_utils
 from nova.virt import netutils
 
@@ -2341,6 +2342,52 @@ class LibvirtConnTestCase(test.TestCase):
         # Only one defined domain should be listed
         self.assertEqual(len(instances), 1)
 
+    def _fake_power_state_domain(self, domain_id, uuid, state):
+        domain = mock.Mock()
+        domain.ID.return_value = domain_id
+        domain.UUIDString.return_value = uuid
+        domain.info.return_value = [state, 2048, 2048, 1, 0]
+        return domain
+
+    def test_get_power_states(self):
+        domains = [self._fake_power_state_domain(0, 'dom0', 1),
+                   self._fake_power_state_domain(1, 'uuid1', 1),
+                   self._fake_power_state_domain(-1, 'uuid2', 5)]
+        gone = self._fake_power_state_domain(2, 'uuid3', 1)
+        gone.info.side_effect = libvirt.libvirtError('domain went away')
+        domains.append(gone)
+        fake_conn = mock.Mock(spec=['listAllDomains'])
+        fake_conn.listAllDomains.return_value = domains
+
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        with mock.patch.object(libvirt_driver.LibvirtDriver, '_conn',
+                               fake_conn):
+            power_states = conn.get_power_states()
+
+        fake_conn.listAllDomains.assert_called_once_with(0)
+        self.assertEqual({'uuid1': power_state.RUNNING,
+                          'uuid2': power_state.SHUTDOWN}, power_states)
+
+    def test_get_power_states_without_list_all_domains(self):
+        running = self._fake_power_state_domain(1, 'uuid1', 1)
+        defined = self._fake_power_state_domain(-1, 'uuid2', 5)
+        fake_conn = mock.Mock(spec=['numOfDomains', 'listDomainsID',
+                                    'lookupByID', 'listDefinedDomains',
+                                    'lookupByName'])
+        fake_conn.numOfDomains.return_value = 1
+        fake_conn.listDomainsID.return_value = [1]
+        fake_conn.lookupByID.return_value = running
+        fake_conn.listDefinedDomains.return_value = ['instance-2']
+        fake_conn.lookupByName.return_value = defined
+
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        with mock.patch.object(libvirt_driver.LibvirtDriver, '_conn',
+                               fake_conn):
+            power_states = conn.get_power_states()
+
+        self.assertEqual({'uuid1': power_state.RUNNING,
+                          'uuid2': power_state.SHUTDOWN}, power_states)
+
     def test_list_instances_when_instance_deleted(self):
 
         def fake_lookup(instance_name):
@@ -6153,6 +6200,33 @@ class LibvirtConnTestCase(test.TestCase):
                   }
         self.assertEqual(actual, expect)
 
+    def test_prefetch_image(self):
+        self.flags(checksum_base_images=True, group='libvirt')
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        base = os.path.join(CONF.instances_path,
+                            CONF.image_cache_subdirectory_name,
+                            imagecache.get_cache_fname(
+                                {'image_id': 'fake-image'}, 'image_id'))
+
+        def fake_fetch_image(context, target, image_id, user_id, project_id):
+            self.assertEqual(base, target)
+            open(target, 'w').close()
+            return 'fake-checksum'
+
+        with contextlib.nested(
+            mock.patch.object(libvirt_driver.libvirt_utils, 'fetch_image',
+                              side_effect=fake_fetch_image),
+            mock.patch.object(imagecache, 'write_stored_info'),
+        ) as (fetch_image, write_stored_info):
+            conn.prefetch_image(self.context, 'fake-image')
+            # the image is in the cache now, don't fetch it again
+            conn.prefetch_image(self.context, 'fake-image')
+
+        self.assertEqual(1, fetch_image.call_count)
+        write_stored_info.assert_called_once_with(
+            base, field='sha1', value='fake-checksum')
+        self.assertEqual(['fake-image'], conn.get_cached_images())
+
     def test_failing_vcpu_count(self):
         """Domain can fail to return the vcpu description in case it's
         just starting up or shutting down. Make sure None is handled
@@ -6182,6 +6256,68 @@ class LibvirtConnTestCase(test.TestCase):
 
         self.assertEqual(5, driver.get_vcpu_used())
 
+    def _bulk_domain_stats(self):
+        dom = mock.Mock()
+        dom.ID.return_value = 1
+        dom.name.return_value = 'instance-00000001'
+        values = {'vcpu.current': 2,
+                  'balloon.current': 524288,
+                  'block.count': 1,
+                  'block.0.name': 'vda',
+                  'block.0.rd.reqs': 1,
+                  'block.0.rd.bytes': 2,
+                  'block.0.wr.reqs': 3,
+                  'block.0.wr.bytes': 4,
+                  'block.0.fl.reqs': 5,
+                  'net.count': 1,
+                  'net.0.name': 'vnet0',
+                  'net.0.rx.bytes': 1,
+                  'net.0.rx.pkts': 2,
+                  'net.0.rx.errs': 3,
+                  'net.0.rx.drop': 4,
+                  'net.0.tx.bytes': 5,
+                  'net.0.tx.pkts': 6,
+                  'net.0.tx.errs': 7,
+                  'net.0.tx.drop': 8}
+        return [(dom, values)]
+
+    def test_domain_stats_bulk(self):
+        driver = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
+        with mock.patch.object(driver._conn, 'getAllDomainStats',
+                               create=True,
+                               return_value=self._bulk_domain_stats()
+                               ) as mock_stats:
+            self.assertEqual(2, driver.get_vcpu_used())
+            self.assertEqual((1, 2, 3, 4, -1),
+                             driver.block_stats('instance-00000001', 'vda'))
+            self.assertEqual((1, 2, 3, 4, 5, 6, 7, 8),
+                             driver.interface_stats('instance-00000001',
+                                                    'vnet0'))
+        self.assertEqual(1, mock_stats.call_count)
+
+    def test_domain_stats_ttl(self):
+        self.flags(domain_stats_ttl=0, group='libvirt')
+        driver = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
+        with mock.patch.object(driver._conn, 'getAllDomainStats',
+                               create=True,
+                               return_value=self._bulk_domain_stats()
+                               ) as mock_stats:
+            driver.get_vcpu_used()
+            driver.get_vcpu_used()
+        self.assertEqual(2, mock_stats.call_count)
+
+    def test_domain_stats_bulk_unsupported(self):
+        driver = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
+        self.mox.StubOutWithMock(driver, '_get_domain_stats_per_domain')
+        driver._get_domain_stats_per_domain().AndReturn(
+            {1: {'name': 'instance-00000001', 'vcpus': 3, 'memory': None,
+                 'block': None, 'interface': None}})
+        self.mox.ReplayAll()
+        with mock.patch.object(driver._conn, 'getAllDomainStats',
+                               create=True,
+                               side_effect=libvirt.libvirtError('fake')):
+            self.assertEqual(3, driver.get_vcpu_used())
+
     def test_get_instance_capabilities(self):
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
 
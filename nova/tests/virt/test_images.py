@@ -12,8 +12,18 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import hashlib
+import os
+import struct
 
+import fixtures
+import mock
+
+from nova import exception
+from nova.openstack.common import units
 from nova import test
+from nova import utils
 from nova.virt import images
 
 
@@ -22,3 +32,183 @@ class QemuTestCase(test.NoDBTestCase):
         image_info = images.qemu_img_info("/path/that/does/not/exist")
         self.assertTrue(image_info)
         self.assertTrue(str(image_info))
+
+
+class QemuImgInfoCacheTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(QemuImgInfoCacheTestCase, self).setUp()
+        images.invalidate_qemu_img_info()
+        self.addCleanup(images.invalidate_qemu_img_info)
+        self.path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                 'disk')
+        with open(self.path, 'w') as f:
+            f.write('disk')
+        output = ('image: %s\nfile format: raw\n'
+                  'virtual size: 1.0G (1073741824 bytes)\n'
+                  'disk size: 4.0K\n' % self.path)
+        patcher = mock.patch.object(utils, 'execute',
+                                    return_value=(output, ''))
+        self.mock_execute = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached(self):
+        info = images.qemu_img_info(self.path)
+        self.assertEqual('raw', info.file_format)
+        self.assertIs(info, images.qemu_img_info(self.path))
+        self.assertEqual(1, self.mock_execute.call_count)
+
+    def test_file_changed(self):
+        images.qemu_img_info(self.path)
+        with open(self.path, 'a') as f:
+            f.write('more')
+        images.qemu_img_info(self.path)
+        self.assertEqual(2, self.mock_execute.call_count)
+
+    def test_invalidate(self):
+        images.qemu_img_info(self.path)
+        images.invalidate_qemu_img_info(self.path)
+        images.qemu_img_info(self.path)
+        self.assertEqual(2, self.mock_execute.call_count)
+
+    def test_disabled(self):
+        self.flags(qemu_img_info_cache_size=0)
+        images.qemu_img_info(self.path)
+        images.qemu_img_info(self.path)
+        self.assertEqual(2, self.mock_execute.call_count)
+
+    def test_bounded(self):
+        self.flags(qemu_img_info_cache_size=1)
+        other = self.path + '.other'
+        with open(other, 'w') as f:
+            f.write('other')
+        images.qemu_img_info(self.path)
+        images.qemu_img_info(other)
+        images.qemu_img_info(self.path)
+        self.assertEqual(3, self.mock_execute.call_count)
+        self.assertEqual([self.path], images._QEMU_IMG_INFO_CACHE.keys())
+
+    def test_bounded_keeps_recently_used(self):
+        self.flags(qemu_img_info_cache_size=2)
+        paths = [self.path + '.1', self.path + '.2']
+        for path in paths:
+            with open(path, 'w') as f:
+                f.write('other')
+        images.qemu_img_info(self.path)
+        images.qemu_img_info(paths[0])
+        images.qemu_img_info(self.path)
+        images.qemu_img_info(paths[1])
+        self.assertEqual(sorted([self.path, paths[1]]),
+                         sorted(images._QEMU_IMG_INFO_CACHE.keys()))
+
+    def test_convert_image_invalidates(self):
+        images.qemu_img_info(self.path)
+        images.convert_image('source', self.path, 'raw')
+        images.qemu_img_info(self.path)
+        self.assertEqual(3, self.mock_execute.call_count)
+
+
+class FakeImageService(object):
+    def __init__(self, chunks, checksum=None):
+        self.chunks = chunks
+        self.checksum = checksum
+        self.received = []
+
+    def show(self, context, image_id):
+        return {'id': image_id, 'checksum': self.checksum,
+                'size': sum(len(chunk) for chunk in self.chunks)}
+
+    def download(self, context, image_id, data=None, dst_path=None):
+        for chunk in self.chunks:
+            self.received.append(chunk)
+            yield chunk
+
+
+class FetchTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(FetchTestCase, self).setUp()
+        self.path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                 'image')
+
+    def _fetch(self, chunks, checksum=None, max_size=0):
+        self.image_service = FakeImageService(chunks, checksum)
+        self.stubs.Set(images.glance, 'get_remote_image_service',
+                       lambda c, href: (self.image_service, href))
+        return images.fetch('context', 'fake-image', self.path, 'user',
+                            'project', max_size=max_size)
+
+    def _qcow2_header(self, backing_file_offset=0, size=units.Gi):
+        return struct.pack('>4sIQIIQ', 'QFI\xfb', 2, backing_file_offset, 0,
+                           16, size)
+
+    def test_fetch(self):
+        chunks = ['foo', 'bar']
+        checksum = self._fetch(chunks, hashlib.md5('foobar').hexdigest())
+        self.assertEqual(hashlib.sha1('foobar').hexdigest(), checksum)
+        with open(self.path) as f:
+            self.assertEqual('foobar', f.read())
+
+    def test_fetch_checksum_mismatch(self):
+        self.assertRaises(exception.ImageUnacceptable, self._fetch,
+                          ['foo', 'bar'], 'not-the-checksum')
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_fetch_rejects_backing_file_early(self):
+        chunks = [self._qcow2_header(backing_file_offset=512), 'rest']
+        self.assertRaises(exception.ImageUnacceptable, self._fetch, chunks)
+        self.assertEqual(1, len(self.image_service.received))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_fetch_rejects_too_big_early(self):
+        chunks = [self._qcow2_header(size=2 * units.Gi), 'rest']
+        self.assertRaises(exception.FlavorDiskTooSmall, self._fetch, chunks,
+                          max_size=units.Gi)
+        self.assertEqual(1, len(self.image_service.received))
+
+    def test_fetch_qcow2(self):
+        chunks = [self._qcow2_header(), 'rest']
+        self.assertIsNotNone(self._fetch(chunks, max_size=units.Gi))
+
+    def test_fetch_direct_url(self):
+        self.flags(allowed_direct_url_schemes=['file'])
+        image_service = mock.Mock()
+        self.stubs.Set(images.glance, 'get_remote_image_service',
+                       lambda c, href: (image_service, href))
+        self.assertIsNone(images.fetch('context', 'fake-image', self.path,
+                                       'user', 'project'))
+        image_service.download.assert_called_once_with(
+            'context', 'fake-image', dst_path=self.path)
+
+    def test_fetch_ranged(self):
+        self.flags(glance_download_workers=2)
+        image_service = mock.Mock()
+        self.stubs.Set(images.glance, 'get_remote_image_service',
+                       lambda c, href: (image_service, href))
+        self.assertIsNone(images.fetch('context', 'fake-image', self.path,
+                                       'user', 'project'))
+        image_service.download.assert_called_once_with(
+            'context', 'fake-image', dst_path=self.path)
+
+    def test_fetch_to_raw_returns_checksum(self):
+        self.stubs.Set(images, 'fetch', lambda *a, **kw: 'sha1')
+        info = mock.Mock(file_format='raw', backing_file=None,
+                         virtual_size=1)
+        with contextlib.nested(
+                mock.patch.object(images, 'qemu_img_info',
+                                  return_value=info),
+                mock.patch.object(os, 'rename')):
+            self.assertEqual('sha1', images.fetch_to_raw(
+                'context', 'fake-image', self.path, 'user', 'project'))
+
+    def test_fetch_to_raw_converted(self):
+        self.stubs.Set(images, 'fetch', lambda *a, **kw: 'sha1')
+        info = mock.Mock(file_format='qcow2', backing_file=None,
+                         virtual_size=1)
+        raw_info = mock.Mock(file_format='raw')
+        with contextlib.nested(
+                mock.patch.object(images, 'qemu_img_info',
+                                  side_effect=[info, raw_info]),
+                mock.patch.object(images, 'convert_image'),
+                mock.patch.object(os, 'unlink'),
+                mock.patch.object(os, 'rename')):
+            self.assertIsNone(images.fetch_to_raw(
+                'context', 'fake-image', self.path, 'user', 'project'))
@@ -150,6 +150,7 @@ def extend(image, size, use_cow=False):
         return
 
     utils.execute('qemu-img', 'resize', image, size)
+    images.invalidate_qemu_img_info(image)
 
     # if we can't access the filesystem, we can't do anything more
     if not is_image_partitionless(image, use_cow):
@@ -171,6 +171,18 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def get_power_states(self):
+        """Return the power states of all instances on the hypervisor.
+
+        Returns a dict mapping instance uuids to one of the power_state
+        codes. Instances the hypervisor doesn't know about are left out.
+
+        This should be done with as few calls to the hypervisor as possible,
+        it lets the compute manager sync the power states of all instances
+        without calling get_info() for each of them.
+        """
+        raise NotImplementedError()
+
     def get_num_instances(self):
         """Return the total number of virtual machines.
 
@@ -1105,6 +1117,26 @@ class ComputeDriver(object):
         """
         pass
 
+    def prefetch_image(self, context, image_id):
+        """Fetch an image into the driver's local image cache.
+
+        Drivers which cache images on disk download the image ahead of the
+        first instance using it, so that spawning that instance does not
+        wait for the download.
+
+        :param context: security context
+        :param image_id: ID of the image to fetch
+        """
+        raise NotImplementedError()
+
+    def get_cached_images(self):
+        """Return the IDs of the images in the driver's local image cache.
+
+        The IDs are reported to the scheduler, which can prefer the hosts
+        already holding the image of an instance.
+        """
+        return []
+
     def add_to_aggregate(self, context, aggregate, host, **kwargs):
         """Add a compute host to an aggregate."""
         #NOTE(jogo) Currently only used for XenAPI-Pool
@@ -72,9 +72,10 @@ def restore_nodes():
 
 class FakeInstance(object):
 
-    def __init__(self, name, state):
+    def __init__(self, name, state, uuid):
         self.name = name
         self.state = state
+        self.uuid = uuid
 
     def __getitem__(self, key):
         return getattr(self, key)
@@ -128,7 +129,7 @@ class FakeDriver(driver.ComputeDriver):
               admin_password, network_info=None, block_device_info=None):
         name = instance['name']
         state = power_state.RUNNING
-        fake_instance = FakeInstance(name, state)
+        fake_instance = FakeInstance(name, state, instance['uuid'])
         self.instances[name] = fake_instance
 
     def snapshot(self, context, instance, name, update_task_state):
@@ -255,6 +256,9 @@ class FakeDriver(driver.ComputeDriver):
         except KeyError:
             raise exception.InterfaceDetachFailed('not attached')
 
+    def get_power_states(self):
+        return dict((i.uuid, i.state) for i in self.instances.itervalues())
+
     def get_info(self, instance):
         if instance['name'] not in self.instances:
             raise exception.InstanceNotFound(instance_id=instance['name'])
@@ -197,7 +197,9 @@ class IptablesFirewallDriver(FirewallDriver):
                     '-s 0.0.0.0/32 -d 255.255.255.255/32 '
                     '-p udp -m udp --sport 68 --dport 67 -j ACCEPT')
             self.dhcp_created = True
-        self.iptables.apply()
+        # NOTE: the instance starts once this returns, so its filters must
+        # not wait for iptables_apply_delay.
+        self.iptables.apply_now()
 
     def _create_filter(self, ips, chain_name):
         return ['-d %s -j $%s' % (ip, chain_name) for ip in ips]
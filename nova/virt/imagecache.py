@@ -38,6 +38,35 @@ imagecache_opts = [
                help='Unused unresized base images younger than this will not '
                     'be removed',
                deprecated_group='libvirt'),
+    cfg.ListOpt('image_prefetch_ids',
+                default=[],
+                help='IDs of images to fetch into the image cache before '
+                     'any instance uses them. The image cache manager '
+                     'does not remove these images'),
+    cfg.IntOpt('image_prefetch_interval',
+               default=0,
+               help='Number of seconds to wait between runs of the image '
+                    'prefetch task. Set to 0 to disable prefetching'),
+    cfg.IntOpt('image_prefetch_concurrency',
+               default=2,
+               help='Maximum number of images downloaded at the same time '
+                    'by the image prefetch task. Only the number of '
+                    'downloads is bounded, not the bandwidth they use'),
+    cfg.StrOpt('image_prefetch_admin_username',
+               help='Username the image prefetch task uses to get a token '
+                    'from keystone. When auth_strategy is keystone and no '
+                    'username is set, images are not prefetched'),
+    cfg.StrOpt('image_prefetch_admin_password',
+               help='Password the image prefetch task uses to get a token '
+                    'from keystone',
+               secret=True),
+    cfg.StrOpt('image_prefetch_admin_tenant_name',
+               help='Tenant name the image prefetch task uses to get a '
+                    'token from keystone'),
+    cfg.StrOpt('image_prefetch_admin_auth_url',
+               default='http://localhost:5000/v2.0',
+               help='Keystone URL the image prefetch task gets its token '
+                    'from'),
     ]
 
 CONF = cfg.CONF
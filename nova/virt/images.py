@@ -19,7 +19,12 @@
 Handling of VM disk images.
 """
 
+import hashlib
+import heapq
+import itertools
 import os
+import struct
+import time
 
 from oslo.config import cfg
 
@@ -29,6 +34,7 @@ from nova.openstack.common import fileutils
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import imageutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import units
 from nova import utils
 
 LOG = logging.getLogger(__name__)
@@ -37,45 +43,208 @@ image_opts = [
     cfg.BoolOpt('force_raw_images',
                 default=True,
                 help='Force backing images to raw format'),
+    cfg.IntOpt('qemu_img_info_cache_size',
+               default=1000,
+               help='Maximum number of qemu-img info results kept in '
+                    'memory. A result is reused as long as the inode, '
+                    'modification time and size of the image file are '
+                    'unchanged. Set to 0 to disable the cache'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(image_opts)
+CONF.import_opt('allowed_direct_url_schemes', 'nova.image.glance')
+CONF.import_opt('glance_download_workers', 'nova.image.glance')
+
+# Seconds between two progress reports of an image download.
+_PROGRESS_INTERVAL = 10
+
+_QCOW2_MAGIC = 'QFI\xfb'
+# magic, version, backing_file_offset, backing_file_size, cluster_bits, size
+_QCOW2_HEADER = struct.Struct('>4sIQIIQ')
+
+# Maps image paths to (stat key, QemuImgInfo, last use).
+_QEMU_IMG_INFO_CACHE = {}
+_QEMU_IMG_INFO_USES = itertools.count()
+
+
+def _qemu_img_info_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime, st.st_size)
 
 
 def qemu_img_info(path):
-    """Return an object containing the parsed output from qemu-img info."""
+    """Return an object containing the parsed output from qemu-img info.
+
+    Results for local files are cached until the file changes or
+    invalidate_qemu_img_info() is called for it.
+    """
     # TODO(mikal): this code should not be referring to a libvirt specific
     # flag.
     if not os.path.exists(path) and CONF.libvirt.images_type != 'rbd':
         return imageutils.QemuImgInfo()
 
+    key = None
+    if CONF.qemu_img_info_cache_size > 0:
+        key = _qemu_img_info_key(path)
+        cached = _QEMU_IMG_INFO_CACHE.pop(path, None)
+        if key is not None and cached is not None and cached[0] == key:
+            _QEMU_IMG_INFO_CACHE[path] = (key, cached[1],
+                                          next(_QEMU_IMG_INFO_USES))
+            return cached[1]
+
     out, err = utils.execute('env', 'LC_ALL=C', 'LANG=C',
                              'qemu-img', 'info', path)
-    return imageutils.QemuImgInfo(out)
+    info = imageutils.QemuImgInfo(out)
+    # NOTE: Only cache the result if the file did not change while
+    # qemu-img was looking at it.
+    if key is not None and _qemu_img_info_key(path) == key:
+        _QEMU_IMG_INFO_CACHE[path] = (key, info, next(_QEMU_IMG_INFO_USES))
+        _evict_qemu_img_info(CONF.qemu_img_info_cache_size)
+    return info
+
+
+def _evict_qemu_img_info(size):
+    """Drop the least recently used results beyond size.
+
+    This goes through all the results, which is cheap next to the
+    qemu-img run that preceded it.
+    """
+    excess = len(_QEMU_IMG_INFO_CACHE) - size
+    if excess > 0:
+        lru = heapq.nsmallest(excess, _QEMU_IMG_INFO_CACHE.iteritems(),
+                              key=lambda item: item[1][2])
+        for path, _cached in lru:
+            del _QEMU_IMG_INFO_CACHE[path]
+
+
+def invalidate_qemu_img_info(path=None):
+    """Forget the cached qemu-img info of path, or of all the images."""
+    if path is None:
+        _QEMU_IMG_INFO_CACHE.clear()
+    else:
+        _QEMU_IMG_INFO_CACHE.pop(path, None)
 
 
 def convert_image(source, dest, out_format, run_as_root=False):
     """Convert image to other format."""
     cmd = ('qemu-img', 'convert', '-O', out_format, source, dest)
     utils.execute(*cmd, run_as_root=run_as_root)
+    invalidate_qemu_img_info(dest)
+
+
+def _check_image_header(image_href, header, max_size):
+    """Reject a qcow2 image from its header, before it is fully downloaded.
+
+    This does the backing file and virtual size checks of fetch_to_raw()
+    as early as possible.  Other formats are only checked once downloaded.
+    """
+    if (len(header) < _QCOW2_HEADER.size or
+            not header.startswith(_QCOW2_MAGIC)):
+        return
+    (_magic, _version, backing_file_offset, _backing_file_size,
+     _cluster_bits, virtual_size) = _QCOW2_HEADER.unpack_from(header)
+    if backing_file_offset:
+        raise exception.ImageUnacceptable(image_id=image_href,
+            reason=_("fmt=qcow2 backed by a backing file"))
+    if max_size and max_size < virtual_size:
+        LOG.error(_('%(image)s virtual size %(disk_size)s larger than '
+                    'flavor root disk size %(size)s'),
+                  {'image': image_href, 'disk_size': virtual_size,
+                   'size': max_size})
+        raise exception.FlavorDiskTooSmall()
+
+
+def _fetch_stream(context, image_service, image_href, image_id, path,
+                  max_size=0):
+    """Download an image to path, checking it while it is received.
+
+    The glance checksum of the image is verified, and the SHA1 checksum
+    used by the image cache managers is computed on the way, so that the
+    downloaded file does not need to be read again.
+
+    :returns: The SHA1 hex digest of the downloaded file
+    """
+    image_meta = image_service.show(context, image_id)
+    expected_checksum = image_meta.get('checksum')
+    expected_size = image_meta.get('size')
+
+    md5 = hashlib.md5()
+    sha1 = hashlib.sha1()
+    received = 0
+    start = last_report = time.time()
+    with open(path, 'wb') as f:
+        for chunk in image_service.download(context, image_id):
+            if not received:
+                _check_image_header(image_href, chunk, max_size)
+            f.write(chunk)
+            md5.update(chunk)
+            sha1.update(chunk)
+            received += len(chunk)
+
+            now = time.time()
+            if now - last_report >= _PROGRESS_INTERVAL:
+                last_report = now
+                LOG.debug(_('Downloaded %(received)d of %(size)s bytes of '
+                            'image %(image)s (%(rate).2f MB/s)'),
+                          {'received': received,
+                           'size': expected_size or '?',
+                           'image': image_href,
+                           'rate': received / (now - start) / units.Mi})
+
+    elapsed = max(time.time() - start, 0.001)
+    LOG.info(_('Downloaded image %(image)s (%(size)d bytes) in '
+               '%(elapsed).2f seconds (%(rate).2f MB/s)'),
+             {'image': image_href, 'size': received, 'elapsed': elapsed,
+              'rate': received / elapsed / units.Mi})
+
+    if expected_checksum and md5.hexdigest() != expected_checksum:
+        raise exception.ImageUnacceptable(image_id=image_href,
+            reason=(_("checksum %(actual)s does not match the checksum "
+                      "%(expected)s of the image") %
+                    {'actual': md5.hexdigest(),
+                     'expected': expected_checksum}))
+    return sha1.hexdigest()
 
 
 def fetch(context, image_href, path, _user_id, _project_id, max_size=0):
+    """Download an image to path.
+
+    :returns: The SHA1 hex digest of the downloaded file, or None if the
+              image was transferred by a direct URL download module or by
+              ranges.
+    """
     # TODO(vish): Improve context handling and add owner and auth data
     #             when it is added to glance.  Right now there is no
     #             auth checking in glance, so we assume that access was
     #             checked before we got here.
     (image_service, image_id) = glance.get_remote_image_service(context,
                                                                 image_href)
-    with fileutils.remove_path_on_error(path):
+    if CONF.glance_download_workers > 1:
+        # NOTE: The image service keeps the partial file of a failed
+        # ranged download, so that the next attempt can resume it.
         image_service.download(context, image_id, dst_path=path)
+        return None
+    with fileutils.remove_path_on_error(path):
+        if CONF.allowed_direct_url_schemes:
+            image_service.download(context, image_id, dst_path=path)
+            return None
+        return _fetch_stream(context, image_service, image_href, image_id,
+                             path, max_size=max_size)
 
 
 def fetch_to_raw(context, image_href, path, user_id, project_id, max_size=0):
+    """Download an image to path, converting it to raw if needed.
+
+    :returns: The SHA1 hex digest of the file at path if it could be
+              computed while downloading, None otherwise.
+    """
     path_tmp = "%s.part" % path
-    fetch(context, image_href, path_tmp, user_id, project_id,
-          max_size=max_size)
+    checksum = fetch(context, image_href, path_tmp, user_id, project_id,
+                     max_size=max_size)
 
     with fileutils.remove_path_on_error(path_tmp):
         data = qemu_img_info(path_tmp)
@@ -123,5 +292,9 @@ def fetch_to_raw(context, image_href, path, user_id, project_id, max_size=0):
                         data.file_format)
 
                 os.rename(staged, path)
+            # NOTE: The checksum is the one of the downloaded image, not
+            # of the converted one.
+            return None
         else:
             os.rename(path_tmp, path)
+            return checksum
@@ -95,6 +95,7 @@ from nova.virt.disk import api as disk
 from nova.virt import driver
 from nova.virt import event as virtevent
 from nova.virt import firewall
+from nova.virt import images
 from nova.virt.libvirt import blockinfo
 from nova.virt.libvirt import config as vconfig
 from nova.virt.libvirt import firewall as libvirt_firewall
@@ -253,6 +254,12 @@ libvirt_opts = [
                 help='A path to a device that will be used as source of '
                      'entropy on the host. Permitted options are: '
                      '/dev/random or /dev/hwrng'),
+    cfg.IntOpt('domain_stats_ttl',
+               default=5,
+               help='Number of seconds the statistics collected for all the '
+                    'running domains are reused for by the vcpu and memory '
+                    'accounting and the volume usage poller. Set to 0 to '
+                    'collect them on every use'),
     ]
 
 CONF = cfg.CONF
@@ -267,6 +274,7 @@ CONF.import_opt('server_proxyclient_address', 'nova.spice', group='spice')
 CONF.import_opt('vcpu_pin_set', 'nova.virt.cpu')
 CONF.import_opt('vif_plugging_is_fatal', 'nova.virt.driver')
 CONF.import_opt('vif_plugging_timeout', 'nova.virt.driver')
+CONF.import_opt('image_cache_subdirectory_name', 'nova.virt.imagecache')
 
 DEFAULT_FIREWALL_DRIVER = "%s.%s" % (
     libvirt_firewall.__name__,
@@ -367,6 +375,9 @@ class LibvirtDriver(driver.ComputeDriver):
         self._wrapped_conn_lock = threading.Lock()
         self._caps = None
         self._vcpu_total = 0
+        self._domain_stats = None
+        self._domain_stats_by_name = {}
+        self._domain_stats_time = 0
         self.read_only = read_only
         self.firewall_driver = firewall.load_driver(
             DEFAULT_FIREWALL_DRIVER,
@@ -837,6 +848,38 @@ class LibvirtDriver(driver.ComputeDriver):
 
         return list(uuids)
 
+    def get_power_states(self):
+        """Efficient override of base get_power_states method."""
+        try:
+            domains = self._conn.listAllDomains(0)
+        except AttributeError:
+            # NOTE: listAllDomains() needs libvirt >= 0.9.13, older versions
+            # have to look the domains up one by one.
+            domains = []
+            for domain_id in self.list_instance_ids():
+                try:
+                    domains.append(self._lookup_by_id(domain_id))
+                except exception.InstanceNotFound:
+                    continue
+            for domain_name in self._conn.listDefinedDomains():
+                try:
+                    domains.append(self._lookup_by_name(domain_name))
+                except exception.InstanceNotFound:
+                    continue
+
+        power_states = {}
+        for domain in domains:
+            try:
+                # We skip domains with ID 0 (hypervisors).
+                if domain.ID() == 0:
+                    continue
+                state = domain.info()[0]
+                power_states[domain.UUIDString()] = LIBVIRT_POWER_STATE[state]
+            except libvirt.libvirtError:
+                # Ignore domains deleted while listing
+                continue
+        return power_states
+
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
         for vif in network_info:
@@ -3747,34 +3790,135 @@ class LibvirtDriver(driver.ComputeDriver):
 
         return info
 
-    def get_vcpu_used(self):
-        """Get vcpu usage number of physical computer.
+    def _has_bulk_domain_stats(self):
+        return (hasattr(libvirt, 'VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE')
+                and hasattr(self._conn, 'getAllDomainStats'))
 
-        :returns: The total number of vcpu that currently used.
+    def _get_domain_stats(self):
+        """Get the statistics of all the running domains.
+
+        The statistics are collected in a single pass over the domains,
+        with one libvirt call when libvirt supports getAllDomainStats(),
+        and are reused for CONF.libvirt.domain_stats_ttl seconds.
 
+        :returns: A dict mapping domain ids to dicts with the name, the
+                  number of vcpus, the memory in KiB and, when collected
+                  in bulk, the block and interface statistics of the domain
+                  keyed by device name. Values which could not be
+                  collected are None.
         """
+        now = time.time()
+        if (self._domain_stats is not None and
+                now - self._domain_stats_time < CONF.libvirt.domain_stats_ttl):
+            return self._domain_stats
 
-        total = 0
-        if CONF.libvirt.virt_type == 'lxc':
-            return total + 1
+        stats = None
+        if self._has_bulk_domain_stats():
+            try:
+                stats = self._get_domain_stats_bulk()
+            except libvirt.libvirtError as e:
+                LOG.debug(_("Could not get the statistics of all the "
+                            "domains at once: %s"), e)
+        if stats is None:
+            stats = self._get_domain_stats_per_domain()
+        self._domain_stats = stats
+        self._domain_stats_by_name = dict(
+            (dom_stats['name'], dom_stats) for dom_stats in stats.itervalues()
+            if dom_stats['name'] is not None)
+        self._domain_stats_time = now
+        return stats
+
+    def _get_domain_stats_bulk(self):
+        records = self._conn.getAllDomainStats(
+            libvirt.VIR_DOMAIN_STATS_VCPU |
+            libvirt.VIR_DOMAIN_STATS_BALLOON |
+            libvirt.VIR_DOMAIN_STATS_BLOCK |
+            libvirt.VIR_DOMAIN_STATS_INTERFACE,
+            libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE)
+        stats = {}
+        for dom, values in records:
+            # NOTE: Keep the order of the tuples returned by
+            # virDomainBlockStats() and virDomainInterfaceStats().  The bulk
+            # statistics have no error count, which is reported as -1 like
+            # virDomainBlockStats() does when the hypervisor does not know it.
+            block = {}
+            for i in xrange(values.get('block.count', 0)):
+                prefix = 'block.%d.' % i
+                block[values[prefix + 'name']] = tuple(
+                    values.get(prefix + key, -1)
+                    for key in ('rd.reqs', 'rd.bytes', 'wr.reqs',
+                                'wr.bytes')) + (-1,)
+            interface = {}
+            for i in xrange(values.get('net.count', 0)):
+                prefix = 'net.%d.' % i
+                interface[values[prefix + 'name']] = tuple(
+                    values.get(prefix + key, -1)
+                    for key in ('rx.bytes', 'rx.pkts', 'rx.errs', 'rx.drop',
+                                'tx.bytes', 'tx.pkts', 'tx.errs', 'tx.drop'))
+            stats[dom.ID()] = {'name': dom.name(),
+                               'vcpus': values.get('vcpu.current'),
+                               'memory': values.get('balloon.current'),
+                               'block': block,
+                               'interface': interface}
+        return stats
 
-        dom_ids = self.list_instance_ids()
-        for dom_id in dom_ids:
+    def _get_domain_stats_per_domain(self):
+        stats = {}
+        for dom_id in self.list_instance_ids():
             try:
                 dom = self._lookup_by_id(dom_id)
+            except exception.InstanceNotFound:
+                LOG.info(_("libvirt can't find a domain with id: %s") % dom_id)
+                continue
+            dom_stats = {'name': None, 'vcpus': None, 'memory': None,
+                         'block': None, 'interface': None}
+            try:
+                dom_stats['vcpus'] = len(dom.vcpus()[1])
+            except libvirt.libvirtError as e:
+                LOG.warn(_("couldn't obtain the vpu count from domain id:"
+                           " %(id)s, exception: %(ex)s") %
+                           {"id": dom_id, "ex": e})
+            # NOTE: The memory of the domains is only needed to account
+            # for the memory used on Xen hosts.
+            if CONF.libvirt.virt_type == 'xen':
                 try:
-                    vcpus = dom.vcpus()
+                    dom_stats['memory'] = int(dom.info()[2])
                 except libvirt.libvirtError as e:
-                    LOG.warn(_("couldn't obtain the vpu count from domain id:"
+                    LOG.warn(_("couldn't obtain the memory from domain id:"
                                " %(id)s, exception: %(ex)s") %
                                {"id": dom_id, "ex": e})
-                else:
-                    total += len(vcpus[1])
-            except exception.InstanceNotFound:
-                LOG.info(_("libvirt can't find a domain with id: %s") % dom_id)
-                continue
+            stats[dom_id] = dom_stats
             # NOTE(gtt116): give change to do other task.
             greenthread.sleep(0)
+        return stats
+
+    def _get_device_stats(self, instance_name, kind, device):
+        """Get the statistics of a device from the bulk domain statistics.
+
+        :returns: The statistics, or None if they were not collected.
+        """
+        if not self._has_bulk_domain_stats():
+            return None
+        self._get_domain_stats()
+        dom_stats = self._domain_stats_by_name.get(instance_name)
+        if dom_stats is None or not dom_stats[kind]:
+            return None
+        return dom_stats[kind].get(device)
+
+    def get_vcpu_used(self):
+        """Get vcpu usage number of physical computer.
+
+        :returns: The total number of vcpu that currently used.
+
+        """
+
+        total = 0
+        if CONF.libvirt.virt_type == 'lxc':
+            return total + 1
+
+        for dom_stats in self._get_domain_stats().itervalues():
+            if dom_stats['vcpus'] is not None:
+                total += dom_stats['vcpus']
         return total
 
     def get_memory_mb_used(self):
@@ -3793,13 +3937,10 @@ class LibvirtDriver(driver.ComputeDriver):
         idx3 = m.index('Cached:')
         if CONF.libvirt.virt_type == 'xen':
             used = 0
-            for domain_id in self.list_instance_ids():
-                try:
-                    dom_mem = int(self._lookup_by_id(domain_id).info()[2])
-                except exception.InstanceNotFound:
-                    LOG.info(_("libvirt can't find a domain with id: %s")
-                             % domain_id)
+            for domain_id, dom_stats in self._get_domain_stats().iteritems():
+                if dom_stats['memory'] is None:
                     continue
+                dom_mem = dom_stats['memory']
                 # skip dom0
                 if domain_id != 0:
                     used += dom_mem
@@ -4036,6 +4177,9 @@ class LibvirtDriver(driver.ComputeDriver):
 
     def block_stats(self, instance_name, disk):
         """Note that this function takes an instance name."""
+        stats = self._get_device_stats(instance_name, 'block', disk)
+        if stats is not None:
+            return stats
         try:
             domain = self._lookup_by_name(instance_name)
             return domain.blockStats(disk)
@@ -4052,6 +4196,9 @@ class LibvirtDriver(driver.ComputeDriver):
 
     def interface_stats(self, instance_name, interface):
         """Note that this function takes an instance name."""
+        stats = self._get_device_stats(instance_name, 'interface', interface)
+        if stats is not None:
+            return stats
         domain = self._lookup_by_name(instance_name)
         return domain.interfaceStats(interface)
 
@@ -4778,6 +4925,39 @@ class LibvirtDriver(driver.ComputeDriver):
         """Manage the local cache of images."""
         self.image_cache_manager.update(context, all_instances)
 
+    def prefetch_image(self, context, image_id):
+        """Fetch an image into the local cache of images."""
+        filename = imagecache.get_cache_fname({'image_id': image_id},
+                                              'image_id')
+        base_dir = os.path.join(CONF.instances_path,
+                                CONF.image_cache_subdirectory_name)
+        if not os.path.exists(base_dir):
+            fileutils.ensure_tree(base_dir)
+        base = os.path.join(base_dir, filename)
+
+        # NOTE: this is the lock Image.cache() holds while fetching the
+        # same base image, so an instance spawning meanwhile waits for
+        # the prefetch rather than downloading the image a second time.
+        @utils.synchronized(filename, external=True,
+                            lock_path=self.image_cache_manager.lock_path)
+        def _fetch_image():
+            if os.path.exists(base):
+                return
+            LOG.info(_('Prefetching image %s'), image_id)
+            checksum = libvirt_utils.fetch_image(context, base, image_id,
+                                                 context.user_id,
+                                                 context.project_id)
+            if checksum and CONF.libvirt.checksum_base_images:
+                imagecache.write_stored_info(base, field='sha1',
+                                             value=checksum)
+
+        _fetch_image()
+        self.image_cache_manager.cached_images.add(image_id)
+
+    def get_cached_images(self):
+        """Return the IDs of the images in the local cache of images."""
+        return sorted(self.image_cache_manager.cached_images)
+
     def _cleanup_remote_migration(self, dest, inst_base, inst_base_resize,
                                   shared_storage=False):
         """Used only for cleanup in case migrate_disk_and_power_off fails."""
@@ -4913,6 +5093,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 utils.execute('qemu-img', 'convert', '-f', 'qcow2',
                               '-O', 'raw', info['path'], path_raw)
                 utils.execute('mv', path_raw, info['path'])
+                images.invalidate_qemu_img_info(info['path'])
                 fmt = 'raw'
 
             if size:
@@ -4926,6 +5107,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 utils.execute('qemu-img', 'convert', '-f', 'raw',
                               '-O', 'qcow2', info['path'], path_qcow)
                 utils.execute('mv', path_qcow, info['path'])
+                images.invalidate_qemu_img_info(info['path'])
 
         disk_info = blockinfo.get_disk_info(CONF.libvirt.virt_type,
                                             instance,
@@ -32,6 +32,7 @@ from nova import utils
 from nova.virt.disk import api as disk
 from nova.virt import images
 from nova.virt.libvirt import config as vconfig
+from nova.virt.libvirt import imagecache
 from nova.virt.libvirt import utils as libvirt_utils
 
 
@@ -174,7 +175,13 @@ class Image(object):
         """
         @utils.synchronized(filename, external=True, lock_path=self.lock_path)
         def fetch_func_sync(target, *args, **kwargs):
-            fetch_func(target=target, *args, **kwargs)
+            checksum = fetch_func(target=target, *args, **kwargs)
+            # NOTE: Store the checksum computed while downloading the
+            # image, so that the image cache manager does not need to read
+            # the whole base file to compute it.
+            if checksum and CONF.libvirt.checksum_base_images:
+                imagecache.write_stored_info(target, field='sha1',
+                                             value=checksum)
 
         base_dir = os.path.join(CONF.instances_path,
                                 CONF.image_cache_subdirectory_name)
@@ -24,6 +24,7 @@ import hashlib
 import json
 import os
 import re
+import tempfile
 import time
 
 from oslo.config import cfg
@@ -66,6 +67,22 @@ imagecache_opts = [
                default=3600,
                help='How frequently to checksum base images',
                deprecated_group='DEFAULT'),
+    cfg.IntOpt('checksum_max_bytes_per_pass',
+               default=0,
+               help='Maximum number of bytes of base images to checksum '
+                    'during one pass of the image cache manager, the other '
+                    'images are checksummed during the next passes. 0 means '
+                    'no limit'),
+    cfg.BoolOpt('image_cache_incremental',
+                default=False,
+                help='Remember the backing file of each instance disk '
+                     'between passes of the image cache manager, so that '
+                     'a pass only inspects the disks which changed'),
+    cfg.StrOpt('image_cache_index_filename',
+               default='$instances_path/$image_cache_subdirectory_name/'
+                       'backing_index.json',
+               help='File where the backing file of each instance disk is '
+                    'remembered when image_cache_incremental is enabled'),
     ]
 
 CONF = cfg.CONF
@@ -240,6 +257,11 @@ class ImageCacheManager(imagecache.ImageCacheManager):
     def __init__(self):
         super(ImageCacheManager, self).__init__()
         self.lock_path = os.path.join(CONF.instances_path, 'locks')
+        # IDs of the images found in the cache by the last pass
+        self.cached_images = set()
+        # Backing file of each instance disk, indexed by instance directory,
+        # see image_cache_incremental. Loaded by each pass.
+        self.backing_index = None
         self._reset_state()
 
     def _reset_state(self):
@@ -254,6 +276,9 @@ class ImageCacheManager(imagecache.ImageCacheManager):
         self.originals = []
         self.removable_base_files = []
         self.unexplained_images = []
+        self.partial_downloads = []
+
+        self.checksummed_bytes = 0
 
     def _store_image(self, base_dir, ent, original=False):
         """Store a base image for later examination."""
@@ -281,22 +306,97 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                   not is_valid_info_file(os.path.join(base_dir, ent))):
                 self._store_image(base_dir, ent, original=False)
 
+            elif ent[digest_size:] in ('.part', '.part.ranges'):
+                # Left behind by a failed download, see images.fetch()
+                self.partial_downloads.append(os.path.join(base_dir, ent))
+
         return {'unexplained_images': self.unexplained_images,
                 'originals': self.originals}
 
+    def _load_backing_index(self):
+        index_file = CONF.libvirt.image_cache_index_filename
+        if not os.path.exists(index_file):
+            return {}
+        with open(index_file, 'r') as f:
+            return _read_possible_json(f.read(), index_file)
+
+    def _save_backing_index(self):
+        index_file = CONF.libvirt.image_cache_index_filename
+        index_dir = os.path.dirname(index_file)
+        fileutils.ensure_tree(index_dir)
+        # NOTE: nodes sharing the instance storage write this file too,
+        # replace it atomically so that none of them reads a partial file.
+        fd, tmp_file = tempfile.mkstemp(dir=index_dir)
+        with os.fdopen(fd, 'w') as f:
+            f.write(jsonutils.dumps(self.backing_index))
+        os.rename(tmp_file, index_file)
+
+    def _merge_backing_index(self, updated, seen):
+        """Save the entries updated by this pass into the index file.
+
+        Nodes sharing the instance storage update the index file as well,
+        so it is read again right before being written and only the
+        entries of the instance directories seen by this pass are replaced.
+        """
+        index = self._load_backing_index()
+        old_index = dict(index)
+        index.update(updated)
+        for ent in set(index) - seen:
+            # Forget the instances which have gone away
+            if not os.path.exists(os.path.join(CONF.instances_path, ent,
+                                               'disk')):
+                del index[ent]
+        self.backing_index = index
+        if index != old_index:
+            self._save_backing_index()
+
+    def _get_disk_backing_file(self, ent, disk_path, updated):
+        """Return the backing file of the disk of an instance directory.
+
+        With image_cache_incremental, the backing file is remembered as long
+        as neither the disk file nor the instance directory change, so that
+        qemu-img only inspects the disks created since the previous pass.
+        The modification time of the directory changes whenever a disk is
+        created or deleted in it, which the inode number of a recreated
+        disk file may not.
+
+        :param updated: dict the new index entries are added to
+        """
+        if not CONF.libvirt.image_cache_incremental:
+            return virtutils.get_disk_backing_file(disk_path)
+
+        disk_ino = os.stat(disk_path).st_ino
+        dir_mtime = os.stat(os.path.dirname(disk_path)).st_mtime
+        entry = self.backing_index.get(ent)
+        if (entry and entry.get('disk_ino') == disk_ino and
+                entry.get('dir_mtime') == dir_mtime):
+            return entry.get('backing_file')
+
+        backing_file = virtutils.get_disk_backing_file(disk_path)
+        updated[ent] = {'disk_ino': disk_ino,
+                        'dir_mtime': dir_mtime,
+                        'backing_file': backing_file}
+        return backing_file
+
     def _list_backing_images(self):
         """List the backing images currently in use."""
         inuse_images = []
+        incremental = CONF.libvirt.image_cache_incremental
+        if incremental:
+            self.backing_index = self._load_backing_index()
+        updated = {}
+        seen = set()
         for ent in os.listdir(CONF.instances_path):
             if ent in self.instance_names:
                 LOG.debug(_('%s is a valid instance name'), ent)
                 disk_path = os.path.join(CONF.instances_path, ent, 'disk')
                 if os.path.exists(disk_path):
                     LOG.debug(_('%s has a disk file'), ent)
+                    seen.add(ent)
                     try:
-                        backing_file = virtutils.get_disk_backing_file(
-                            disk_path)
-                    except processutils.ProcessExecutionError:
+                        backing_file = self._get_disk_backing_file(
+                            ent, disk_path, updated)
+                    except (OSError, processutils.ProcessExecutionError):
                         # (for bug 1261442)
                         if not os.path.exists(disk_path):
                             LOG.debug(_('Failed to get disk backing file: %s'),
@@ -325,6 +425,9 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                                         {'instance': ent,
                                          'backing': backing_file})
                             self.unexplained_images.remove(backing_path)
+
+        if incremental:
+            self._merge_backing_index(updated, seen)
         return inuse_images
 
     def _find_base_file(self, base_dir, fingerprint):
@@ -354,6 +457,25 @@ class ImageCacheManager(imagecache.ImageCacheManager):
             if m:
                 yield img, False, True
 
+    def _checksum_allowed(self, img_id, base_file):
+        """Charge the checksum of base_file to the budget of this pass.
+
+        Returns False if checksum_max_bytes_per_pass is exhausted, in which
+        case the checksum is left to a later pass. The first checksum of a
+        pass is always allowed so that large images are checksummed too.
+        """
+        max_bytes = CONF.libvirt.checksum_max_bytes_per_pass
+        size = os.path.getsize(base_file)
+        if (max_bytes > 0 and self.checksummed_bytes > 0 and
+                self.checksummed_bytes + size > max_bytes):
+            LOG.debug(_('image %(id)s at (%(base_file)s): checksum '
+                        'postponed to a later pass'),
+                      {'id': img_id,
+                       'base_file': base_file})
+            return False
+        self.checksummed_bytes += size
+        return True
+
     def _verify_checksum(self, img_id, base_file, create_if_missing=True):
         """Compare the checksum stored on disk with the current file.
 
@@ -388,6 +510,9 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                     write_stored_info(base_file, field='sha1',
                                       value=stored_checksum)
 
+                if not self._checksum_allowed(img_id, base_file):
+                    return None
+
                 current_checksum = _hash_file(base_file)
 
                 if current_checksum != stored_checksum:
@@ -409,7 +534,8 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                 # NOTE(mikal): If the checksum file is missing, then we should
                 # create one. We don't create checksums when we download images
                 # from glance because that would delay VM startup.
-                if CONF.libvirt.checksum_base_images and create_if_missing:
+                if (CONF.libvirt.checksum_base_images and create_if_missing
+                        and self._checksum_allowed(img_id, base_file)):
                     LOG.info(_('%(id)s (%(base_file)s): generating checksum'),
                              {'id': img_id,
                               'base_file': base_file})
@@ -452,6 +578,26 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                           {'base_file': base_file,
                            'error': e})
 
+    def _remove_partial_download(self, path):
+        """Remove the file of a failed download if it is old enough.
+
+        The files of a failed download are kept so that the next download
+        of the image resumes it, until they are as old as an unused
+        original base file would be.
+        """
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except OSError:
+            return
+        if age < CONF.remove_unused_original_minimum_age_seconds:
+            return
+        LOG.info(_('Removing partial download: %s'), path)
+        try:
+            os.remove(path)
+        except OSError as e:
+            LOG.error(_('Failed to remove %(path)s, error was %(error)s'),
+                      {'path': path, 'error': e})
+
     def _handle_base_image(self, img_id, base_file):
         """Handle the checks for a single base image."""
 
@@ -501,6 +647,18 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                                  'base_file': base_file,
                                  'instance_list': ' '.join(instances)})
 
+            elif img_id in CONF.image_prefetch_ids:
+                # NOTE: prefetched images are kept in the cache even when
+                # no instance uses them, otherwise the next pass would
+                # remove what the prefetch task just downloaded.
+                image_in_use = True
+                LOG.info(_('image %(id)s at (%(base_file)s): in use: '
+                           'prefetched'),
+                         {'id': img_id,
+                          'base_file': base_file})
+                if base_file:
+                    self.active_base_files.append(base_file)
+
         if image_bad:
             self.corrupt_base_files.append(base_file)
 
@@ -563,6 +721,10 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                 for base_file in self.removable_base_files:
                     self._remove_base_file(base_file)
 
+        if self.remove_unused_base_images:
+            for path in self.partial_downloads:
+                self._remove_partial_download(path)
+
         # That's it
         LOG.debug(_('Verification complete'))
 
@@ -599,5 +761,15 @@ class ImageCacheManager(imagecache.ImageCacheManager):
         self.used_images = running['used_images']
         self.image_popularity = running['image_popularity']
         self.instance_names = running['instance_names']
+        for img_id in CONF.image_prefetch_ids:
+            self.used_images.setdefault(img_id, (0, 0, []))
         # perform the aging and image verification
         self._age_and_verify_cached_images(context, all_instances, base_dir)
+        # remember which images are still in the cache after the aging
+        cached_images = set()
+        for img_id in self.used_images:
+            base_file = os.path.join(base_dir, get_cache_fname(
+                {'image_id': img_id}, 'image_id'))
+            if os.path.exists(base_file):
+                cached_images.add(img_id)
+        self.cached_images = cached_images
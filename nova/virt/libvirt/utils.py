@@ -167,6 +167,7 @@ def create_image(disk_format, path, size):
                  If no suffix is given, it will be interpreted as bytes.
     """
     execute('qemu-img', 'create', '-f', disk_format, path, size)
+    images.invalidate_qemu_img_info(path)
 
 
 def create_cow_image(backing_file, path, size=None):
@@ -203,6 +204,7 @@ def create_cow_image(backing_file, path, size=None):
         cow_opts = ['-o', csv_opts]
     cmd = base_cmd + cow_opts + [path]
     execute(*cmd)
+    images.invalidate_qemu_img_info(path)
 
 
 def create_lvm_image(vg, lv, size, sparse=False):
@@ -558,6 +560,7 @@ def extract_snapshot(disk_path, source_fmt, out_path, dest_fmt):
 
     qemu_img_cmd += (disk_path, out_path)
     execute(*qemu_img_cmd)
+    images.invalidate_qemu_img_info(out_path)
 
 
 def load_file(path):
@@ -648,9 +651,13 @@ def get_fs_info(path):
 
 
 def fetch_image(context, target, image_id, user_id, project_id, max_size=0):
-    """Grab image."""
-    images.fetch_to_raw(context, image_id, target, user_id, project_id,
-                        max_size=max_size)
+    """Grab image.
+
+    :returns: The SHA1 hex digest of target if it was computed while
+              downloading the image, None otherwise.
+    """
+    return images.fetch_to_raw(context, image_id, target, user_id,
+                               project_id, max_size=max_size)
 
 
 def get_instance_path(instance, forceold=False, relative=False):
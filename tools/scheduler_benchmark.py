@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark the scheduler against a synthetic fleet of compute hosts.
+
+A fleet of compute nodes, with aggregates, metrics and PCI stats, is
+created in a sqlite database and select_destinations() requests are
+replayed through the FilterScheduler or the CachingScheduler.  The time
+spent in every filter and weigher, the number of requests per second and
+the request latencies are reported.
+
+Everything runs offline in a single process: the compute nodes are based
+on the resources reported by the fake virt driver and RPC uses the fake
+transport.
+
+Requests are read from a file holding one JSON object per line with the
+"request_spec" and "filter_properties" arguments of a select_destinations()
+call, as found in the scheduler debug logs.  Without a file, random
+requests are generated.
+
+Run like:
+
+    ./tools/scheduler_benchmark.py --hosts 10000 --requests 1000
+
+    ./tools/scheduler_benchmark.py --hosts 50000 --scheduler caching \\
+        --filters RamFilter,CoreFilter,AggregateInstanceExtraSpecsFilter \\
+        --weighers nova.scheduler.weights.ram.RAMWeigher \\
+        --set scheduler_columnar_mode=true --replay requests.json
+"""
+
+from __future__ import print_function
+
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+import types
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from oslo.config import cfg
+from oslo.messaging import conffixture as messaging_conffixture
+
+from nova import config
+from nova import context
+from nova.db import migration
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
+from nova import exception
+from nova.openstack.common import importutils
+from nova.openstack.common import jsonutils
+from nova.openstack.common import timeutils
+from nova.scheduler import filters
+from nova.scheduler import weights
+from nova.virt import fake
+
+CONF = cfg.CONF
+CONF.import_opt('scheduler_default_filters', 'nova.scheduler.host_manager')
+CONF.import_opt('scheduler_weight_classes', 'nova.scheduler.host_manager')
+CONF.import_opt('service_down_time', 'nova.service')
+CONF.import_opt('pci_alias', 'nova.pci.pci_request')
+
+SCHEDULERS = {
+    'filter': 'nova.scheduler.filter_scheduler.FilterScheduler',
+    'caching': 'nova.scheduler.caching_scheduler.CachingScheduler',
+}
+
+# Host sizes of the fleet as (memory_mb, vcpus, local_gb)
+HOST_SIZES = [(65536, 16, 1024), (131072, 32, 2048), (262144, 64, 4096)]
+
+FLAVORS = [
+    {'id': 1, 'name': 'm1.tiny', 'memory_mb': 512, 'vcpus': 1,
+     'root_gb': 1, 'ephemeral_gb': 0},
+    {'id': 2, 'name': 'm1.small', 'memory_mb': 2048, 'vcpus': 1,
+     'root_gb': 20, 'ephemeral_gb': 0},
+    {'id': 3, 'name': 'm1.medium', 'memory_mb': 4096, 'vcpus': 2,
+     'root_gb': 40, 'ephemeral_gb': 0},
+    {'id': 4, 'name': 'm1.large', 'memory_mb': 8192, 'vcpus': 4,
+     'root_gb': 80, 'ephemeral_gb': 0},
+    {'id': 5, 'name': 'm1.xlarge', 'memory_mb': 16384, 'vcpus': 8,
+     'root_gb': 160, 'ephemeral_gb': 0},
+]
+
+METRICS = ['cpu.percent', 'cpu.user.percent', 'cpu.frequency']
+
+PCI_POOL = {'vendor_id': '8086', 'product_id': '1520', 'extra_info': {}}
+
+
+class Timings(object):
+    """Durations recorded under a name."""
+
+    def __init__(self):
+        self.durations = {}
+
+    def add(self, name, duration):
+        self.durations.setdefault(name, []).append(duration)
+
+    def timed(self, name, func):
+        """Wrap func to record the time spent in each call."""
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                result = func(*args, **kwargs)
+                if isinstance(result, types.GeneratorType):
+                    # Filters return generators, only consuming them does
+                    # the work.
+                    result = list(result)
+                return result
+            finally:
+                self.add(name, time.time() - start)
+        return wrapper
+
+
+def percentile(durations, percent):
+    """Nearest rank percentile of a sorted list."""
+    if not durations:
+        return 0.0
+    rank = int(round(percent / 100.0 * len(durations) + 0.5)) - 1
+    return durations[max(0, min(rank, len(durations) - 1))]
+
+
+def instrument(timings, classes, method_names):
+    """Time the given methods of the given classes, per class."""
+    # Look all the methods up before patching any of them, so a class
+    # inheriting from another one being patched gets the original method
+    originals = []
+    for cls in classes:
+        for method_name in method_names:
+            method = getattr(cls, method_name, None)
+            if method is not None:
+                originals.append((cls, method_name, method))
+    for cls, method_name, method in originals:
+        setattr(cls, method_name, timings.timed(cls.__name__, method))
+
+
+def build_fleet(args):
+    """Create the services, compute nodes and aggregates of the fleet."""
+    rand = random.Random(args.seed)
+    fake.set_nodes(['benchmark'])
+    template = fake.FakeDriver(None).get_available_resource('benchmark')
+    now = timeutils.utcnow()
+
+    session = sqlalchemy_api.get_session()
+    rows = []
+    for i in xrange(args.hosts):
+        host = 'compute%05d' % i
+        memory_mb, vcpus, local_gb = rand.choice(HOST_SIZES)
+        memory_mb_used = int(memory_mb * rand.uniform(0, 0.9))
+        local_gb_used = int(local_gb * rand.uniform(0, 0.9))
+        num_instances = rand.randint(0, 30)
+        stats = {'num_instances': num_instances,
+                 'io_workload': rand.randint(0, 10),
+                 'num_vm_active': num_instances,
+                 'num_proj_%d' % rand.randint(0, 9): num_instances}
+
+        compute = dict(template)
+        compute.update(id=i + 1, service_id=i + 1,
+                       hypervisor_hostname=host,
+                       hypervisor_version=1000,
+                       memory_mb=memory_mb,
+                       memory_mb_used=memory_mb_used,
+                       free_ram_mb=memory_mb - memory_mb_used,
+                       vcpus=vcpus,
+                       vcpus_used=rand.randint(0, vcpus * 2),
+                       local_gb=local_gb,
+                       local_gb_used=local_gb_used,
+                       free_disk_gb=local_gb - local_gb_used,
+                       disk_available_least=local_gb - local_gb_used,
+                       current_workload=stats['io_workload'],
+                       running_vms=num_instances,
+                       host_ip='10.%d.%d.%d' % (i >> 16, (i >> 8) & 255,
+                                                i & 255),
+                       stats=jsonutils.dumps(stats))
+        if args.metrics:
+            compute['metrics'] = jsonutils.dumps([
+                    {'name': name, 'value': rand.uniform(0, 100),
+                     'timestamp': timeutils.strtime(now),
+                     'source': 'benchmark'} for name in METRICS])
+        if rand.random() < args.pci_fraction:
+            pool = dict(PCI_POOL, count=rand.randint(1, 8))
+            compute['pci_stats'] = jsonutils.dumps([pool])
+
+        rows.append(models.Service(id=i + 1, host=host,
+                                   binary='nova-compute', topic='compute',
+                                   report_count=0, disabled=False))
+        rows.append(models.ComputeNode(**compute))
+
+    for i in xrange(args.aggregates):
+        rows.append(models.Aggregate(id=i + 1, name='aggregate%d' % i))
+        metadata = {'availability_zone': 'zone%d' % (i % args.zones),
+                    'ram_allocation_ratio': str(rand.choice([1.0, 1.5])),
+                    'cpu_allocation_ratio': str(rand.choice([4.0, 16.0])),
+                    'ssd': rand.choice(['true', 'false'])}
+        for key, value in metadata.iteritems():
+            rows.append(models.AggregateMetadata(aggregate_id=i + 1,
+                                                 key=key, value=value))
+    if args.aggregates:
+        for i in xrange(args.hosts):
+            rows.append(models.AggregateHost(host='compute%05d' % i,
+                    aggregate_id=i % args.aggregates + 1))
+
+    with session.begin():
+        session.add_all(rows)
+
+
+def generate_requests(args):
+    """Generate random select_destinations() arguments."""
+    rand = random.Random(args.seed)
+    requests = []
+    for i in xrange(args.requests):
+        flavor = dict(rand.choice(FLAVORS))
+        flavor['extra_specs'] = {}
+        if rand.random() < 0.2:
+            flavor['extra_specs']['aggregate_instance_extra_specs:ssd'] = (
+                    'true')
+        if args.pci_fraction and rand.random() < 0.1:
+            flavor['extra_specs']['pci_passthrough:alias'] = 'benchmark:1'
+        instance_properties = {'project_id': str(rand.randint(0, 9)),
+                               'user_id': 'benchmark',
+                               'memory_mb': flavor['memory_mb'],
+                               'vcpus': flavor['vcpus'],
+                               'root_gb': flavor['root_gb'],
+                               'ephemeral_gb': flavor['ephemeral_gb'],
+                               'os_type': 'linux',
+                               'availability_zone': None}
+        if args.zones > 1 and rand.random() < 0.5:
+            instance_properties['availability_zone'] = (
+                    'zone%d' % rand.randint(0, args.zones - 1))
+        request_spec = {'instance_properties': instance_properties,
+                        'instance_type': flavor,
+                        'image': {'properties': {}},
+                        'num_instances': args.num_instances}
+        requests.append({'request_spec': request_spec,
+                         'filter_properties': {'scheduler_hints': {}}})
+    return requests
+
+
+def load_requests(path, count):
+    """Load recorded select_destinations() arguments from path."""
+    requests = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                requests.append(jsonutils.loads(line))
+    if not requests:
+        sys.exit("No requests found in %s" % path)
+    # Replay the recorded requests in a loop up to the requested count
+    return [requests[i % len(requests)] for i in xrange(count or
+                                                        len(requests))]
+
+
+def run(scheduler, ctxt, requests):
+    latencies = []
+    failures = 0
+    start = time.time()
+    for request in requests:
+        request = copy.deepcopy(request)
+        request_start = time.time()
+        try:
+            scheduler.select_destinations(ctxt, request['request_spec'],
+                                          request['filter_properties'])
+        except exception.NoValidHost:
+            failures += 1
+        latencies.append(time.time() - request_start)
+    return time.time() - start, sorted(latencies), failures
+
+
+def report(args, elapsed, latencies, failures, timings):
+    print("Scheduler:        %s" % args.scheduler)
+    print("Hosts:            %d" % args.hosts)
+    print("Requests:         %d (%d without a valid host)" %
+          (len(latencies), failures))
+    print("Elapsed:          %.3fs" % elapsed)
+    if elapsed:
+        print("Requests/sec:     %.2f" % (len(latencies) / elapsed))
+    for percent in (50, 99):
+        print("p%d latency:      %.2fms" %
+              (percent, percentile(latencies, percent) * 1000))
+    if latencies:
+        print("max latency:      %.2fms" % (latencies[-1] * 1000))
+
+    print()
+    print("%-40s %8s %12s %10s" % ('Filter / weigher', 'calls',
+                                   'total (ms)', 'mean (ms)'))
+    for name, durations in sorted(timings.durations.iteritems(),
+                                  key=lambda item: -sum(item[1])):
+        total = sum(durations) * 1000
+        print("%-40s %8d %12.2f %10.3f" % (name, len(durations), total,
+                                           total / len(durations)))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+            description='Benchmark the nova scheduler offline.')
+    parser.add_argument('--scheduler', choices=sorted(SCHEDULERS),
+                        default='filter')
+    parser.add_argument('--hosts', type=int, default=1000,
+                        help='number of compute hosts in the fleet')
+    parser.add_argument('--aggregates', type=int, default=20,
+                        help='number of host aggregates, every host is in '
+                             'one of them')
+    parser.add_argument('--zones', type=int, default=1,
+                        help='number of availability zones the aggregates '
+                             'are spread across')
+    parser.add_argument('--no-metrics', dest='metrics', action='store_false',
+                        help='do not report metrics for the hosts')
+    parser.add_argument('--pci-fraction', type=float, default=0.1,
+                        help='fraction of the hosts with PCI devices')
+    parser.add_argument('--requests', type=int, default=100,
+                        help='number of requests to send, the replayed '
+                             'requests are repeated to reach it')
+    parser.add_argument('--num-instances', type=int, default=1,
+                        help='number of instances of generated requests')
+    parser.add_argument('--replay', metavar='FILE',
+                        help='file of recorded requests to replay')
+    parser.add_argument('--filters',
+                        help='comma separated scheduler_default_filters')
+    parser.add_argument('--weighers',
+                        help='comma separated scheduler_weight_classes')
+    parser.add_argument('--set', metavar='OPTION=VALUE', action='append',
+                        default=[], help='override a configuration option')
+    parser.add_argument('--database', default='sqlite://',
+                        help='database connection, in memory sqlite by '
+                             'default')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv[1:])
+
+
+def setup_config(args):
+    messaging_conf = messaging_conffixture.ConfFixture(CONF)
+    messaging_conf.setUp()
+    messaging_conf.transport_driver = 'fake'
+    config.parse_args([sys.argv[0]], default_config_files=[])
+
+    CONF.set_override('connection', args.database, group='database')
+    # The services never report in while benchmarking
+    CONF.set_override('service_down_time', 3600 * 24)
+    CONF.set_override('pci_alias', [jsonutils.dumps(
+            {'name': 'benchmark', 'vendor_id': PCI_POOL['vendor_id'],
+             'product_id': PCI_POOL['product_id']})])
+    if args.filters:
+        CONF.set_override('scheduler_default_filters',
+                          args.filters.split(','))
+    if args.weighers:
+        CONF.set_override('scheduler_weight_classes',
+                          args.weighers.split(','))
+
+
+def apply_overrides(overrides):
+    """Apply OPTION=VALUE overrides, values are parsed as JSON if they can
+    be, so booleans, numbers and lists get the right type.
+    """
+    for override in overrides:
+        name, _sep, value = override.partition('=')
+        try:
+            value = jsonutils.loads(value)
+        except ValueError:
+            pass
+        CONF.set_override(name, value)
+
+
+def main(argv):
+    args = parse_args(argv)
+    setup_config(args)
+
+    migration.db_sync()
+    ctxt = context.get_admin_context()
+    print("Building a fleet of %d hosts..." % args.hosts)
+    build_fleet(args)
+
+    if args.replay:
+        requests = load_requests(args.replay, args.requests)
+    else:
+        requests = generate_requests(args)
+
+    timings = Timings()
+    instrument(timings, filters.all_filters(),
+               ['filter_all', 'host_passes_columns'])
+    instrument(timings, weights.all_weighers(),
+               ['weigh_objects', 'weigh_columns'])
+
+    # Loading the filters and weighers registered all their options
+    apply_overrides(args.set)
+
+    scheduler = importutils.import_object(SCHEDULERS[args.scheduler])
+    scheduler.run_periodic_tasks(ctxt)
+    elapsed, latencies, failures = run(scheduler, ctxt, requests)
+    report(args, elapsed, latencies, failures, timings)
+
+
+if __name__ == '__main__':
+    main(sys.argv)